@@ -100,6 +100,9 @@ class Category:
         со стороны СУБД, результат, возможно, будет корректным, если исходные
         данные корректны за исключением сортировки. Если нет, то нет.
         "Мусор на входе, мусор на выходе".
+        Категории добавляются по одной в порядке списка, поэтому порядок
+        pk совпадает с порядком дерева, а все добавления выполняются
+        одной транзакцией репозитория.
 
         Parameters
         ----------
@@ -111,8 +114,9 @@ class Category:
         Список созданных объектов Category
         """
         created: dict[str, Category] = {}
-        for child, parent in tree:
-            cat = cls(child, created[parent].pk if parent is not None else None)
-            repo.add(cat)
-            created[child] = cat
+        with repo.transaction():
+            for child, parent in tree:
+                cat = cls(child, created[parent].pk if parent is not None else None)
+                repo.add(cat)
+                created[child] = cat
         return list(created.values())
@@ -6,7 +6,11 @@ import sys
 from PySide6 import QtWidgets
 
 from bookkeeper.view.interface import MainWindow
+from bookkeeper.repository.connection import ConnectionPool, SQLiteProfile, \
+    DESKTOP_PROFILE
 from bookkeeper.repository.sqlite_repository import SQLiteRepository
+from bookkeeper.repository.migrations import upgrade
+from bookkeeper.repository.hybrid_repository import HybridRepository
 from bookkeeper.models.expense import Expense
 from bookkeeper.models.category import Category
 from bookkeeper.models.budget import Budget
@@ -14,23 +18,57 @@ from bookkeeper.models.budget import Budget
 
 class Presenter:
     """
-    Создаются репозитории для расходов, категорий и бюджетов;
+    Схема базы данных обновляется до текущей версии (перед обновлением
+    копия базы данных сохраняется в файл с расширением .bak, если backup);
+    создаются репозитории для расходов, категорий и бюджетов,
+    работающие через общий пул соединений с настройками profile;
+    чтения для отображения идут через отдельный пул только для чтения
+    и не ждут пишущих транзакций;
+    при необходимости создаются таблицы и индексы по полям,
+    используемым в запросах интерфейса; категории, которые читаются
+    на каждую строку таблиц, и бюджеты, которые перечитываются
+    по таймеру, загружаются в память при запуске и читаются оттуда;
     Создается окно приложения.
     """
-    def __init__(self, database: str) -> None:
+    def __init__(self, database: str, pool_size: int = 4,
+                 profile: SQLiteProfile = DESKTOP_PROFILE, backup: bool = True) -> None:
         self.database: str = database
-        self.exp_repo = SQLiteRepository[Expense](self.database, Expense)
-        self.cat_repo = SQLiteRepository[Category](self.database, Category)
-        self.bud_repo = SQLiteRepository[Budget](self.database, Budget)
+        self.pool = ConnectionPool(self.database, size=pool_size, profile=profile)
+        upgrade(self.pool, backup=f'{self.database}.bak' if backup else None)
+        self.read_pool = ConnectionPool(self.database, size=pool_size,
+                                        profile=profile, read_only=True)
+        self.exp_repo = SQLiteRepository[Expense](
+            self.database, Expense, self.pool,
+            indexes=['category', 'expense_date'], reader=self.read_pool)
+        self.cat_repo = HybridRepository[Category](SQLiteRepository[Category](
+            self.database, Category, self.pool,
+            indexes=['name', 'parent'], reader=self.read_pool),
+            indexes=['name', 'parent'])
+        self.bud_repo = HybridRepository[Budget](SQLiteRepository[Budget](
+            self.database, Budget, self.pool,
+            indexes=['length'], reader=self.read_pool),
+            indexes=['length'])
         self.view: QtWidgets.QMainWindow = MainWindow(self.exp_repo,
                                                       self.cat_repo,
                                                       self.bud_repo)
 
+    def close(self) -> None:
+        """
+        Закрыть соединения с базой данных при завершении работы приложения.
+
+        Returns
+        -------
+        None
+        """
+        self.read_pool.close()
+        self.pool.close()
+
 
 if __name__ == '__main__':
     app = QtWidgets.QApplication(sys.argv)
 
     window = Presenter('main_db.db')
     window.view.show()
+    app.aboutToQuit.connect(window.close)
 
     sys.exit(app.exec())
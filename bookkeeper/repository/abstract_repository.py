@@ -8,7 +8,14 @@
 """
 
 from abc import ABC, abstractmethod
-from typing import Generic, TypeVar, Protocol, Any
+from contextlib import nullcontext
+from datetime import date, datetime, timedelta
+from itertools import dropwhile, islice
+from threading import Lock
+from typing import Generic, TypeVar, Protocol, Any, Callable, ContextManager, \
+    Iterable, Iterator, Sequence
+
+from bookkeeper.repository.query import Query, nulls_first
 
 
 class Model(Protocol):  # pylint: disable=too-few-public-methods
@@ -20,6 +27,81 @@ class Model(Protocol):  # pylint: disable=too-few-public-methods
 
 T = TypeVar('T', bound=Model)
 
+Subscriber = Callable[[str, list[int]], None]
+
+
+class ChangeTracker:
+    """
+    Счетчик версий данных и список подписчиков на изменения.
+    Версия монотонно растет при каждом изменении. Подписчики вызываются
+    после каждого изменения с аргументами (событие, список pk), где
+    событие - 'add', 'update', 'delete' или 'rollback' (изменения этих
+    записей в транзакции отменены).
+    """
+
+    def __init__(self) -> None:
+        self.version = 0
+        self._subscribers: list[Subscriber] = []
+        self._lock = Lock()
+
+    def subscribe(self, callback: Subscriber) -> Callable[[], None]:
+        """ Добавить подписчика, вернуть функцию для отмены подписки """
+        with self._lock:
+            self._subscribers.append(callback)
+
+        def unsubscribe() -> None:
+            with self._lock:
+                if callback in self._subscribers:
+                    self._subscribers.remove(callback)
+        return unsubscribe
+
+    def bump(self) -> int:
+        """ Увеличить версию без оповещения подписчиков, вернуть новую версию """
+        with self._lock:
+            self.version += 1
+            return self.version
+
+    def notify(self, event: str, pks: list[int]) -> None:
+        """ Увеличить версию и оповестить подписчиков об изменении """
+        self.bump()
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            callback(event, pks)
+
+
+AGGREGATE_FUNCTIONS = ('sum', 'count')
+PERIODS = ('day', 'week', 'month')
+
+
+def check_aggregate(func: str, period: str | None, date_field: str | None,
+                    date_range: tuple[Any, Any] | None) -> None:
+    """
+    Проверить параметры метода aggregate, при ошибке бросить ValueError.
+    """
+    if func not in AGGREGATE_FUNCTIONS:
+        raise ValueError(f'unknown function {func!r}, '
+                         f'expected one of {AGGREGATE_FUNCTIONS}')
+    if period is not None and period not in PERIODS:
+        raise ValueError(f'unknown period {period!r}, expected one of {PERIODS}')
+    if (period is not None or date_range is not None) and date_field is None:
+        raise ValueError('date_field is required for period and date_range')
+
+
+def period_start(value: date, period: str) -> date:
+    """
+    Начало календарного периода, в который попадает дата:
+    сама дата для 'day', понедельник для 'week', первое число для 'month'.
+    """
+    day = value.date() if isinstance(value, datetime) else value
+    if period == 'day':
+        return day
+    if period == 'week':
+        return day - timedelta(days=day.weekday())
+    if period == 'month':
+        return day.replace(day=1)
+    raise ValueError(f'unknown period {period!r}, expected one of {PERIODS}')
+
 
 class AbstractRepository(ABC, Generic[T]):
     """
@@ -30,8 +112,60 @@ class AbstractRepository(ABC, Generic[T]):
     get_all
     update
     delete
+
+    Пакетные методы add_many, update_many, delete_many по умолчанию
+    выполняют одиночные операции по очереди, iter_all построен на get_all,
+    а get_page, get_between и aggregate - на iter_all;
+    конкретные репозитории могут переопределить их более эффективной
+    реализацией.
+
+    Изменения отслеживаются через changes: реализации вызывают
+    changes.notify после каждой записи, а пользователи подписываются
+    методом subscribe или сравнивают значения data_version.
+
+    Несколько изменений можно объединить в блок with repo.transaction();
+    по умолчанию транзакции не поддерживаются и изменения выполняются сразу.
     """
 
+    @property
+    def changes(self) -> ChangeTracker:
+        """ Счетчик версий и подписчики репозитория, создается при первом обращении """
+        tracker: ChangeTracker | None = self.__dict__.get('_changes')
+        if tracker is None:
+            tracker = self.__dict__.setdefault('_changes', ChangeTracker())
+        return tracker
+
+    def subscribe(self, callback: Subscriber) -> Callable[[], None]:
+        """
+        Подписаться на изменения: callback(событие, список pk) вызывается
+        после add, update и delete (в том числе пакетных).
+        Возвращает функцию для отмены подписки.
+        """
+        return self.changes.subscribe(callback)
+
+    def transaction(self) -> ContextManager[Any]:
+        """
+        Контекстный менеджер, внутри которого изменения фиксируются
+        вместе по выходу из блока или откатываются при исключении.
+        Реализация по умолчанию ничего не делает.
+        """
+        return nullcontext()
+
+    def snapshot(self) -> ContextManager[Any]:
+        """
+        Контекстный менеджер, внутри которого все чтения видят одно
+        согласованное состояние данных, даже если параллельно идет запись.
+        Реализация по умолчанию ничего не делает.
+        """
+        return nullcontext()
+
+    def data_version(self) -> int:
+        """
+        Версия данных: монотонно растет при каждом изменении, поэтому
+        по ее неизменности можно не перечитывать данные.
+        """
+        return self.changes.version
+
     @abstractmethod
     def add(self, obj: T) -> int:
         """
@@ -51,6 +185,111 @@ class AbstractRepository(ABC, Generic[T]):
         если условие не задано (по умолчанию), вернуть все записи
         """
 
+    def iter_all(self, where: dict[str, Any] | None = None,
+                 order_by: str | None = None, descending: bool = False,
+                 chunk_size: int = 1000  # pylint: disable=unused-argument
+                 ) -> Iterator[T]:
+        """
+        Перебрать записи по некоторому условию, не собирая их в список.
+        where - условие, как в get_all
+        order_by - поле для сортировки, по умолчанию порядок по pk;
+        при равных значениях поля записи упорядочены по pk, значения None
+        идут первыми при сортировке по возрастанию
+        descending - сортировать по убыванию
+        chunk_size - количество записей, считываемых из хранилища за раз;
+        реализация по умолчанию читает все записи одним вызовом get_all
+        и этот параметр не использует
+        """
+        objs = self.get_all(where)
+        if descending:
+            objs.reverse()
+        if order_by is not None:
+            objs.sort(key=nulls_first(order_by), reverse=descending)
+        return iter(objs)
+
+    def get_page(self, order_by: str = 'pk', after_key: tuple[Any, int] | None = None,
+                 limit: int = 100, descending: bool = False,
+                 where: dict[str, Any] | None = None) -> list[T]:
+        """
+        Получить страницу записей, следующих в заданном порядке за ключом.
+        order_by - поле для сортировки, при равных значениях порядок по pk
+        after_key - пара (значение поля order_by, pk) последней записи
+        предыдущей страницы, None для первой страницы
+        limit - максимальное количество записей на странице
+        descending - сортировать по убыванию
+        where - условие, как в get_all
+        """
+        objs = self.iter_all(where, order_by, descending)
+        if after_key is not None:
+            after_value, after_pk = after_key
+            last = (after_value is not None, after_value, after_pk)
+            value_key = nulls_first(order_by)
+
+            def before_key(obj: T) -> bool:
+                key = (*value_key(obj), obj.pk)
+                return key >= last if descending else key <= last
+            objs = dropwhile(before_key, objs)
+        return list(islice(objs, limit))
+
+    def query(self, query: Query) -> list[Any]:
+        """
+        Выполнить запрос с произвольными условиями (сравнения, 'in',
+        'between', 'is null', поиск по префиксу), сортировкой,
+        ограничением количества записей и выбором полей, см. Query.
+        Возвращает объекты или, если в запросе заданы поля, кортежи
+        их значений. Реализация по умолчанию перебирает все записи.
+        """
+        return query.apply(self.iter_all())
+
+    def get_between(self, field: str, start: Any, end: Any,
+                    where: dict[str, Any] | None = None) -> list[T]:
+        """
+        Получить записи, у которых значение поля field лежит в диапазоне
+        от start до end включительно, упорядоченные по этому полю и pk.
+        Записи со значением None не возвращаются.
+        where - дополнительное условие, как в get_all
+        """
+        return [obj for obj in self.iter_all(where, order_by=field)
+                if getattr(obj, field) is not None
+                and start <= getattr(obj, field) <= end]
+
+    def aggregate(self, func: str, field: str, group_by: Sequence[str] = (),
+                  period: str | None = None, date_field: str | None = None,
+                  date_range: tuple[Any, Any] | None = None,
+                  where: dict[str, Any] | None = None
+                  ) -> dict[tuple[Any, ...], int | float]:
+        """
+        Посчитать сумму ('sum') или количество ('count') непустых значений
+        поля field с группировкой.
+        group_by - поля, по значениям которых группируются записи
+        period - календарный период 'day', 'week' или 'month', по которому
+        группируются записи; начало периода (date) - первый элемент ключа
+        date_field - поле с датой для period и date_range
+        date_range - учитывать только записи с date_field в диапазоне
+        (включительно)
+        where - условие, как в get_all
+        Возвращает словарь {(начало периода, *значения group_by): результат};
+        без группировки - {(): результат}.
+        """
+        check_aggregate(func, period, date_field, date_range)
+        objs: Iterable[T]
+        if date_range is not None and date_field is not None:
+            objs = self.get_between(date_field, *date_range, where=where)
+        else:
+            objs = self.iter_all(where)
+        result: dict[tuple[Any, ...], int | float] = {}
+        for obj in objs:
+            value = getattr(obj, field)
+            if value is None:
+                continue
+            key = tuple(getattr(obj, name) for name in group_by)
+            if period is not None:
+                key = (period_start(getattr(obj, str(date_field)), period),) + key
+            result[key] = result.get(key, 0) + (value if func == 'sum' else 1)
+        if not result and period is None and not group_by:
+            result[()] = 0
+        return result
+
     @abstractmethod
     def update(self, obj: T) -> None:
         """ Обновить данные об объекте. Объект должен содержать поле pk. """
@@ -58,3 +297,20 @@ class AbstractRepository(ABC, Generic[T]):
     @abstractmethod
     def delete(self, pk: int) -> None:
         """ Удалить запись """
+
+    def add_many(self, objs: Iterable[T]) -> list[int]:
+        """
+        Добавить несколько объектов, вернуть список их id в том же порядке,
+        также записать id в атрибут pk каждого объекта.
+        """
+        return [self.add(obj) for obj in objs]
+
+    def update_many(self, objs: Iterable[T]) -> None:
+        """ Обновить данные о нескольких объектах. """
+        for obj in objs:
+            self.update(obj)
+
+    def delete_many(self, pks: Iterable[int]) -> None:
+        """ Удалить несколько записей """
+        for pk in pks:
+            self.delete(pk)
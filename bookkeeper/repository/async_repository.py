@@ -0,0 +1,229 @@
+"""
+Модуль описывает асинхронный репозиторий для использования из asyncio
+
+Все обращения к хранилищу выполняются в отдельном потоке (DatabaseWorker)
+строго в порядке поступления, поэтому цикл событий не блокируется
+файловым вводом-выводом, а запись в БД ведет единственный поток.
+"""
+
+import asyncio
+import queue
+import threading
+from concurrent.futures import Future
+from itertools import islice
+from typing import Any, AsyncIterator, Callable, Generic, Iterable, Iterator, \
+    Sequence, TypeVar
+
+from bookkeeper.repository.abstract_repository import AbstractRepository, T, \
+    Subscriber
+from bookkeeper.repository.query import Query
+
+R = TypeVar('R')
+
+
+class DatabaseWorker:
+    """
+    Поток, выполняющий переданные ему функции по очереди.
+    Несколько асинхронных репозиториев могут использовать один поток,
+    тогда их запросы также выполняются в порядке поступления.
+
+    Parameters
+    ----------
+    name - имя потока
+    """
+
+    def __init__(self, name: str = 'bookkeeper-db') -> None:
+        self._queue: queue.SimpleQueue[tuple[Callable[..., Any], tuple[Any, ...],
+                                             Future[Any]] | None] = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            func, args, future = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = func(*args)
+            except BaseException as exc:  # pylint: disable=broad-exception-caught
+                future.set_exception(exc)
+            else:
+                future.set_result(result)
+
+    def submit(self, func: Callable[..., R], *args: Any) -> 'Future[R]':
+        """
+        Поставить вызов func(*args) в очередь.
+
+        Returns
+        -------
+        Future с результатом вызова.
+        """
+        future: Future[R] = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('database worker is closed')
+            self._queue.put((func, args, future))
+        return future
+
+    def close(self, wait: bool = True) -> None:
+        """
+        Остановить поток после выполнения уже поставленных в очередь вызовов.
+
+        Parameters
+        ----------
+        wait - дождаться завершения потока.
+        """
+        with self._lock:
+            if not self._closed:
+                self._closed = True
+                self._queue.put(None)
+        if wait and threading.current_thread() is not self._thread:
+            self._thread.join()
+
+    @property
+    def closed(self) -> bool:
+        """ Остановлен ли поток """
+        return self._closed
+
+
+def _take(iterator: Iterator[R], size: int) -> list[R]:
+    return list(islice(iterator, size))
+
+
+def _close_iterator(iterator: Iterator[Any]) -> None:
+    close = getattr(iterator, 'close', None)
+    if close is not None:
+        close()
+
+
+class AsyncRepository(Generic[T]):
+    """
+    Асинхронный аналог AbstractRepository: обертка над обычным
+    репозиторием, методы которой можно ожидать (await) из asyncio.
+    Вызовы выполняются в потоке worker, который владеет соединениями
+    с БД; если поток не передан, обертка создает собственный.
+
+    Потоковый перебор iter_all держит соединение пула до окончания
+    перебора, поэтому размер пула SQLiteRepository должен быть больше
+    числа одновременно открытых переборов.
+
+    Parameters
+    ----------
+    repo - репозиторий, к которому обращается обертка
+    worker - поток для выполнения запросов
+    """
+
+    def __init__(self, repo: AbstractRepository[T],
+                 worker: DatabaseWorker | None = None) -> None:
+        self.repo = repo
+        self._owns_worker = worker is None
+        self.worker = DatabaseWorker() if worker is None else worker
+
+    async def _call(self, func: Callable[..., R], *args: Any) -> R:
+        return await asyncio.wrap_future(self.worker.submit(func, *args))
+
+    async def add(self, obj: T) -> int:
+        """ Добавить объект, вернуть его id """
+        return await self._call(self.repo.add, obj)
+
+    async def add_many(self, objs: Iterable[T]) -> list[int]:
+        """ Добавить несколько объектов, вернуть их id """
+        return await self._call(self.repo.add_many, list(objs))
+
+    async def get(self, pk: int) -> T | None:
+        """ Получить объект по id """
+        return await self._call(self.repo.get, pk)
+
+    async def get_all(self, where: dict[str, Any] | None = None) -> list[T]:
+        """ Получить все записи по условию, как AbstractRepository.get_all """
+        return await self._call(self.repo.get_all, where)
+
+    async def iter_all(self, where: dict[str, Any] | None = None,
+                       order_by: str | None = None, descending: bool = False,
+                       chunk_size: int = 1000) -> AsyncIterator[T]:
+        """
+        Перебрать записи, получая их из потока порциями по chunk_size.
+        Параметры как у AbstractRepository.iter_all.
+        """
+        iterator = await self._call(self.repo.iter_all, where, order_by,
+                                    descending, chunk_size)
+        try:
+            while chunk := await self._call(_take, iterator, chunk_size):
+                for obj in chunk:
+                    yield obj
+        finally:
+            if not self.worker.closed:
+                self.worker.submit(_close_iterator, iterator)
+
+    async def get_page(self, order_by: str = 'pk',
+                       after_key: tuple[Any, int] | None = None,
+                       limit: int = 100, descending: bool = False,
+                       where: dict[str, Any] | None = None) -> list[T]:
+        """ Получить страницу записей, как AbstractRepository.get_page """
+        return await self._call(self.repo.get_page, order_by, after_key,
+                                limit, descending, where)
+
+    async def get_between(self, field: str, start: Any, end: Any,
+                          where: dict[str, Any] | None = None) -> list[T]:
+        """ Получить записи из диапазона, как AbstractRepository.get_between """
+        return await self._call(self.repo.get_between, field, start, end, where)
+
+    async def query(self, query: Query) -> list[Any]:
+        """ Выполнить запрос, как AbstractRepository.query """
+        return await self._call(self.repo.query, query)
+
+    async def aggregate(self, func: str, field: str, group_by: Sequence[str] = (),
+                        period: str | None = None, date_field: str | None = None,
+                        date_range: tuple[Any, Any] | None = None,
+                        where: dict[str, Any] | None = None
+                        ) -> dict[tuple[Any, ...], int | float]:
+        """ Посчитать сумму или количество, как AbstractRepository.aggregate """
+        return await self._call(self.repo.aggregate, func, field, group_by,
+                                period, date_field, date_range, where)
+
+    async def update(self, obj: T) -> None:
+        """ Обновить данные об объекте """
+        await self._call(self.repo.update, obj)
+
+    async def update_many(self, objs: Iterable[T]) -> None:
+        """ Обновить данные о нескольких объектах """
+        await self._call(self.repo.update_many, list(objs))
+
+    async def delete(self, pk: int) -> None:
+        """ Удалить запись """
+        await self._call(self.repo.delete, pk)
+
+    async def delete_many(self, pks: Iterable[int]) -> None:
+        """ Удалить несколько записей """
+        await self._call(self.repo.delete_many, list(pks))
+
+    async def data_version(self) -> int:
+        """ Версия данных, как AbstractRepository.data_version """
+        return await self._call(self.repo.data_version)
+
+    def subscribe(self, callback: Subscriber) -> Callable[[], None]:
+        """
+        Подписаться на изменения. Подписчики вызываются в потоке worker,
+        для работы с циклом событий используйте loop.call_soon_threadsafe.
+        """
+        return self.repo.subscribe(callback)
+
+    def close(self) -> None:
+        """
+        Остановить собственный поток после выполнения поставленных запросов.
+        Общий поток, переданный в конструктор, останавливает его владелец.
+        """
+        if self._owns_worker:
+            self.worker.close()
+
+    async def __aenter__(self) -> 'AsyncRepository[T]':
+        return self
+
+    async def __aexit__(self, *args: Any) -> None:
+        if self._owns_worker:
+            await asyncio.get_running_loop().run_in_executor(None, self.worker.close)
@@ -0,0 +1,176 @@
+"""
+Модуль описывает кэширующую обертку над репозиторием
+"""
+
+from collections import OrderedDict
+from typing import Any, ContextManager, Hashable, Iterable, Iterator, Sequence
+
+from bookkeeper.repository.abstract_repository import AbstractRepository, T, \
+    ChangeTracker
+from bookkeeper.repository.query import Query
+
+
+class CachedRepository(AbstractRepository[T]):
+    """
+    Репозиторий-обертка, кэширующий результаты get и get_all другого
+    репозитория. В каждом из двух кэшей (объекты по pk и результаты get_all
+    по условию) хранится не более max_items записей, давно не использованные
+    записи вытесняются.
+
+    Изменения записываются во внутренний репозиторий сразу, при этом
+    измененные объекты вытесняются из кэша, а кэш запросов очищается
+    целиком, так как изменение может затронуть результат любого запроса.
+    Кроме того, обертка подписана на изменения внутреннего репозитория
+    и так же сбрасывает кэш при откате транзакции и при записях в обход
+    обертки (внутри транзакции оповещения приходят только после ее
+    завершения). Остальные методы (iter_all, get_page,
+    get_between, aggregate, query) не кэшируются.
+
+    Кэш возвращает одни и те же объекты, поэтому изменять их, как и в
+    MemoryRepository, нужно через update.
+
+    Parameters
+    ----------
+    inner - репозиторий, к которому обращается обертка
+    max_items - размер каждого из кэшей
+    """
+
+    def __init__(self, inner: AbstractRepository[T], max_items: int = 1024) -> None:
+        if max_items < 1:
+            raise ValueError(f'cache size must be positive, got {max_items}')
+        self.inner = inner
+        self.max_items = max_items
+        self.hits = 0
+        self.misses = 0
+        self._objects: OrderedDict[int, T] = OrderedDict()
+        self._queries: OrderedDict[Hashable, list[T]] = OrderedDict()
+        self.unsubscribe = inner.subscribe(self._invalidate)
+
+    @property
+    def changes(self) -> ChangeTracker:
+        return self.inner.changes
+
+    def data_version(self) -> int:
+        return self.inner.data_version()
+
+    def transaction(self) -> ContextManager[Any]:
+        return self.inner.transaction()
+
+    def snapshot(self) -> ContextManager[Any]:
+        return self.inner.snapshot()
+
+    def _evict(self, pks: Iterable[int]) -> None:
+        """ Вытеснить объекты pks и очистить кэш запросов """
+        self._queries.clear()
+        for pk in pks:
+            self._objects.pop(pk, None)
+
+    def _invalidate(self, _event: str, pks: list[int]) -> None:
+        self._evict(pks)
+
+    @staticmethod
+    def _put(cache: 'OrderedDict[Any, Any]', key: Any, value: Any,
+             max_items: int) -> None:
+        cache[key] = value
+        cache.move_to_end(key)
+        if len(cache) > max_items:
+            cache.popitem(last=False)
+
+    def _remember(self, obj: T) -> None:
+        self._put(self._objects, obj.pk, obj, self.max_items)
+
+    def clear(self) -> None:
+        """ Очистить кэш, например, после изменения данных другим процессом """
+        self._objects.clear()
+        self._queries.clear()
+
+    def add(self, obj: T) -> int:
+        pk = self.inner.add(obj)
+        self._queries.clear()
+        self._remember(obj)
+        return pk
+
+    def add_many(self, objs: Iterable[T]) -> list[int]:
+        objs = list(objs)
+        pks = self.inner.add_many(objs)
+        self._queries.clear()
+        for obj in objs:
+            self._remember(obj)
+        return pks
+
+    def get(self, pk: int) -> T | None:
+        obj = self._objects.get(pk)
+        if obj is not None:
+            self.hits += 1
+            self._objects.move_to_end(pk)
+            return obj
+        self.misses += 1
+        obj = self.inner.get(pk)
+        if obj is not None:
+            self._remember(obj)
+        return obj
+
+    def get_all(self, where: dict[str, Any] | None = None) -> list[T]:
+        try:
+            key: Hashable = None if where is None else frozenset(where.items())
+            hash(key)
+        except TypeError:
+            self.misses += 1
+            return self.inner.get_all(where)
+        objs = self._queries.get(key)
+        if objs is not None:
+            self.hits += 1
+            self._queries.move_to_end(key)
+            return list(objs)
+        self.misses += 1
+        objs = self.inner.get_all(where)
+        self._put(self._queries, key, objs, self.max_items)
+        for obj in objs[-self.max_items:]:
+            self._remember(obj)
+        return list(objs)
+
+    def iter_all(self, where: dict[str, Any] | None = None,
+                 order_by: str | None = None, descending: bool = False,
+                 chunk_size: int = 1000) -> Iterator[T]:
+        return self.inner.iter_all(where, order_by, descending, chunk_size)
+
+    def get_page(self, order_by: str = 'pk', after_key: tuple[Any, int] | None = None,
+                 limit: int = 100, descending: bool = False,
+                 where: dict[str, Any] | None = None) -> list[T]:
+        return self.inner.get_page(order_by, after_key, limit, descending, where)
+
+    def get_between(self, field: str, start: Any, end: Any,
+                    where: dict[str, Any] | None = None) -> list[T]:
+        return self.inner.get_between(field, start, end, where)
+
+    def query(self, query: Query) -> list[Any]:
+        return self.inner.query(query)
+
+    def aggregate(self, func: str, field: str, group_by: Sequence[str] = (),
+                  period: str | None = None, date_field: str | None = None,
+                  date_range: tuple[Any, Any] | None = None,
+                  where: dict[str, Any] | None = None
+                  ) -> dict[tuple[Any, ...], int | float]:
+        return self.inner.aggregate(func, field, group_by, period,
+                                    date_field, date_range, where)
+
+    def update(self, obj: T) -> None:
+        self.inner.update(obj)
+        self._queries.clear()
+        self._remember(obj)
+
+    def update_many(self, objs: Iterable[T]) -> None:
+        objs = list(objs)
+        self.inner.update_many(objs)
+        self._queries.clear()
+        for obj in objs:
+            self._remember(obj)
+
+    def delete(self, pk: int) -> None:
+        self.inner.delete(pk)
+        self._evict([pk])
+
+    def delete_many(self, pks: Iterable[int]) -> None:
+        pks = list(pks)
+        self.inner.delete_many(pks)
+        self._evict(pks)
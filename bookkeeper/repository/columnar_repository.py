@@ -0,0 +1,354 @@
+"""
+Модуль описывает колоночный репозиторий расходов в оперативной памяти
+
+Расходы хранятся не объектами, а столбцами в массивах array с 64-битными
+целыми: суммы и категории как есть, даты - в микросекундах от 1970-01-01,
+комментарии - номерами в списке различных строк. Миллион расходов
+занимает несколько десятков мегабайт вместо сотен, а фильтры, суммы
+выполняются проходами по столбцам встроенными функциями (map, compress,
+sum) без цикла Python на каждую запись и без создания объектов Expense;
+группировка складывает целые числа из столбцов.
+"""
+
+from array import array
+from datetime import date, datetime, timedelta
+from bisect import bisect_left
+from collections import Counter
+from itertools import compress, repeat
+from operator import and_, eq, floordiv, le
+from sys import intern
+from typing import Any, Callable, Iterable, Iterator, Sequence
+
+from bookkeeper.models.expense import Expense
+from bookkeeper.repository.abstract_repository import AbstractRepository, \
+    check_aggregate, period_start
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+_DAY = 86_400_000_000
+_DATE_FIELDS = ('expense_date', 'added_date')
+_FIELDS = ('amount', 'category', 'expense_date', 'added_date', 'comment', 'pk')
+
+
+def to_epoch(value: datetime | date) -> int:
+    """
+    Перевести дату в количество микросекунд от 1970-01-01.
+    Дата без времени соответствует полуночи.
+    """
+    if not isinstance(value, datetime):
+        value = datetime.combine(value, datetime.min.time())
+    return (value - _EPOCH) // _MICROSECOND
+
+
+def from_epoch(value: int) -> datetime:
+    """ Перевести количество микросекунд от 1970-01-01 в дату """
+    return _EPOCH + timedelta(microseconds=value)
+
+
+class ColumnarExpenseRepository(AbstractRepository[Expense]):
+    """
+    Репозиторий расходов, хранящий каждое поле Expense в отдельном массиве.
+    Строки хранятся в порядке pk, строка записи находится двоичным
+    поиском по столбцу pk; удаленные строки
+    помечаются и убираются из массивов, когда их становится больше
+    половины. Объекты Expense создаются только при чтении, поэтому
+    изменять их нужно через update.
+
+    Даты должны быть без часового пояса, суммы и категории - целыми,
+    иначе add и update вызывают TypeError, не изменяя репозиторий.
+    aggregate выполняет группировку по столбцам, а sum и filter дают
+    сумму и pk записей по условию, не создавая объектов; суммировать
+    даты и комментарии нельзя (ValueError).
+    Обновление и удаление отсутствующей записи вызывают KeyError.
+    """
+
+    def __init__(self) -> None:
+        self._columns: dict[str, 'array[int]'] = {
+            name: array('q') for name in _FIELDS}
+        self._alive = bytearray()
+        self._size = 0
+        self._comments: list[str] = []
+        self._comment_ids: dict[str, int] = {}
+        self._next_pk = 1
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _row(self, pk: int) -> int | None:
+        """ Номер строки записи или None, если записи нет """
+        pks = self._columns['pk']
+        row = bisect_left(pks, pk)
+        if row < len(pks) and pks[row] == pk and self._alive[row]:
+            return row
+        return None
+
+    def _column(self, name: str) -> 'array[int]':
+        """ Столбец поля; названия полей, которых нет в Expense, не допускаются """
+        try:
+            return self._columns[name]
+        except KeyError:
+            raise ValueError(f'unknown field {name!r} in table expense') from None
+
+    def _comment_id(self, comment: str) -> int:
+        comment_id = self._comment_ids.get(comment)
+        if comment_id is None:
+            comment_id = len(self._comments)
+            self._comments.append(intern(comment))
+            self._comment_ids[comment] = comment_id
+        return comment_id
+
+    def _encode(self, name: str, value: Any) -> Any:
+        """
+        Значение поля в представлении столбца или None, если такого
+        значения в столбце быть не может (условие не выполняется ни для
+        одной записи).
+        """
+        self._column(name)
+        if value is None:
+            return None
+        if name in _DATE_FIELDS:
+            return to_epoch(value) if isinstance(value, date) else None
+        if name == 'comment':
+            return self._comment_ids.get(value)
+        return value if isinstance(value, (int, float)) else None
+
+    def _decode(self, name: str, value: int) -> Any:
+        if name in _DATE_FIELDS:
+            return from_epoch(value)
+        if name == 'comment':
+            return self._comments[value]
+        return value
+
+    def _sort_key(self, name: str) -> Callable[[int], Any]:
+        """
+        Ключ сортировки строк по полю: комментарии сравниваются как строки,
+        а не по номерам в таблице строк.
+        """
+        column = self._column(name)
+        if name == 'comment':
+            comments = self._comments
+            return lambda row: comments[column[row]]
+        return column.__getitem__
+
+    def _values(self, obj: Expense, pk: int) -> 'array[int]':
+        """
+        Значения строки записи с ключом pk. Все значения проверяются
+        (array не принимает нецелые) до изменения столбцов, поэтому при
+        ошибке TypeError столбцы остаются согласованными.
+        """
+        values = array('q', [obj.amount, obj.category, to_epoch(obj.expense_date),
+                             to_epoch(obj.added_date), 0, pk])
+        values[4] = self._comment_id(obj.comment)
+        return values
+
+    def _check_sum(self, field: str) -> None:
+        """ Суммировать можно только числовые поля, но не даты и комментарии """
+        self._column(field)
+        if field in _DATE_FIELDS or field == 'comment':
+            raise ValueError(f'cannot sum non-numeric field {field!r}')
+
+    def _append(self, values: 'array[int]') -> None:
+        for column, value in zip(self._columns.values(), values):
+            column.append(value)
+        self._alive.append(1)
+        self._size += 1
+
+    def _materialize(self, row: int) -> Expense:
+        amount, category, expense_date, added_date, comment, pk = (
+            column[row] for column in self._columns.values())
+        return Expense(amount, category, from_epoch(expense_date),
+                       from_epoch(added_date), self._comments[comment], pk)
+
+    def _mask(self, where: dict[str, Any] | None = None,
+              field: str | None = None, start: Any = None,
+              end: Any = None) -> bytearray:
+        """
+        Маска строк (1 - строка подходит), удовлетворяющих условию where
+        и, если задано поле field, диапазону от start до end включительно.
+        """
+        mask = self._alive
+        for name, value in (where or {}).items():
+            encoded = self._encode(name, value)
+            if encoded is None:
+                return bytearray(len(mask))
+            mask = bytearray(map(and_, mask, map(eq, self._column(name),
+                                                 repeat(encoded))))
+        if field == 'comment':
+            # номера комментариев не упорядочены, поэтому диапазон
+            # проверяется для каждой строки таблицы комментариев один раз
+            try:
+                inside = bytearray(start <= comment <= end for comment in self._comments)
+            except TypeError:
+                return bytearray(len(mask))
+            mask = bytearray(map(and_, mask, map(inside.__getitem__,
+                                                 self._columns['comment'])))
+        elif field is not None:
+            column = self._column(field)
+            low, high = self._encode(field, start), self._encode(field, end)
+            if low is None or high is None:
+                return bytearray(len(mask))
+            mask = bytearray(map(and_, mask, map(le, repeat(low), column)))
+            mask = bytearray(map(and_, mask, map(le, column, repeat(high))))
+        return mask
+
+    def _range_mask(self, where: dict[str, Any] | None,
+                    date_range: tuple[Any, Any] | None,
+                    date_field: str | None) -> bytearray:
+        if date_range is None or date_field is None:
+            return self._mask(where)
+        return self._mask(where, date_field, *date_range)
+
+    def _compact(self) -> None:
+        """ Убрать из массивов удаленные строки """
+        for name, column in self._columns.items():
+            self._columns[name] = array('q', compress(column, self._alive))
+        self._alive = bytearray(b'\x01' * self._size)
+
+    def filter(self, where: dict[str, Any] | None = None,
+               date_range: tuple[Any, Any] | None = None,
+               date_field: str = 'expense_date') -> 'array[int]':
+        """
+        Выбрать записи по условию, не создавая объектов.
+
+        Parameters
+        ----------
+        where - условие, как в get_all
+        date_range - учитывать только записи с date_field в диапазоне
+        (включительно)
+        date_field - поле с датой для date_range
+
+        Returns
+        -------
+        Массив pk подходящих записей в порядке pk.
+        """
+        mask = self._range_mask(where, date_range, date_field)
+        return array('q', compress(self._columns['pk'], mask))
+
+    def sum(self, field: str = 'amount', where: dict[str, Any] | None = None,
+            date_range: tuple[Any, Any] | None = None,
+            date_field: str = 'expense_date') -> int:
+        """
+        Сумма значений поля field у записей, выбранных как в filter.
+
+        Returns
+        -------
+        Сумма, 0 если записей нет.
+        """
+        self._check_sum(field)
+        mask = self._range_mask(where, date_range, date_field)
+        return sum(compress(self._column(field), mask))
+
+    def add(self, obj: Expense) -> int:
+        if getattr(obj, 'pk', None) != 0:
+            raise ValueError(f'trying to add object {obj} with filled `pk` attribute')
+        self._append(self._values(obj, self._next_pk))
+        obj.pk = self._next_pk
+        self._next_pk += 1
+        self.changes.notify('add', [obj.pk])
+        return obj.pk
+
+    def add_many(self, objs: Iterable[Expense]) -> list[int]:
+        objs = list(objs)
+        for obj in objs:
+            if getattr(obj, 'pk', None) != 0:
+                raise ValueError(f'trying to add object {obj} with filled `pk` attribute')
+        pks = list(range(self._next_pk, self._next_pk + len(objs)))
+        rows = [self._values(obj, pk) for obj, pk in zip(objs, pks)]
+        for obj, pk, values in zip(objs, pks, rows):
+            self._append(values)
+            obj.pk = pk
+        self._next_pk += len(objs)
+        self.changes.notify('add', pks)
+        return pks
+
+    def get(self, pk: int) -> Expense | None:
+        row = self._row(pk)
+        return None if row is None else self._materialize(row)
+
+    def get_all(self, where: dict[str, Any] | None = None) -> list[Expense]:
+        return list(map(self._materialize, compress(range(len(self._alive)),
+                                                    self._mask(where))))
+
+    def iter_all(self, where: dict[str, Any] | None = None,
+                 order_by: str | None = None, descending: bool = False,
+                 chunk_size: int = 1000) -> Iterator[Expense]:
+        rows = list(compress(range(len(self._alive)), self._mask(where)))
+        if descending:
+            rows.reverse()
+        if order_by is not None:
+            rows.sort(key=self._sort_key(order_by), reverse=descending)
+        return map(self._materialize, rows)
+
+    def get_between(self, field: str, start: Any, end: Any,
+                    where: dict[str, Any] | None = None) -> list[Expense]:
+        rows = list(compress(range(len(self._alive)),
+                             self._mask(where, field, start, end)))
+        rows.sort(key=self._sort_key(field))
+        return list(map(self._materialize, rows))
+
+    def aggregate(self, func: str, field: str, group_by: Sequence[str] = (),
+                  period: str | None = None, date_field: str | None = None,
+                  date_range: tuple[Any, Any] | None = None,
+                  where: dict[str, Any] | None = None
+                  ) -> dict[tuple[Any, ...], int | float]:
+        check_aggregate(func, period, date_field, date_range)
+        if func == 'sum':
+            self._check_sum(field)
+        mask = self._range_mask(where, date_range, date_field)
+        values = compress(self._column(field), mask)
+        if period is None and not group_by:
+            return {(): sum(values) if func == 'sum' else sum(mask)}
+        keys: list[Iterable[int]] = [compress(self._column(name), mask)
+                                     for name in group_by]
+        if period is not None:
+            keys.insert(0, map(floordiv, compress(self._column(str(date_field)), mask),
+                               repeat(_DAY)))
+        # группировка идет по целым числам из столбцов (дни, номера
+        # комментариев), ключи переводятся в даты и строки один раз на группу
+        totals: dict[tuple[int, ...], int] = {}
+        if func == 'count':
+            totals = Counter(zip(*keys))
+        else:
+            get = totals.get
+            for key, value in zip(zip(*keys), values):
+                totals[key] = get(key, 0) + value
+        result: dict[tuple[Any, ...], int | float] = {}
+        for key, total in totals.items():
+            decoded = tuple(map(self._decode, group_by,
+                                key[1:] if period is not None else key))
+            if period is not None:
+                day = date(1970, 1, 1) + timedelta(days=key[0])
+                decoded = (period_start(day, period),) + decoded
+            result[decoded] = result.get(decoded, 0) + total
+        return result
+
+    def update(self, obj: Expense) -> None:
+        if obj.pk == 0:
+            raise ValueError('attempt to update object with unknown primary key')
+        row = self._row(obj.pk)
+        if row is None:
+            raise KeyError(obj.pk)
+        for column, value in zip(self._columns.values(), self._values(obj, obj.pk)):
+            column[row] = value
+        self.changes.notify('update', [obj.pk])
+
+    def delete(self, pk: int) -> None:
+        self._delete(pk)
+        self.changes.notify('delete', [pk])
+
+    def _delete(self, pk: int) -> None:
+        row = self._row(pk)
+        if row is None:
+            raise KeyError(pk)
+        self._alive[row] = 0
+        self._size -= 1
+        if self._size * 2 < len(self._alive):
+            self._compact()
+
+    def delete_many(self, pks: Iterable[int]) -> None:
+        pks = list(pks)
+        if len(set(pks)) != len(pks) or any(self._row(pk) is None for pk in pks):
+            raise KeyError(pks)
+        for pk in pks:
+            self._delete(pk)
+        self.changes.notify('delete', pks)
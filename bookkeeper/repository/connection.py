@@ -0,0 +1,457 @@
+"""
+Пул долгоживущих соединений с базой данных sqlite3
+
+Несколько репозиториев, работающих с одним файлом базы данных, могут
+использовать общий пул, чтобы не открывать соединение на каждую операцию,
+и объединять свои изменения в одну транзакцию (ConnectionPool.transaction).
+
+Модуль регистрирует преобразования дат для sqlite3: datetime и date
+записываются в каноническом формате ISO 8601 фиксированной ширины,
+поэтому строки сравниваются и сортируются (в том числе по индексу)
+в хронологическом порядке, а значения столбцов, объявленных как
+TIMESTAMP и DATE, читаются как datetime и date.
+"""
+import queue
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Any, Callable, Iterator
+from urllib.parse import quote
+
+
+def adapt_datetime(value: datetime) -> str:
+    """ datetime -> 'YYYY-MM-DD HH:MM:SS.ffffff' """
+    return value.isoformat(sep=' ', timespec='microseconds')
+
+
+def adapt_date(value: date) -> str:
+    """ date -> 'YYYY-MM-DD' """
+    return value.isoformat()
+
+
+def convert_datetime(value: bytes) -> datetime:
+    """ Значение столбца TIMESTAMP -> datetime """
+    return datetime.fromisoformat(value.decode())
+
+
+def convert_date(value: bytes) -> date:
+    """ Значение столбца DATE -> date, время при наличии отбрасывается """
+    return datetime.fromisoformat(value.decode()).date()
+
+
+sqlite3.register_adapter(datetime, adapt_datetime)
+sqlite3.register_adapter(date, adapt_date)
+sqlite3.register_converter('TIMESTAMP', convert_datetime)
+sqlite3.register_converter('DATE', convert_date)
+
+
+_PRAGMA_CHOICES = {
+    'journal_mode': ('DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF'),
+    'synchronous': ('OFF', 'NORMAL', 'FULL', 'EXTRA'),
+    'temp_store': ('DEFAULT', 'FILE', 'MEMORY'),
+}
+
+
+@dataclass(frozen=True)
+class SQLiteProfile:
+    """
+    Набор настроек производительности, применяемых к каждому новому
+    соединению. Значение None оставляет настройку sqlite3 по умолчанию.
+    journal_mode - режим журнала (WAL позволяет читать во время записи)
+    synchronous - уровень синхронизации с диском при фиксации транзакции
+    cache_size - размер кэша страниц: в страницах, если больше нуля,
+    в КиБ со знаком минус, если меньше
+    mmap_size - объем файла БД в байтах, отображаемый в память
+    temp_store - место хранения временных таблиц и индексов
+    busy_timeout - время ожидания снятия блокировки в миллисекундах
+    """
+    journal_mode: str | None = None
+    synchronous: str | None = None
+    cache_size: int | None = None
+    mmap_size: int | None = None
+    temp_store: str | None = None
+    busy_timeout: int | None = None
+
+    def __post_init__(self) -> None:
+        for name, choices in _PRAGMA_CHOICES.items():
+            value = getattr(self, name)
+            if value is not None and value.upper() not in choices:
+                raise ValueError(f'unsupported {name} {value!r}, '
+                                 f'expected one of {choices}')
+
+    def pragmas(self) -> list[str]:
+        """
+        Получить список команд PRAGMA для заданных настроек.
+
+        Returns
+        -------
+        Команды в порядке объявления полей.
+        """
+        result = []
+        for name in ('journal_mode', 'synchronous', 'cache_size',
+                     'mmap_size', 'temp_store', 'busy_timeout'):
+            value = getattr(self, name)
+            if isinstance(value, str):
+                result.append(f'PRAGMA {name} = {value.upper()}')
+            elif value is not None:
+                result.append(f'PRAGMA {name} = {int(value)}')
+        return result
+
+
+# Настройки для приложения: WAL и synchronous=NORMAL избавляют от fsync
+# при каждой фиксации, не рискуя целостностью БД, и позволяют читать
+# во время записи.
+DESKTOP_PROFILE = SQLiteProfile(journal_mode='WAL', synchronous='NORMAL',
+                                cache_size=-16000, mmap_size=64 * 2**20,
+                                temp_store='MEMORY', busy_timeout=5000)
+
+# Настройки для массовой загрузки данных: синхронизация с диском отключена,
+# при сбое питания последние транзакции могут быть потеряны.
+BULK_IMPORT_PROFILE = SQLiteProfile(journal_mode='WAL', synchronous='OFF',
+                                    cache_size=-256000, mmap_size=256 * 2**20,
+                                    temp_store='MEMORY', busy_timeout=30000)
+
+
+class CountingConnection(sqlite3.Connection):
+    """
+    Соединение, подсчитывающее попадания в кэш подготовленных выражений.
+    Кэш sqlite3 (последние cached_statements текстов запросов) повторяется
+    в словаре, поэтому счетчики учитывают только запросы, выполненные
+    через execute и executemany соединения.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.cache_size: int = kwargs.get('cached_statements', 128)
+        self.statement_hits = 0
+        self.statement_misses = 0
+        self._statements: OrderedDict[str, None] = OrderedDict()
+
+    def _count(self, sql: str) -> None:
+        if sql in self._statements:
+            self.statement_hits += 1
+            self._statements.move_to_end(sql)
+            return
+        self.statement_misses += 1
+        self._statements[sql] = None
+        if len(self._statements) > self.cache_size:
+            self._statements.popitem(last=False)
+
+    def execute(self, sql: str, parameters: Any = (), /) -> sqlite3.Cursor:
+        """ Выполнить запрос, учитывая его в счетчиках кэша """
+        self._count(sql)
+        return super().execute(sql, parameters)
+
+    def executemany(self, sql: str, parameters: Any, /) -> sqlite3.Cursor:
+        """ Выполнить запрос для каждого набора параметров, учитывая его в счетчиках """
+        self._count(sql)
+        return super().executemany(sql, parameters)
+
+
+class ConnectionPool:
+    """
+    Пул соединений с одним файлом базы данных.
+    Соединения создаются по мере необходимости, но не более size штук,
+    и переиспользуются между вызовами. Если все соединения заняты,
+    ожидающий поток ждет освобождения не дольше timeout секунд.
+
+    Parameters
+    ----------
+    db_file - файл, содержащий базу данных
+    size - максимальное количество одновременно открытых соединений
+    timeout - время ожидания свободного соединения в секундах
+    profile - настройки производительности соединений
+    cached_statements - размер кэша подготовленных выражений каждого соединения
+    read_only - открывать соединения только для чтения (URI с mode=ro);
+    база данных должна существовать, режим журнала задает пул для записи
+
+    Внутри блока transaction соединение закрепляется за потоком:
+    connection и write в этом потоке выдают его же, поэтому все изменения
+    репозиториев, использующих пул, фиксируются или откатываются вместе.
+    """
+    def __init__(self, db_file: str, size: int = 4, timeout: float = 5.0,
+                 profile: SQLiteProfile | None = None,
+                 cached_statements: int = 256, read_only: bool = False) -> None:
+        if size < 1:
+            raise ValueError(f'pool size must be positive, got {size}')
+        self.db_file: str = db_file
+        self.size: int = size
+        self.timeout: float = timeout
+        self.profile: SQLiteProfile = SQLiteProfile() if profile is None else profile
+        self.cached_statements: int = cached_statements
+        self.read_only: bool = read_only
+        self._idle: queue.LifoQueue[sqlite3.Connection] = queue.LifoQueue()
+        self._opened: list[CountingConnection] = []
+        self._lock = threading.Lock()
+        self._closed = False
+        self._watcher: sqlite3.Connection | None = None
+        self._local = threading.local()
+
+    def _create(self) -> CountingConnection:
+        """
+        Открыть новое соединение и выполнить его однократную настройку.
+        """
+        database = (f'file:{quote(self.db_file)}?mode=ro' if self.read_only
+                    else self.db_file)
+        con = sqlite3.connect(database, check_same_thread=False,
+                              detect_types=sqlite3.PARSE_DECLTYPES,
+                              cached_statements=self.cached_statements,
+                              factory=CountingConnection, uri=self.read_only)
+        con.execute('PRAGMA foreign_keys = ON')
+        for pragma in self.profile.pragmas():
+            if not (self.read_only and pragma.startswith('PRAGMA journal_mode')):
+                con.execute(pragma)
+        return con
+
+    def acquire(self) -> sqlite3.Connection:
+        """
+        Взять соединение из пула. Соединение необходимо вернуть методом release.
+
+        Returns
+        -------
+        Открытое соединение с базой данных.
+        """
+        if self._closed:
+            raise RuntimeError('connection pool is closed')
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if len(self._opened) < self.size:
+                con = self._create()
+                self._opened.append(con)
+                return con
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty as exc:
+            raise TimeoutError(f'no free connection to {self.db_file} '
+                               f'in {self.timeout} s') from exc
+
+    def release(self, con: sqlite3.Connection) -> None:
+        """
+        Вернуть соединение в пул. Незавершенная транзакция откатывается.
+
+        Parameters
+        ----------
+        con - соединение, полученное методом acquire.
+        """
+        if self._closed:
+            con.close()
+            return
+        if con.in_transaction:
+            con.rollback()
+        self._idle.put(con)
+
+    def data_version(self) -> int:
+        """
+        Значение PRAGMA data_version отдельного соединения, не входящего
+        в пул. Оно меняется после каждой фиксации изменений любым другим
+        соединением, в том числе соединениями пула и других процессов.
+
+        Returns
+        -------
+        Номер версии, который имеет смысл сравнивать только с предыдущими
+        значениями этого же метода.
+        """
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('connection pool is closed')
+            if self._watcher is None:
+                self._watcher = sqlite3.connect(self.db_file, check_same_thread=False)
+            version: int = self._watcher.execute('PRAGMA data_version').fetchone()[0]
+            return version
+
+    def _pinned(self) -> sqlite3.Connection | None:
+        """ Соединение открытой в текущем потоке транзакции """
+        con: sqlite3.Connection | None = getattr(self._local, 'con', None)
+        return con
+
+    @property
+    def in_transaction(self) -> bool:
+        """ Открыта ли транзакция transaction в текущем потоке """
+        return self._pinned() is not None
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """
+        Контекстный менеджер, выдающий соединение из пула
+        и возвращающий его обратно по выходу из блока.
+        Внутри transaction выдается соединение транзакции,
+        внутри snapshot - соединение снимка.
+        """
+        con = self._pinned() or getattr(self._local, 'snapshot', None)
+        if con is not None:
+            yield con
+            return
+        con = self.acquire()
+        try:
+            yield con
+        finally:
+            self.release(con)
+
+    @contextmanager
+    def write(self, durable: bool = False) -> Iterator[sqlite3.Connection]:
+        """
+        Контекстный менеджер для одной операции записи. Вне транзакции
+        изменения фиксируются по выходу из блока. Внутри transaction
+        операция выполняется в точке сохранения: при исключении
+        откатываются только ее изменения, а транзакция продолжается.
+
+        Parameters
+        ----------
+        durable - вне транзакции зафиксировать изменения с synchronous = FULL
+        независимо от профиля, чтобы они сохранились при сбое питания.
+
+        Соединение снимка (snapshot) для записи не используется: фиксация
+        на нем завершила бы читающую транзакцию снимка.
+        """
+        con = self._pinned()
+        if con is None:
+            con = self.acquire()
+            previous = None
+            try:
+                if durable:
+                    previous = con.execute('PRAGMA synchronous').fetchone()[0]
+                    con.execute('PRAGMA synchronous = FULL')
+                yield con
+                con.commit()
+            finally:
+                if previous is not None:
+                    if con.in_transaction:
+                        con.rollback()
+                    con.execute(f'PRAGMA synchronous = {int(previous)}')
+                self.release(con)
+            return
+        con.execute('SAVEPOINT write_op')
+        try:
+            yield con
+        except BaseException:
+            con.execute('ROLLBACK TO write_op')
+            raise
+        finally:
+            con.execute('RELEASE write_op')
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """
+        Единица работы: изменения, сделанные внутри блока в текущем потоке
+        через этот пул (в том числе разными репозиториями), фиксируются
+        одной транзакцией по выходу из блока или целиком откатываются
+        при исключении. Вложенный блок присоединяется к внешнему.
+        Функции, отложенные методом defer, вызываются после завершения.
+        """
+        con = self._pinned()
+        if con is not None:
+            yield con
+            return
+        con = self.acquire()
+        callbacks: list[Callable[[bool], None]] = []
+        self._local.con = con
+        self._local.callbacks = callbacks
+        committed = False
+        try:
+            con.execute('BEGIN IMMEDIATE')
+            yield con
+            con.commit()
+            committed = True
+        finally:
+            del self._local.con
+            del self._local.callbacks
+            self.release(con)
+            for callback in callbacks:
+                callback(committed)
+
+    @contextmanager
+    def snapshot(self) -> Iterator[sqlite3.Connection]:
+        """
+        Согласованный снимок для чтения: соединение закрепляется за потоком
+        и открывает читающую транзакцию, поэтому все запросы внутри блока
+        (в том числе разных репозиториев) видят одно и то же зафиксированное
+        состояние. Снимок не ждет пишущих транзакций и не мешает им. Запись
+        внутри блока идет через другое соединение, и ее результат станет
+        виден только после выхода из блока. Вложенный блок, как и блок
+        внутри transaction, присоединяется к внешнему.
+
+        Снимок возможен только в режиме журнала WAL. В других режимах
+        читающая транзакция блокировала бы запись (в том числе внутри
+        блока), поэтому соединение не закрепляется: чтения внутри блока
+        выполняются как обычно и согласованность между ними не гарантируется.
+        """
+        con = self._pinned() or getattr(self._local, 'snapshot', None)
+        if con is not None:
+            yield con
+            return
+        con = self.acquire()
+        try:
+            if con.execute('PRAGMA journal_mode').fetchone()[0].lower() != 'wal':
+                yield con
+                return
+            self._local.snapshot = con
+            try:
+                con.execute('BEGIN')
+                con.execute('SELECT count(*) FROM sqlite_master').fetchone()
+                yield con
+            finally:
+                del self._local.snapshot
+        finally:
+            self.release(con)
+
+    def defer(self, callback: Callable[[bool], None]) -> None:
+        """
+        Отложить вызов до завершения транзакции текущего потока.
+        callback получает True, если транзакция зафиксирована, и False,
+        если откачена; вне транзакции вызывается сразу с True.
+        """
+        callbacks: list[Callable[[bool], None]] | None = getattr(
+            self._local, 'callbacks', None)
+        if callbacks is None:
+            callback(True)
+        else:
+            callbacks.append(callback)
+
+    def close(self) -> None:
+        """
+        Закрыть все соединения пула. Соединения, занятые в момент вызова,
+        закрываются при возврате. Повторный вызов ничего не делает.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            if self._watcher is not None:
+                self._watcher.close()
+        while True:
+            try:
+                con = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if con.in_transaction:
+                con.rollback()
+            con.close()
+
+    @property
+    def statement_cache_hits(self) -> int:
+        """ Количество запросов, подготовленное выражение которых нашлось в кэше """
+        with self._lock:
+            return sum(con.statement_hits for con in self._opened)
+
+    @property
+    def statement_cache_misses(self) -> int:
+        """ Количество запросов, для которых выражение пришлось подготовить """
+        with self._lock:
+            return sum(con.statement_misses for con in self._opened)
+
+    @property
+    def closed(self) -> bool:
+        """ Закрыт ли пул """
+        return self._closed
+
+    def __enter__(self) -> 'ConnectionPool':
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
@@ -0,0 +1,161 @@
+"""
+Модуль описывает репозиторий, читающий из оперативной памяти
+и записывающий изменения в другой репозиторий
+"""
+
+from contextlib import contextmanager
+from typing import Any, Callable, ContextManager, Iterable, Iterator, Sequence
+
+from bookkeeper.repository.abstract_repository import AbstractRepository, T
+from bookkeeper.repository.memory_repository import MemoryRepository
+from bookkeeper.repository.query import Query
+
+
+class HybridRepository(AbstractRepository[T]):
+    """
+    Репозиторий-обертка для небольших, часто читаемых таблиц (категории,
+    бюджеты). При создании все записи внутреннего репозитория загружаются
+    в MemoryRepository с индексами, после чего все чтения обслуживаются
+    из памяти, а изменения записываются во внутренний репозиторий
+    и в память.
+
+    Запись синхронная: метод возвращается после записи во внутренний
+    репозиторий. Для пакетной записи передайте SQLiteRepository
+    в режиме отложенной записи (write_behind): pk выдаются без обращения
+    к БД, а изменения записываются фоновым потоком.
+
+    Обертка подписана на изменения внутреннего репозитория: записи,
+    измененные в обход обертки или откаченные вместе с транзакцией,
+    перечитываются. Изменения, сделанные другими процессами, становятся
+    видны после reload. У обертки свои подписчики: оповещения внутреннего
+    репозитория передаются им после обновления памяти, поэтому подписчик
+    уже читает через обертку новые данные.
+
+    Возвращаются одни и те же объекты, поэтому изменять их, как и в
+    MemoryRepository, нужно через update.
+
+    Parameters
+    ----------
+    inner - репозиторий, в котором хранятся данные
+    indexes, sorted_indexes - индексы в памяти, как в MemoryRepository
+    """
+
+    def __init__(self, inner: AbstractRepository[T], indexes: Iterable[str] = (),
+                 sorted_indexes: Iterable[str] = ()) -> None:
+        self.inner = inner
+        self.indexes = tuple(indexes)
+        self.sorted_indexes = tuple(sorted_indexes)
+        self._pending: Callable[[], None] | None = None
+        self.memory: MemoryRepository[T] = self._load()
+        self.unsubscribe = inner.subscribe(self._refresh)
+
+    def data_version(self) -> int:
+        return self.inner.data_version()
+
+    def transaction(self) -> ContextManager[Any]:
+        return self.inner.transaction()
+
+    def _load(self) -> MemoryRepository[T]:
+        # объекты уже имеют pk, поэтому сохраняются методом update
+        memory: MemoryRepository[T] = MemoryRepository(self.indexes, self.sorted_indexes)
+        memory.update_many(self.inner.iter_all())
+        return memory
+
+    def reload(self) -> None:
+        """ Перечитать все записи, например, после изменения данных другим процессом """
+        self.memory = self._load()
+
+    def _refresh(self, event: str, pks: list[int]) -> None:
+        """
+        Обновить память и оповестить подписчиков обертки. Изменение через
+        обертку применяется к памяти как есть, записи, измененные в обход
+        обертки или откаченные, перечитываются.
+        """
+        apply, self._pending = self._pending, None
+        if apply is not None and event != 'rollback':
+            apply()
+        else:
+            self._pending = apply
+            for pk in pks:
+                obj = self.inner.get(pk)
+                if obj is not None:
+                    self.memory.update(obj)
+                elif self.memory.get(pk) is not None:
+                    self.memory.delete(pk)
+        self.changes.notify(event, pks)
+
+    @contextmanager
+    def _write_through(self, apply: Callable[[], None]) -> Iterator[None]:
+        """
+        Блок записи через обертку: apply переносит изменение в память.
+        Оно выполняется по оповещению внутреннего репозитория, до вызова
+        подписчиков, или, если оповещение отложено до конца транзакции,
+        по выходу из блока (тогда по оповещению записи перечитываются).
+        """
+        outer, self._pending = self._pending, apply
+        try:
+            yield
+            if self._pending is apply:
+                apply()
+        finally:
+            self._pending = outer
+
+    def add(self, obj: T) -> int:
+        with self._write_through(lambda: self.memory.update(obj)):
+            pk = self.inner.add(obj)
+        return pk
+
+    def add_many(self, objs: Iterable[T]) -> list[int]:
+        objs = list(objs)
+        with self._write_through(lambda: self.memory.update_many(objs)):
+            pks = self.inner.add_many(objs)
+        return pks
+
+    def get(self, pk: int) -> T | None:
+        return self.memory.get(pk)
+
+    def get_all(self, where: dict[str, Any] | None = None) -> list[T]:
+        return self.memory.get_all(where)
+
+    def iter_all(self, where: dict[str, Any] | None = None,
+                 order_by: str | None = None, descending: bool = False,
+                 chunk_size: int = 1000) -> Iterator[T]:
+        return self.memory.iter_all(where, order_by, descending, chunk_size)
+
+    def get_page(self, order_by: str = 'pk', after_key: tuple[Any, int] | None = None,
+                 limit: int = 100, descending: bool = False,
+                 where: dict[str, Any] | None = None) -> list[T]:
+        return self.memory.get_page(order_by, after_key, limit, descending, where)
+
+    def get_between(self, field: str, start: Any, end: Any,
+                    where: dict[str, Any] | None = None) -> list[T]:
+        return self.memory.get_between(field, start, end, where)
+
+    def query(self, query: Query) -> list[Any]:
+        return self.memory.query(query)
+
+    def aggregate(self, func: str, field: str, group_by: Sequence[str] = (),
+                  period: str | None = None, date_field: str | None = None,
+                  date_range: tuple[Any, Any] | None = None,
+                  where: dict[str, Any] | None = None
+                  ) -> dict[tuple[Any, ...], int | float]:
+        return self.memory.aggregate(func, field, group_by, period,
+                                     date_field, date_range, where)
+
+    def update(self, obj: T) -> None:
+        with self._write_through(lambda: self.memory.update(obj)):
+            self.inner.update(obj)
+
+    def update_many(self, objs: Iterable[T]) -> None:
+        objs = list(objs)
+        with self._write_through(lambda: self.memory.update_many(objs)):
+            self.inner.update_many(objs)
+
+    def delete(self, pk: int) -> None:
+        with self._write_through(lambda: self.memory.delete(pk)):
+            self.inner.delete(pk)
+
+    def delete_many(self, pks: Iterable[int]) -> None:
+        pks = list(pks)
+        with self._write_through(lambda: self.memory.delete_many(pks)):
+            self.inner.delete_many(pks)
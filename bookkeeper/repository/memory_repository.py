@@ -2,42 +2,528 @@
 Модуль описывает репозиторий, работающий в оперативной памяти
 """
 
+import mmap
+import os
+import pickle
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right, insort
 from itertools import count
-from typing import Any
+from operator import itemgetter
+from typing import Any, Collection, Iterable, Iterator, MutableMapping
 
 from bookkeeper.repository.abstract_repository import AbstractRepository, T
+from bookkeeper.repository.query import Condition, Query, nulls_first, prefix_end
+
+
+class _SortedIndex:
+    """
+    Отсортированный список пар (значение поля, pk) для поиска по диапазону.
+    Значения None в индекс не попадают.
+    """
+
+    def __init__(self, field: str, objs: Iterable[Any]) -> None:
+        self.field = field
+        self._values: dict[int, Any] = {}
+        for obj in objs:
+            value = getattr(obj, field)
+            if value is not None:
+                self._values[obj.pk] = value
+        self._items = sorted((value, pk) for pk, value in self._values.items())
+
+    def add(self, obj: Any) -> None:
+        """ Добавить объект в индекс """
+        value = getattr(obj, self.field)
+        if value is not None:
+            self._values[obj.pk] = value
+            insort(self._items, (value, obj.pk))
+
+    def remove(self, pk: int) -> None:
+        """ Удалить объект из индекса, если он там есть """
+        value = self._values.pop(pk, None)
+        if value is not None:
+            del self._items[bisect_left(self._items, (value, pk))]
+
+    def between(self, start: Any, end: Any) -> list[int]:
+        """ pk объектов со значением поля от start до end включительно """
+        return self.select(start, end)
+
+    def select(self, low: Any = None, high: Any = None,
+               include_low: bool = True, include_high: bool = True) -> list[int]:
+        """
+        pk объектов со значением поля между low и high в порядке значения;
+        None - граница не задана, include_* - включать ли границу.
+        """
+        key = itemgetter(0)
+        start, end = 0, len(self._items)
+        if low is not None:
+            start = (bisect_left if include_low else bisect_right)(
+                self._items, low, key=key)
+        if high is not None:
+            end = (bisect_right if include_high else bisect_left)(
+                self._items, high, key=key)
+        return [pk for _, pk in self._items[start:end]]
+
+    def compare(self, op: str, value: Any) -> list[int] | None:
+        """
+        pk объектов, удовлетворяющих условию Condition с операцией op
+        и значением value, или None для операций, не использующих порядок.
+        """
+        if op == 'between':
+            return self.select(*value)
+        if op == 'prefix':
+            return self.select(value, prefix_end(value), include_high=False)
+        if op in ('<', '<='):
+            return self.select(high=value, include_high=op == '<=')
+        if op in ('>', '>='):
+            return self.select(low=value, include_low=op == '>=')
+        return None
+
+    def ordered(self, descending: bool = False) -> list[int]:
+        """ pk объектов в порядке значения поля, при равных значениях - pk """
+        items = reversed(self._items) if descending else self._items
+        return [pk for _, pk in items]
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+
+class _HashIndex:
+    """
+    Словарь значение поля -> множество pk для поиска по равенству.
+    Значения поля должны быть хешируемыми, None тоже индексируется.
+    """
+
+    def __init__(self, field: str, objs: Iterable[Any]) -> None:
+        self.field = field
+        self._values: dict[int, Any] = {}
+        self._pks: dict[Any, set[int]] = {}
+        for obj in objs:
+            self.add(obj)
+
+    def add(self, obj: Any) -> None:
+        """ Добавить объект в индекс """
+        value = getattr(obj, self.field)
+        self._values[obj.pk] = value
+        self._pks.setdefault(value, set()).add(obj.pk)
+
+    def remove(self, pk: int) -> None:
+        """ Удалить объект из индекса, если он там есть """
+        if pk not in self._values:
+            return
+        value = self._values.pop(pk)
+        pks = self._pks[value]
+        pks.discard(pk)
+        if not pks:
+            del self._pks[value]
+
+    def equal(self, value: Any) -> Collection[int]:
+        """ pk объектов со значением поля value """
+        return self._pks.get(value, ())
+
+
+# Формат снимка: сигнатура, заголовок (количество объектов, следующий pk),
+# массив pk по возрастанию, массив смещений объектов (на одно больше
+# количества объектов) и объекты, сериализованные pickle по отдельности.
+# Числа - 64-битные со знаком в порядке байтов little-endian.
+_SNAPSHOT_MAGIC = b'BKSNAP1\n'
+_SNAPSHOT_HEADER = struct.Struct('<qq')
+
+
+class _SnapshotContainer(MutableMapping[int, T]):
+    """
+    Словарь pk -> объект поверх отображенного в память снимка: объект
+    десериализуется при первом обращении и дальше хранится в словаре.
+    Измененные, удаленные и новые объекты хранятся отдельно от снимка,
+    сам файл не меняется. Порядок перебора - pk объектов снимка,
+    затем новые объекты в порядке добавления.
+    """
+
+    def __init__(self, buffer: mmap.mmap, pks: 'array[int]',
+                 offsets: 'array[int]') -> None:
+        self._buffer = buffer
+        self._pks = pks
+        self._offsets = offsets
+        self._objects: dict[int, T] = {}
+        self._removed: set[int] = set()
+        self._added: dict[int, T] = {}
+
+    def _position(self, pk: int) -> int | None:
+        """ Номер объекта в снимке или None, если его там нет """
+        position = bisect_left(self._pks, pk)
+        if position < len(self._pks) and self._pks[position] == pk:
+            return position
+        return None
+
+    def __getitem__(self, pk: int) -> T:
+        obj = self._objects.get(pk)
+        if obj is not None:
+            return obj
+        if pk in self._added:
+            return self._added[pk]
+        position = self._position(pk)
+        if position is None or pk in self._removed:
+            raise KeyError(pk)
+        loaded: T = pickle.loads(self._buffer[self._offsets[position]:
+                                              self._offsets[position + 1]])
+        self._objects[pk] = loaded
+        return loaded
+
+    def __setitem__(self, pk: int, obj: T) -> None:
+        if self._position(pk) is None:
+            self._added[pk] = obj
+        else:
+            self._removed.discard(pk)
+            self._objects[pk] = obj
+
+    def __delitem__(self, pk: int) -> None:
+        if pk in self._added:
+            del self._added[pk]
+        elif self._position(pk) is not None and pk not in self._removed:
+            self._removed.add(pk)
+            self._objects.pop(pk, None)
+        else:
+            raise KeyError(pk)
+
+    def __contains__(self, pk: object) -> bool:
+        if not isinstance(pk, int):
+            return False
+        if pk in self._added:
+            return True
+        return self._position(pk) is not None and pk not in self._removed
+
+    def __iter__(self) -> Iterator[int]:
+        removed = self._removed
+        yield from (pk for pk in self._pks if pk not in removed)
+        yield from list(self._added)
+
+    def __reversed__(self) -> Iterator[int]:
+        removed = self._removed
+        yield from reversed(list(self._added))
+        yield from (pk for pk in reversed(self._pks) if pk not in removed)
+
+    def __len__(self) -> int:
+        return len(self._pks) - len(self._removed) + len(self._added)
+
+    def close(self) -> None:
+        """ Освободить отображение файла снимка в память """
+        self._buffer.close()
 
 
 class MemoryRepository(AbstractRepository[T]):
     """
     Репозиторий, работающий в оперативной памяти. Хранит данные в словаре.
+    Индексы поддерживаются при изменениях, поэтому изменять сохраненные
+    объекты нужно через update.
+
+    Для полей из indexes строятся хеш-индексы, для полей из sorted_indexes -
+    отсортированные. get_all, iter_all и get_page с условием where выбирают
+    записи по самому избирательному индексу из полей условия и проверяют
+    остальные условия только у выбранных записей; сортировка iter_all
+    без условия по полю с отсортированным индексом берет порядок из индекса.
+    Для поиска по диапазону (get_between) по полю без объявленного индекса
+    при первом запросе строится отсортированный индекс. query выбирает
+    записи по самому избирательному индексу из условий запроса: хеш-индекс
+    используется для '=', 'in' и 'is null', отсортированный - также для
+    сравнений, 'between' и поиска по префиксу.
+
+    Содержимое репозитория можно сохранить в двоичный снимок методом save
+    и открыть методом load: файл отображается в память, а объекты
+    десериализуются только при обращении к ним. Файл остается открытым
+    до вызова close (или выхода из блока with) либо до save.
+
+    Parameters
+    ----------
+    indexes - поля для поиска по равенству (значения должны быть хешируемыми)
+    sorted_indexes - поля для поиска по диапазону и сортировки, например,
+    даты и суммы
     """
 
-    def __init__(self) -> None:
-        self._container: dict[int, T] = {}
+    def __init__(self, indexes: Iterable[str] = (),
+                 sorted_indexes: Iterable[str] = ()) -> None:
+        self._container: MutableMapping[int, T] = {}
         self._counter = count(1)
+        self._hash_indexes: dict[str, _HashIndex] = {
+            field: _HashIndex(field, ()) for field in indexes}
+        self._sorted_indexes: dict[str, _SortedIndex] = {
+            field: _SortedIndex(field, ()) for field in sorted_indexes}
+
+    def _indexes(self) -> Iterator[_HashIndex | _SortedIndex]:
+        yield from self._hash_indexes.values()
+        yield from self._sorted_indexes.values()
+
+    def _store(self, obj: T) -> None:
+        """ Сохранить объект в словаре и обновить индексы """
+        for index in self._indexes():
+            index.remove(obj.pk)
+            index.add(obj)
+        container = self._container
+        # reversed поддерживают и dict, и контейнер снимка
+        pks: Iterator[int] = reversed(container)  # type: ignore[arg-type]
+        if obj.pk in container or obj.pk > next(pks, 0):
+            container[obj.pk] = obj
+            return
+        # новый pk меньше последнего (например, восстановленная запись):
+        # словарь перестраивается, чтобы порядок перебора остался порядком pk
+        self.close()
+        self._container = dict(sorted([*self._container.items(), (obj.pk, obj)],
+                                      key=itemgetter(0)))
+
+    def _remove(self, pk: int) -> None:
+        """ Удалить объект из словаря и из индексов """
+        self._container.pop(pk)
+        for index in self._indexes():
+            index.remove(pk)
+
+    def _lookup(self, field: str, value: Any) -> Collection[int] | None:
+        """ pk объектов с полем, равным value, по индексу или None без индекса """
+        hash_index = self._hash_indexes.get(field)
+        if hash_index is not None:
+            return hash_index.equal(value)
+        sorted_index = self._sorted_indexes.get(field)
+        if sorted_index is None or value is None:
+            return None
+        try:
+            return sorted_index.between(value, value)
+        except TypeError:
+            return None
+
+    def _select(self, where: dict[str, Any]) -> list[T]:
+        """ Объекты, удовлетворяющие условию where, в порядке pk """
+        best: Collection[int] | None = None
+        for field, value in where.items():
+            pks = self._lookup(field, value)
+            if pks is not None and (best is None or len(pks) < len(best)):
+                best = pks
+        objs: Iterable[T] = (self._container.values() if best is None
+                             else [self._container[pk] for pk in sorted(best)])
+        conditions = where.items()
+        return [obj for obj in objs
+                if all(getattr(obj, attr) == value for attr, value in conditions)]
 
     def add(self, obj: T) -> int:
         if getattr(obj, 'pk', None) != 0:
             raise ValueError(f'trying to add object {obj} with filled `pk` attribute')
         pk = next(self._counter)
-        self._container[pk] = obj
         obj.pk = pk
+        self._store(obj)
+        self.changes.notify('add', [pk])
         return pk
 
+    def add_many(self, objs: Iterable[T]) -> list[int]:
+        objs = list(objs)
+        for obj in objs:
+            if getattr(obj, 'pk', None) != 0:
+                raise ValueError(f'trying to add object {obj} with filled `pk` attribute')
+        return [self.add(obj) for obj in objs]
+
     def get(self, pk: int) -> T | None:
         return self._container.get(pk)
 
+    def _condition_pks(self, condition: Condition) -> Collection[int] | None:
+        """ pk объектов, которые могут удовлетворять условию, или None без индекса """
+        field, op, value = condition.field, condition.op, condition.value
+        if field == 'pk' and op == '=':
+            return (value,) if value in self._container else ()
+        if op in ('=', 'is null'):
+            return self._lookup(field, value)
+        if op == 'in':
+            found: set[int] = set()
+            for item in value:
+                pks = self._lookup(field, item)
+                if pks is None:
+                    return None
+                found.update(pks)
+            return found
+        index = self._sorted_indexes.get(field)
+        if index is None:
+            return None
+        try:
+            return index.compare(op, value)
+        except TypeError:
+            return None
+
+    def query(self, query: Query) -> list[Any]:
+        best: Collection[int] | None = None
+        for condition in query.conditions:
+            pks = self._condition_pks(condition)
+            if pks is not None and (best is None or len(pks) < len(best)):
+                best = pks
+        if best is not None:
+            return query.apply(self._container[pk] for pk in sorted(best))
+        index = (None if query.order_by is None
+                 else self._sorted_indexes.get(query.order_by))
+        if index is not None and len(index) == len(self._container):
+            return query.apply((self._container[pk]
+                                for pk in index.ordered(query.descending)), ordered=True)
+        return query.apply(self._container.values())
+
     def get_all(self, where: dict[str, Any] | None = None) -> list[T]:
         if where is None:
             return list(self._container.values())
-        return [obj for obj in self._container.values()
-                if all(getattr(obj, attr) == value for attr, value in where.items())]
+        return self._select(where)
+
+    def iter_all(self, where: dict[str, Any] | None = None,
+                 order_by: str | None = None, descending: bool = False,
+                 chunk_size: int = 1000) -> Iterator[T]:
+        if where is not None:
+            selected = self._select(where)
+            objs: Iterable[T] = reversed(selected) if descending else selected
+        elif descending:
+            # reversed поддерживают и dict, и контейнер снимка
+            pks: Iterator[int] = reversed(self._container)  # type: ignore[arg-type]
+            objs = map(self._container.__getitem__, pks)
+        else:
+            objs = self._container.values()
+        if order_by is not None:
+            index = self._sorted_indexes.get(order_by)
+            if where is None and index is not None \
+                    and len(index) == len(self._container):
+                return (self._container[pk] for pk in index.ordered(descending))
+            objs = sorted(objs, key=nulls_first(order_by), reverse=descending)
+        return iter(objs)
+
+    def get_between(self, field: str, start: Any, end: Any,
+                    where: dict[str, Any] | None = None) -> list[T]:
+        index = self._sorted_indexes.get(field)
+        if index is None:
+            index = _SortedIndex(field, self._container.values())
+            self._sorted_indexes[field] = index
+        pks = index.between(start, end)
+        if where is None:
+            return [self._container[pk] for pk in pks]
+        for name, value in where.items():
+            matching = self._lookup(name, value)
+            if matching is not None and len(matching) < len(pks):
+                matching = set(matching)
+                pks = [pk for pk in pks if pk in matching]
+        conditions = where.items()
+        return [obj for obj in map(self._container.__getitem__, pks)
+                if all(getattr(obj, attr) == value for attr, value in conditions)]
 
     def update(self, obj: T) -> None:
         if obj.pk == 0:
             raise ValueError('attempt to update object with unknown primary key')
-        self._container[obj.pk] = obj
+        self._store(obj)
+        self.changes.notify('update', [obj.pk])
 
     def delete(self, pk: int) -> None:
-        self._container.pop(pk)
+        self._remove(pk)
+        self.changes.notify('delete', [pk])
+
+    def update_many(self, objs: Iterable[T]) -> None:
+        objs = list(objs)
+        if any(obj.pk == 0 for obj in objs):
+            raise ValueError('attempt to update object with unknown primary key')
+        for obj in objs:
+            self._store(obj)
+        self.changes.notify('update', [obj.pk for obj in objs])
+
+    def delete_many(self, pks: Iterable[int]) -> None:
+        pks = list(pks)
+        if len(set(pks)) != len(pks) or not self._container.keys() >= set(pks):
+            raise KeyError(pks)
+        for pk in pks:
+            self._remove(pk)
+        self.changes.notify('delete', pks)
+
+    def save(self, path: str) -> None:
+        """
+        Сохранить объекты и счетчик pk в двоичный снимок. Файл заменяется
+        целиком после успешной записи. Объекты сериализуются pickle,
+        поэтому открывать можно только снимки из доверенных источников.
+
+        Parameters
+        ----------
+        path - файл снимка.
+
+        Returns
+        -------
+        None
+        """
+        next_pk = next(self._counter)
+        self._counter = count(next_pk)
+        pks = array('q', sorted(self._container))
+        blobs = [pickle.dumps(self._container[pk], pickle.HIGHEST_PROTOCOL)
+                 for pk in pks]
+        start = (len(_SNAPSHOT_MAGIC) + _SNAPSHOT_HEADER.size
+                 + pks.itemsize * (2 * len(pks) + 1))
+        offsets = array('q', [start])
+        for blob in blobs:
+            offsets.append(offsets[-1] + len(blob))
+        temp = f'{path}.tmp'
+        with open(temp, 'wb') as file:
+            file.write(_SNAPSHOT_MAGIC)
+            file.write(_SNAPSHOT_HEADER.pack(len(pks), next_pk))
+            for numbers in (pks, offsets):
+                if sys.byteorder != 'little':
+                    numbers.byteswap()
+                numbers.tofile(file)
+            file.writelines(blobs)
+        # все объекты уже десериализованы; отображение снимка, открытого
+        # методом load, освобождается, чтобы файл можно было заменить
+        self.close()
+        os.replace(temp, path)
+
+    @classmethod
+    def load(cls, path: str, indexes: Iterable[str] = (),
+             sorted_indexes: Iterable[str] = ()) -> 'MemoryRepository[Any]':
+        """
+        Открыть снимок, сохраненный методом save. Читаются только pk
+        и смещения объектов, сами объекты десериализуются при первом
+        обращении. Объявленные индексы строятся сразу, поэтому для них
+        все объекты десериализуются при загрузке.
+
+        Parameters
+        ----------
+        path - файл снимка.
+        indexes, sorted_indexes - индексы, как в конструкторе.
+
+        Returns
+        -------
+        Репозиторий с объектами снимка.
+        """
+        with open(path, 'rb') as file:
+            buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        header_end = len(_SNAPSHOT_MAGIC) + _SNAPSHOT_HEADER.size
+        if buffer[:len(_SNAPSHOT_MAGIC)] != _SNAPSHOT_MAGIC:
+            buffer.close()
+            raise ValueError(f'{path} is not a repository snapshot')
+        size, next_pk = _SNAPSHOT_HEADER.unpack(buffer[len(_SNAPSHOT_MAGIC):header_end])
+        pks, offsets = array('q'), array('q')
+        pks.frombytes(buffer[header_end:header_end + 8 * size])
+        offsets.frombytes(buffer[header_end + 8 * size:header_end + 8 * (2 * size + 1)])
+        if sys.byteorder != 'little':
+            pks.byteswap()
+            offsets.byteswap()
+        repo: MemoryRepository[Any] = cls()
+        repo._container = _SnapshotContainer(buffer, pks, offsets)
+        repo._counter = count(next_pk)
+        for field in indexes:
+            repo._hash_indexes[field] = _HashIndex(field, repo._container.values())
+        for field in sorted_indexes:
+            repo._sorted_indexes[field] = _SortedIndex(field, repo._container.values())
+        return repo
+
+    def close(self) -> None:
+        """
+        Освободить файл снимка, открытого методом load: еще не прочитанные
+        объекты десериализуются, и дальше репозиторий хранит все объекты
+        в обычном словаре. Для репозитория, не загруженного из снимка,
+        ничего не делает. Вызывается также при выходе из блока with.
+
+        Returns
+        -------
+        None
+        """
+        container = self._container
+        if isinstance(container, _SnapshotContainer):
+            self._container = dict(container.items())
+            container.close()
+
+    def __enter__(self) -> 'MemoryRepository[T]':
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
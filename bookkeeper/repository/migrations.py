@@ -0,0 +1,244 @@
+"""
+Миграции базы данных sqlite3
+
+Схема базы данных изменяется упорядоченными шагами (Migration).
+Номер последнего примененного шага хранится в PRAGMA user_version,
+функция upgrade применяет недостающие шаги одной транзакцией.
+Presenter обновляет базу данных при открытии; вручную:
+
+    python -m bookkeeper.repository.migrations main_db.db
+"""
+import sqlite3
+import sys
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Callable, Sequence
+
+from bookkeeper.repository.connection import ConnectionPool
+from bookkeeper.repository.sqlite_repository import make_decoder
+
+
+@dataclass(frozen=True)
+class Migration:
+    """
+    Шаг миграции схемы. Номер версии шага - его позиция в списке, начиная с 1,
+    поэтому новые шаги добавляются только в конец списка.
+    description - описание изменения
+    apply - функция, изменяющая базу данных через переданный пул;
+    вызывается внутри транзакции пула, к которой присоединяются репозитории
+    """
+    description: str
+    apply: Callable[[ConnectionPool], None]
+
+
+@dataclass(frozen=True)
+class TableSchema:
+    """
+    Схема таблицы, зафиксированная в шаге миграции. Шаг описывает таблицы
+    явно, а не по текущим моделям: модели могут измениться в следующих
+    шагах, а старые базы данных должны обновляться теми же шагами.
+    name - название таблицы
+    columns - пары (столбец, объявление типа) в порядке создания таблицы
+    """
+    name: str
+    columns: tuple[tuple[str, str], ...]
+
+    @property
+    def names(self) -> list[str]:
+        """ Названия столбцов """
+        return [name for name, _ in self.columns]
+
+    def create_query(self) -> str:
+        """ Запрос CREATE TABLE для этой схемы """
+        columns = ', '.join(f'{name} {declared}'.rstrip()
+                            for name, declared in self.columns)
+        return f'CREATE TABLE {self.name} ({columns})'
+
+
+_DATE_DECODERS = {'TIMESTAMP': make_decoder(datetime), 'DATE': make_decoder(date)}
+
+
+def migrate_datetimes(pool: ConnectionPool, schema: TableSchema) -> None:
+    """
+    Перевести столбцы с датами (объявленные в schema как TIMESTAMP и DATE)
+    на эти типы (значения таких столбцов читаются конвертерами sqlite3)
+    и канонический формат ISO 8601. Если в таблице столбцы объявлены
+    с другими типами, она пересоздается по schema с сохранением данных,
+    счетчика pk и индексов. Выполняется одной транзакцией; повторный
+    вызов ничего не меняет. Отсутствующая таблица пропускается.
+
+    Parameters
+    ----------
+    pool - пул соединений с базой данных.
+    schema - схема таблицы после миграции.
+
+    Returns
+    -------
+    None
+    """
+    table = schema.name
+    names = [name for name, declared in schema.columns if declared in _DATE_DECODERS]
+    if not names:
+        return
+    with pool.transaction() as con:
+        info = con.execute(f'PRAGMA table_info({table})').fetchall()
+        if not info:
+            return
+        declared = {row[1]: row[2].upper() for row in info}
+        if set(declared) != set(schema.names):
+            raise ValueError(f'columns of table {table} {sorted(declared)} '
+                             f'do not match schema {sorted(schema.names)}')
+        # CAST возвращает строки как есть, без конвертеров sqlite3
+        rows = con.execute(f'SELECT pk, {", ".join(f"CAST({n} AS TEXT)" for n in names)} '
+                           f'FROM {table}').fetchall()
+        types = dict(schema.columns)
+        decoders = [_DATE_DECODERS[types[name]] for name in names]
+        values = []
+        for pk, *raw in rows:
+            try:
+                values.append([None if value is None or decode is None
+                               else decode(value)
+                               for decode, value in zip(decoders, raw)] + [pk])
+            except ValueError as exc:
+                raise ValueError(f'cannot parse date in table {table}, '
+                                 f'row {pk}: {exc}') from exc
+        if any(declared[name] != types[name] for name in names):
+            _recreate_table(con, schema)
+        assignments = ', '.join(f'{name} = ?' for name in names)
+        con.executemany(f'UPDATE {table} SET {assignments} WHERE pk = ?', values)
+
+
+def _recreate_table(con: sqlite3.Connection, schema: TableSchema) -> None:
+    """
+    Пересоздать таблицу по схеме, сохранив данные, счетчик pk и индексы.
+    """
+    table = schema.name
+    seq = None
+    if con.execute("SELECT 1 FROM sqlite_master "
+                   "WHERE name = 'sqlite_sequence'").fetchone():
+        row = con.execute('SELECT seq FROM sqlite_sequence WHERE name = ?',
+                          (table,)).fetchone()
+        seq = None if row is None else row[0]
+    # индексы удаляются вместе со старой таблицей и создаются заново
+    indexes = [row[0] for row in con.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'index' "
+        "AND tbl_name = ? AND sql IS NOT NULL", (table,))]
+    columns = ', '.join(schema.names)
+    con.execute(f'ALTER TABLE {table} RENAME TO {table}_legacy')
+    con.execute(schema.create_query())
+    con.execute(f'INSERT INTO {table} ({columns}) '
+                f'SELECT {columns} FROM {table}_legacy')
+    con.execute(f'DROP TABLE {table}_legacy')
+    for query in indexes:
+        con.execute(query)
+    if seq is not None:
+        con.execute('UPDATE sqlite_sequence SET seq = max(seq, ?) '
+                    'WHERE name = ?', (seq, table))
+
+
+# Шаг 1: таблицы моделей на момент перехода на TIMESTAMP и DATE
+_PK = ('pk', 'INTEGER PRIMARY KEY AUTOINCREMENT')
+_CANONICAL_DATETIME_TABLES = (
+    TableSchema('expense', (('amount', 'INTEGER'), ('category', 'INTEGER'),
+                            ('expense_date', 'TIMESTAMP'), ('added_date', 'TIMESTAMP'),
+                            ('comment', 'TEXT'), _PK)),
+    TableSchema('category', (('name', 'TEXT'), ('parent', 'INTEGER'), _PK)),
+    TableSchema('budget', (('amount', 'INTEGER'), ('category', 'INTEGER'),
+                           ('length', 'INTEGER'), ('start_date', 'DATE'),
+                           ('end_date', 'DATE'), _PK)),
+)
+
+
+def _canonical_datetimes(pool: ConnectionPool) -> None:
+    for schema in _CANONICAL_DATETIME_TABLES:
+        migrate_datetimes(pool, schema)
+
+
+MIGRATIONS: list[Migration] = [
+    Migration('canonical ISO 8601 dates, TIMESTAMP and DATE column types',
+              _canonical_datetimes),
+]
+
+
+def schema_version(pool: ConnectionPool) -> int:
+    """
+    Версия схемы базы данных: количество примененных шагов миграции.
+
+    Parameters
+    ----------
+    pool - пул соединений с базой данных.
+
+    Returns
+    -------
+    Значение PRAGMA user_version.
+    """
+    with pool.connection() as con:
+        version: int = con.execute('PRAGMA user_version').fetchone()[0]
+    return version
+
+
+def backup_database(db_file: str, target: str) -> None:
+    """
+    Сохранить согласованную копию базы данных средствами sqlite3.
+
+    Parameters
+    ----------
+    db_file - файл, содержащий базу данных
+    target - файл для копии
+
+    Returns
+    -------
+    None
+    """
+    source = sqlite3.connect(db_file)
+    copy = sqlite3.connect(target)
+    try:
+        source.backup(copy)
+    finally:
+        copy.close()
+        source.close()
+
+
+def upgrade(pool: ConnectionPool, migrations: Sequence[Migration] | None = None,
+            backup: str | None = None) -> int:
+    """
+    Применить шаги миграции с номерами больше текущей версии схемы
+    одной транзакцией и записать новую версию в PRAGMA user_version.
+    При ошибке все изменения откатываются, версия не меняется.
+
+    Parameters
+    ----------
+    pool - пул соединений с базой данных.
+    migrations - шаги миграции, по умолчанию MIGRATIONS.
+    backup - файл, в который перед изменениями сохраняется копия базы
+    данных; копия делается, только если база данных не пуста и есть
+    шаги для применения.
+
+    Returns
+    -------
+    Версия схемы после обновления.
+    """
+    steps = MIGRATIONS if migrations is None else migrations
+    target = len(steps)
+    with pool.transaction() as con:
+        current: int = con.execute('PRAGMA user_version').fetchone()[0]
+        if current > target:
+            raise RuntimeError(f'database schema version {current} is newer '
+                               f'than supported version {target}')
+        if current == target:
+            return current
+        empty = con.execute('SELECT count(*) FROM sqlite_master').fetchone()[0] == 0
+        if backup is not None and not empty:
+            # транзакция уже удерживает блокировку записи, поэтому копия
+            # через отдельное соединение соответствует версии current
+            backup_database(pool.db_file, backup)
+        for step in steps[current:]:
+            step.apply(pool)
+        con.execute(f'PRAGMA user_version = {target}')
+    return target
+
+
+if __name__ == '__main__':
+    for path in sys.argv[1:] or ['main_db.db']:
+        with ConnectionPool(path) as db_pool:
+            upgrade(db_pool, backup=f'{path}.bak')
@@ -0,0 +1,190 @@
+"""
+Модуль описывает запросы к репозиторию с произвольными условиями
+
+Запрос (Query) состоит из условий на поля (Condition), объединенных
+через И, сортировки, ограничения количества записей и списка полей,
+которые нужно вернуть. Запрос составляется цепочкой вызовов:
+
+    Query().where('amount', '>=', 100).where('category', 'in', [1, 2])
+           .order('expense_date', descending=True).take(10)
+
+Условия сравниваются, как в SQL: значение None не удовлетворяет
+никакому сравнению, кроме 'is null'.
+"""
+
+from dataclasses import dataclass, replace
+from itertools import islice
+from operator import eq, ge, gt, le, lt, ne
+from typing import Any, Callable, Iterable
+
+_COMPARISONS: dict[str, Callable[[Any, Any], Any]] = {
+    '=': eq, '!=': ne, '<': lt, '<=': le, '>': gt, '>=': ge,
+}
+OPERATORS = tuple(_COMPARISONS) + ('in', 'between', 'is null', 'is not null',
+                                   'prefix')
+
+
+def prefix_end(prefix: str) -> str | None:
+    """
+    Наименьшая строка, которая больше всех строк, начинающихся с prefix,
+    для поиска по префиксу как по диапазону [prefix, prefix_end(prefix)).
+
+    Returns
+    -------
+    Строка или None, если такой строки нет (все строки не меньше prefix
+    начинаются с него).
+    """
+    while prefix:
+        code = ord(prefix[-1]) + 1
+        if 0xD800 <= code <= 0xDFFF:
+            code = 0xE000
+        if code <= 0x10FFFF:
+            return prefix[:-1] + chr(code)
+        prefix = prefix[:-1]
+    return None
+
+
+def nulls_first(field: str) -> Callable[[Any], tuple[bool, Any]]:
+    """
+    Ключ сортировки объектов по полю field, при котором значения None
+    идут первыми, как в SQLite, и не сравниваются с остальными.
+    """
+    def key(obj: Any) -> tuple[bool, Any]:
+        value = getattr(obj, field)
+        return value is not None, value
+    return key
+
+
+@dataclass(frozen=True)
+class Condition:
+    """
+    Условие на значение поля.
+    field - название поля
+    op - операция из OPERATORS; '=' и '!=' с None означают
+    'is null' и 'is not null'
+    value - значение для сравнения; для 'in' - набор значений,
+    для 'between' - пара (начало, конец) включительно, для 'prefix' - строка
+    """
+    field: str
+    op: str
+    value: Any = None
+
+    def __post_init__(self) -> None:
+        if self.op not in OPERATORS:
+            raise ValueError(f'unknown operator {self.op!r}, '
+                             f'expected one of {", ".join(OPERATORS)}')
+        if self.value is None and self.op in ('=', '!='):
+            object.__setattr__(self, 'op', 'is null' if self.op == '=' else 'is not null')
+        elif self.op == 'in':
+            object.__setattr__(self, 'value', tuple(self.value))
+        elif self.op == 'between':
+            start, end = self.value
+            if start is None or end is None:
+                raise ValueError('between bounds must not be None')
+            object.__setattr__(self, 'value', (start, end))
+        elif self.op == 'prefix' and not isinstance(self.value, str):
+            raise ValueError(f'prefix must be a string, got {self.value!r}')
+        elif self.op in _COMPARISONS and self.value is None:
+            raise ValueError(f'cannot compare {self.field} with None using {self.op}')
+
+    def matches(self, obj: Any) -> bool:
+        """ Удовлетворяет ли объект условию """
+        value = getattr(obj, self.field)
+        if self.op == 'is null':
+            return value is None
+        if value is None:
+            return False
+        if self.op == 'is not null':
+            return True
+        try:
+            if self.op == 'in':
+                return value in self.value
+            if self.op == 'between':
+                return bool(self.value[0] <= value <= self.value[1])
+            if self.op == 'prefix':
+                return isinstance(value, str) and value.startswith(self.value)
+            return bool(_COMPARISONS[self.op](value, self.value))
+        except TypeError:
+            # значения несравнимых типов не удовлетворяют условию
+            return False
+
+
+@dataclass(frozen=True)
+class Query:
+    """
+    Запрос к репозиторию, см. AbstractRepository.query.
+    conditions - условия, которым должны удовлетворять все записи
+    order_by - поле для сортировки, по умолчанию порядок по pk;
+    при равных значениях записи упорядочены по pk, значения None идут
+    первыми при сортировке по возрастанию
+    descending - сортировать по убыванию
+    limit - максимальное количество записей, None - без ограничения
+    fields - поля, значения которых нужно вернуть кортежами вместо
+    объектов, None - вернуть объекты
+    """
+    conditions: tuple[Condition, ...] = ()
+    order_by: str | None = None
+    descending: bool = False
+    limit: int | None = None
+    fields: tuple[str, ...] | None = None
+
+    def __post_init__(self) -> None:
+        if self.limit is not None and self.limit < 0:
+            raise ValueError(f'limit must not be negative, got {self.limit}')
+        if self.fields is not None and not self.fields:
+            raise ValueError('at least one field must be selected')
+
+    def where(self, field: str, op: str, value: Any = None) -> 'Query':
+        """ Запрос с дополнительным условием Condition(field, op, value) """
+        return replace(self, conditions=self.conditions + (Condition(field, op, value),))
+
+    def order(self, field: str, descending: bool = False) -> 'Query':
+        """ Запрос с сортировкой по полю field """
+        return replace(self, order_by=field, descending=descending)
+
+    def take(self, limit: int | None) -> 'Query':
+        """ Запрос, возвращающий не больше limit записей """
+        return replace(self, limit=limit)
+
+    def only(self, *fields: str) -> 'Query':
+        """ Запрос, возвращающий кортежи значений полей fields """
+        return replace(self, fields=fields)
+
+    @property
+    def ordered_by_pk(self) -> bool:
+        """ Сортируются ли записи только по pk """
+        return self.order_by is None or self.order_by == 'pk'
+
+    def matches(self, obj: Any) -> bool:
+        """ Удовлетворяет ли объект всем условиям """
+        return all(condition.matches(obj) for condition in self.conditions)
+
+    def project(self, objs: Iterable[Any]) -> list[Any]:
+        """ Объекты или кортежи значений полей fields """
+        if self.fields is None:
+            return list(objs)
+        fields = self.fields
+        return [tuple(getattr(obj, name) for name in fields) for obj in objs]
+
+    def apply(self, objs: Iterable[Any], ordered: bool = False) -> list[Any]:
+        """
+        Выполнить запрос над объектами.
+
+        Parameters
+        ----------
+        objs - объекты в порядке pk или, если ordered, уже в порядке запроса
+        ordered - объекты уже упорядочены, как требует запрос
+
+        Returns
+        -------
+        Результат запроса.
+        """
+        matching = filter(self.matches, objs)
+        if ordered or (self.ordered_by_pk and not self.descending):
+            return self.project(islice(matching, self.limit))
+        selected = list(matching)
+        if self.descending:
+            selected.reverse()
+        if not self.ordered_by_pk:
+            selected.sort(key=nulls_first(str(self.order_by)), reverse=self.descending)
+        return self.project(selected[:self.limit])
@@ -1,13 +1,150 @@
 """
 Репозиторий для хранения данных в базе данных sqlite3
 """
-from typing import Any
+import atexit
+import sqlite3
+import threading
+from dataclasses import dataclass
+from types import NoneType, UnionType
+from typing import Any, Callable, ContextManager, Iterable, Iterator, Sequence, \
+    Union, get_args, get_origin
 from inspect import get_annotations
-from datetime import datetime
+from datetime import date, datetime
 
-import sqlite3
+from bookkeeper.repository.abstract_repository import AbstractRepository, T, \
+    check_aggregate
+from bookkeeper.repository.connection import ConnectionPool, SQLiteProfile
+from bookkeeper.repository.query import Condition, Query, prefix_end
+
+
+Decoder = Callable[[Any], Any]
+# предельное количество запомненных текстов запросов одного репозитория
+_MAX_STATEMENTS = 256
+
+
+def _to_datetime(value: Any) -> datetime:
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value)
+
+
+def _to_date(value: Any) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.fromisoformat(value).date()
+
+
+def _unwrap_optional(annotation: Any) -> Any:
+    """ X | None -> X """
+    if get_origin(annotation) in (Union, UnionType):
+        args = [arg for arg in get_args(annotation) if arg is not NoneType]
+        return args[0] if len(args) == 1 else Any
+    return annotation
+
+
+_DECODERS: dict[Any, Decoder] = {
+    int: int,
+    float: float,
+    str: str,
+    datetime: _to_datetime,
+    date: _to_date,
+}
+
+
+def make_decoder(annotation: Any) -> Decoder | None:
+    """
+    Подобрать функцию, приводящую значение из БД к типу поля модели.
+    Для необязательных полей (X | None) используется функция для типа X,
+    значение None функции не передается.
+
+    Parameters
+    ----------
+    annotation - аннотация типа поля модели.
+
+    Returns
+    -------
+    Функция преобразования или None, если значение не нужно преобразовывать.
+    """
+    return _DECODERS.get(_unwrap_optional(annotation))
+
+
+def _date_only(value: Any) -> Any:
+    return value.date() if isinstance(value, datetime) else value
 
-from bookkeeper.repository.abstract_repository import AbstractRepository, T
+
+_ENCODERS: dict[Any, Decoder] = {
+    date: _date_only,
+}
+
+
+def make_encoder(annotation: Any) -> Decoder | None:
+    """
+    Подобрать функцию, приводящую значение поля модели к виду, в котором
+    оно хранится в БД: datetime в поле с типом date записывается как дата,
+    чтобы значения столбца DATE имели один формат.
+
+    Parameters
+    ----------
+    annotation - аннотация типа поля модели.
+
+    Returns
+    -------
+    Функция преобразования или None, если значение не нужно преобразовывать.
+    """
+    return _ENCODERS.get(_unwrap_optional(annotation))
+
+
+_COLUMN_TYPES: dict[Any, str] = {
+    int: 'INTEGER',
+    float: 'REAL',
+    str: 'TEXT',
+    datetime: 'TIMESTAMP',
+    date: 'DATE',
+}
+
+
+def column_type(annotation: Any) -> str:
+    """
+    Подобрать тип столбца sqlite3 для поля модели.
+
+    Parameters
+    ----------
+    annotation - аннотация типа поля модели.
+
+    Returns
+    -------
+    Название типа столбца или пустая строка для неизвестных типов.
+    """
+    return _COLUMN_TYPES.get(_unwrap_optional(annotation), '')
+
+
+# Выражения sqlite3 для начала календарного периода, см. period_start
+_PERIOD_EXPRESSIONS = {
+    'day': "date({})",
+    'week': "date({}, 'weekday 0', '-6 days')",
+    'month': "date({}, 'start of month')",
+}
+
+
+@dataclass(frozen=True)
+class WriteBehind:
+    """
+    Настройки отложенной записи SQLiteRepository.
+    batch_size - количество изменений в очереди, при котором фоновый
+    поток записывает ее, не дожидаясь flush_interval
+    flush_interval - период записи очереди фоновым потоком в секундах
+    reserve_size - количество pk, резервируемых за одно обращение к БД
+    """
+    batch_size: int = 100
+    flush_interval: float = 1.0
+    reserve_size: int = 1000
+
+    def __post_init__(self) -> None:
+        for name in ('batch_size', 'flush_interval', 'reserve_size'):
+            if getattr(self, name) <= 0:
+                raise ValueError(f'{name} must be positive, got {getattr(self, name)}')
 
 
 class SQLiteRepository(AbstractRepository[T]):
@@ -18,13 +155,123 @@ class SQLiteRepository(AbstractRepository[T]):
         ----------
         db_file - файл, содержущий базу данных
         cls - модель, описывающая данные
+        pool - пул соединений, общий для нескольких репозиториев;
+        если не задан, репозиторий создает собственный пул
+        indexes - индексы таблицы: название поля или последовательность
+        названий для составного индекса
+        create_schema - создать таблицу и индексы, если их нет
+        profile - настройки производительности для собственного пула;
+        при передаче общего пула используются его настройки
+        write_behind - включить отложенную запись с заданными настройками
+        reader - пул соединений только для чтения (read_only) к той же БД;
+        если задан, запросы вне транзакции пула pool выполняются через него
+        и не ждут пишущих транзакций
+
+    Текст запросов CRUD составляется один раз при создании репозитория,
+    запросы с условиями - один раз для каждого вида условия (набора полей,
+    сортировки и т.п.); значения всегда передаются параметрами. Поэтому
+    каждый запрос подготавливается sqlite3 один раз и затем берется
+    из кэша выражений соединения (см. ConnectionPool.statement_cache_hits).
+
+    В режиме отложенной записи add и update не обращаются к БД: pk
+    выдается из заранее зарезервированного диапазона (в sqlite_sequence,
+    поэтому таблица должна быть объявлена с AUTOINCREMENT), а изменения
+    ставятся в очередь, которую фоновый поток записывает одной транзакцией.
+    Очередь также записывается методом flush, перед каждым чтением
+    и удалением (репозиторий видит собственные изменения) и при закрытии
+    репозитория - с синхронизацией с диском. Внутри транзакции пула
+    очередь записывается в эту транзакцию, а изменения выполняются сразу.
+
+    Внутри блока snapshot все чтения (в том числе других репозиториев
+    с тем же пулом для чтения) видят одно зафиксированное состояние БД:
+    изменения, сделанные несколькими запросами одной транзакции, видны
+    либо все, либо ни одно.
     """
-    def __init__(self, db_file: str, cls: type):
+    def __init__(self, db_file: str, cls: type,
+                 pool: ConnectionPool | None = None,
+                 indexes: Iterable[str | Sequence[str]] = (),
+                 create_schema: bool = True,
+                 profile: SQLiteProfile | None = None,
+                 write_behind: WriteBehind | None = None,
+                 reader: ConnectionPool | None = None):
         self.cls: type = cls
         self.db_file: str = db_file
         self.table_name: str = cls.__name__.lower()
         self.fields = get_annotations(cls, eval_str=True)
+        self.columns: list[str] = list(self.fields)
+        self._decoders: list[Decoder | None] = [
+            make_decoder(self.fields[name]) for name in self.columns]
+        self._select_query: str = (f'SELECT {", ".join(self.columns)} '
+                                   f'FROM {self.table_name}')
         self.fields.pop('pk')
+        self._encoders: list[tuple[str, Decoder | None]] = [
+            (name, make_encoder(annotation)) for name, annotation in self.fields.items()]
+        assignments = ', '.join(f'{name} = ?' for name in self.fields)
+        self._update_query: str = (f'UPDATE {self.table_name} SET {assignments} '
+                                   f'WHERE pk = ?')
+        self._insert_query: str = (
+            f'INSERT INTO {self.table_name} ({", ".join(self.fields)}) '
+            f'VALUES ({", ".join("?" * len(self.fields))})')
+        self._insert_pk_query: str = (
+            f'INSERT INTO {self.table_name} (pk, {", ".join(self.fields)}) '
+            f'VALUES ({", ".join("?" * (len(self.fields) + 1))})')
+        self._get_query: str = f'{self._select_query} WHERE pk = ?'
+        self._delete_query: str = f'DELETE FROM {self.table_name} WHERE pk = ?'
+        self._statements: dict[tuple[Any, ...], str] = {}
+        self._owns_pool: bool = pool is None
+        self.pool: ConnectionPool = (ConnectionPool(db_file, profile=profile)
+                                     if pool is None else pool)
+        self.reader: ConnectionPool | None = reader
+        self._external_version: int | None = None
+        self.indexes: list[tuple[str, ...]] = []
+        for index in indexes:
+            names = (index,) if isinstance(index, str) else tuple(index)
+            for name in names:
+                self._check_field(name)
+            self.indexes.append(names)
+        if create_schema:
+            self.create_schema()
+        self.write_behind: WriteBehind | None = write_behind
+        self._inserts: dict[int, list[Any]] = {}
+        self._updates: dict[int, list[Any]] = {}
+        self._next_pk = self._end_pk = 0
+        # порядок захвата: _reserve_lock, блокировка записи БД, _flush_lock,
+        # _queue_lock; поток, ждущий блокировку БД, не держит _flush_lock,
+        # поэтому транзакция пула может записать очередь сама
+        self._reserve_lock = threading.Lock()
+        self._queue_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flushing = 0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._flusher: threading.Thread | None = None
+        if write_behind is not None:
+            self._check_autoincrement()
+            self._flusher = threading.Thread(
+                target=self._run_flusher, name=f'{self.table_name}-flusher',
+                daemon=True)
+            self._flusher.start()
+            atexit.register(self.close)
+
+    def create_schema(self) -> None:
+        """
+        Создать таблицу по аннотациям модели и объявленные индексы,
+        если они еще не существуют. Существующая таблица не изменяется.
+
+        Returns
+        -------
+        None
+        """
+        columns = ', '.join('pk INTEGER PRIMARY KEY AUTOINCREMENT' if name == 'pk'
+                            else f'{name} {column_type(annotation)}'.rstrip()
+                            for name, annotation in get_annotations(
+                                self.cls, eval_str=True).items())
+        with self.pool.write() as con:
+            con.execute(f'CREATE TABLE IF NOT EXISTS {self.table_name} ({columns})')
+            for names in self.indexes:
+                con.execute(f'CREATE INDEX IF NOT EXISTS '
+                            f'{self.table_name}_{"_".join(names)}_idx '
+                            f'ON {self.table_name} ({", ".join(names)})')
 
     def add(self, obj: T) -> int:
         """
@@ -40,45 +287,70 @@ class SQLiteRepository(AbstractRepository[T]):
         """
         if getattr(obj, 'pk', None) != 0:
             raise ValueError(f'trying to add object {obj} with filled `pk` attribute')
-        names = ', '.join(self.fields.keys())
-        placeholders = ', '.join('?' * len(self.fields))
-        values = [getattr(obj, i) for i in self.fields]
-        with sqlite3.connect(self.db_file) as con:
-            cur = con.cursor()
-            cur.execute('PRAGMA foreign_keys = ON')
-            cur.execute(f'INSERT INTO {self.table_name} ({names}) '
-                        f'VALUES ({placeholders})', values)
-            con.commit()
+        if self._queue_writes():
+            return self._enqueue_add([obj])[0]
+        values = self._values(obj)
+        with self.pool.write() as con:
+            cur = con.execute(self._insert_query, values)
             obj.pk = cur.lastrowid
-        con.close()
+        self._notify('add', [obj.pk])
         return obj.pk
 
-    def convert_object_datetime(self, temp: list[T] | tuple[T]) -> tuple[T]:
+    def add_many(self, objs: Iterable[T]) -> list[int]:
         """
-        Конвертация элементов объекта к нужным типам данных, в частности datetime.
+        Добавление нескольких объектов в базу данных одной транзакцией.
+        Идентификаторы выдаются подряд, так как на время вставки
+        транзакция удерживает блокировку записи.
 
         Parameters
         ----------
-        temp - список или кортеж элементов объекта
+        objs - объекты, которые необходимо добавить в БД.
 
         Returns
         -------
-        Кортеж элементов, приведенных к нужным типам данных.
+        Список идентификаторов объектов в порядке их следования.
         """
-        obj = self.cls(*temp)
-        converted_temp: tuple = tuple()
-        for i, elem in enumerate(temp):
-            try:
-                converted_temp += (list(obj.__annotations__.values())[i](elem),)
-            except TypeError:
-                if isinstance(elem, datetime):
-                    converted_temp += (list(obj.__annotations__.values(
-                    ))[i].strptime(elem, '%Y-%m-%d %H:%M:%S'),)
-                elif temp[i] is None:
-                    converted_temp += (elem,)
-                else:
-                    converted_temp += (type(elem)(elem),)
-        return converted_temp
+        objs = list(objs)
+        for obj in objs:
+            if getattr(obj, 'pk', None) != 0:
+                raise ValueError(f'trying to add object {obj} with filled `pk` attribute')
+        if not objs:
+            return []
+        if self._queue_writes():
+            return self._enqueue_add(objs)
+        values = [self._values(obj) for obj in objs]
+        with self.pool.write() as con:
+            con.executemany(self._insert_query, values)
+            last_pk = con.execute('SELECT last_insert_rowid()').fetchone()[0]
+        first_pk = last_pk - len(objs) + 1
+        pks = list(range(first_pk, last_pk + 1))
+        for obj, pk in zip(objs, pks):
+            obj.pk = pk
+        self._notify('add', pks)
+        return pks
+
+    def _values(self, obj: T) -> list[Any]:
+        """ Значения полей объекта (без pk) в порядке столбцов для записи в БД """
+        return [getattr(obj, name) if encode is None or getattr(obj, name) is None
+                else encode(getattr(obj, name)) for name, encode in self._encoders]
+
+    def _decode(self, row: tuple[Any, ...]) -> T:
+        """
+        Создание объекта модели из строки таблицы. Каждое значение
+        приводится к типу соответствующего поля заранее подобранной функцией.
+
+        Parameters
+        ----------
+        row - строка таблицы, столбцы в порядке полей модели.
+
+        Returns
+        -------
+        Объект модели.
+        """
+        values = [value if decode is None or value is None else decode(value)
+                  for decode, value in zip(self._decoders, row)]
+        obj: T = self.cls(*values)
+        return obj
 
     def get(self, pk: int) -> T | None:
         """
@@ -92,14 +364,75 @@ class SQLiteRepository(AbstractRepository[T]):
         -------
         Объект, соответствующий идентификатору, или None, если объект не найден
         """
-        with sqlite3.connect(self.db_file) as con:
-            cur = con.cursor()
-            res = cur.execute(f'SELECT * FROM {self.table_name} WHERE pk = {pk}')
-            temp = res.fetchone()
-        con.close()
+        self.flush()
+        with self._read_connection() as con:
+            temp = con.execute(self._get_query, (pk,)).fetchone()
         if temp is None:
             return None
-        return self.cls(*self.convert_object_datetime(temp))
+        return self._decode(temp)
+
+    def _read_connection(self) -> ContextManager[sqlite3.Connection]:
+        """
+        Соединение для чтения: внутри транзакции пула для записи - ее
+        соединение (транзакция видит собственные изменения), иначе -
+        соединение пула для чтения, если он задан.
+        """
+        if self.reader is None or self.pool.in_transaction:
+            return self.pool.connection()
+        return self.reader.connection()
+
+    def _check_field(self, name: str) -> None:
+        """
+        Проверить, что поле есть в таблице. Названия полей подставляются
+        в текст запроса, поэтому произвольные строки не допускаются.
+        """
+        if name not in self.columns:
+            raise ValueError(f'unknown field {name!r} in table {self.table_name}')
+
+    def _statement(self, key: tuple[Any, ...], build: Callable[[], str]) -> str:
+        """
+        Текст запроса вида key: составляется функцией build при первом
+        обращении и затем берется из словаря. Переполненный словарь
+        очищается целиком.
+        """
+        query = self._statements.get(key)
+        if query is None:
+            if len(self._statements) >= _MAX_STATEMENTS:
+                self._statements.clear()
+            query = self._statements[key] = build()
+        return query
+
+    def _where_clause(self, where: dict[str, Any] | None) -> tuple[str, list[Any]]:
+        """
+        Преобразование условия в параметризованное выражение WHERE.
+        Значение None сравнивается через IS NULL.
+
+        Parameters
+        ----------
+        where - условие в виде словаря {'название_поля': значение}.
+
+        Returns
+        -------
+        Кортеж из выражения (пустая строка, если условия нет)
+        и списка параметров к нему.
+        """
+        if not where:
+            return '', []
+        shape = tuple((name, value is None) for name, value in where.items())
+
+        def build() -> str:
+            conditions = []
+            for name, is_null in shape:
+                self._check_field(name)
+                conditions.append(f'{name} IS NULL' if is_null else f'{name} = ?')
+            return ' WHERE ' + ' AND '.join(conditions)
+        condition = self._statement(('where',) + shape, build)
+        return condition, [value for value in where.values() if value is not None]
+
+    @staticmethod
+    def _and(condition: str, extra: str) -> str:
+        """ Добавить к выражению WHERE (возможно, пустому) еще одно условие """
+        return f'{condition} AND {extra}' if condition else f' WHERE {extra}'
 
     def get_all(self, where: dict[str, Any] | None = None) -> list[T]:
         """
@@ -111,30 +444,297 @@ class SQLiteRepository(AbstractRepository[T]):
         where - условие для поиска записей, например,
         поиск по конкретному имени (con_name) выглядит так:
         where = {'name': con_name}.
+        Фильтрация выполняется средствами СУБД, в объекты
+        преобразуются только подходящие записи.
 
         Returns
         -------
         Список объектов, содержащихся в БД.
         """
-        with sqlite3.connect(self.db_file) as con:
-            cur = con.cursor()
-            res = cur.execute(f'SELECT * FROM {self.table_name}')
-        if where is None:
-            return [self.cls(*self.convert_object_datetime(temp))
-                    for temp in res.fetchall()]
-        objs = []
-        for temp in res.fetchall():
-            obj = self.cls(*self.convert_object_datetime(temp))
-            if all([getattr(obj, attr) == value for attr, value in where.items()]):
-                objs.append(obj)
-        con.close()
-        return objs
+        self.flush()
+        condition, params = self._where_clause(where)
+        query = self._statement(('get_all', condition),
+                                lambda: f'{self._select_query}{condition}')
+        with self._read_connection() as con:
+            rows = con.execute(query, params).fetchall()
+        return [self._decode(temp) for temp in rows]
+
+    def _order_clause(self, order_by: str | None, descending: bool) -> str:
+        """
+        Выражение ORDER BY: по заданному полю, затем по pk в том же направлении.
+        """
+        direction = ' DESC' if descending else ''
+        if order_by is None or order_by == 'pk':
+            return f' ORDER BY pk{direction}'
+        self._check_field(order_by)
+        return f' ORDER BY {order_by}{direction}, pk{direction}'
+
+    @staticmethod
+    def _after_clause(order_by: str, descending: bool, after_null: bool) -> str:
+        """
+        Условие на записи, следующие за ключом (значение, pk) в порядке
+        _order_clause, где NULL меньше любого значения.
+        after_null - значение ключа равно NULL (параметр только pk).
+        """
+        operator = '<' if descending else '>'
+        if order_by == 'pk':
+            return f'pk {operator} ?'
+        if after_null:
+            after = f'({order_by} IS NULL AND pk {operator} ?)'
+            return after if descending else f'({after} OR {order_by} IS NOT NULL)'
+        after = f'({order_by}, pk) {operator} (?, ?)'
+        return f'({after} OR {order_by} IS NULL)' if descending else after
+
+    def iter_all(self, where: dict[str, Any] | None = None,
+                 order_by: str | None = None, descending: bool = False,
+                 chunk_size: int = 1000) -> Iterator[T]:
+        """
+        Перебрать записи из БД, считывая их порциями.
+        Соединение занято, пока перебор не завершен или генератор не закрыт.
+
+        Parameters
+        ----------
+        where - условие для поиска записей, как в get_all.
+        order_by - поле для сортировки, по умолчанию порядок по pk.
+        descending - сортировать по убыванию.
+        chunk_size - количество строк, считываемых за одно обращение к БД.
+
+        Yields
+        -------
+        Объекты, содержащиеся в БД.
+        """
+        self.flush()
+        condition, params = self._where_clause(where)
+        query = self._statement(
+            ('iter_all', condition, order_by, descending),
+            lambda: f'{self._select_query}{condition}'
+                    f'{self._order_clause(order_by, descending)}')
+        with self._read_connection() as con:
+            cur = con.execute(query, params)
+            while rows := cur.fetchmany(chunk_size):
+                for row in rows:
+                    yield self._decode(row)
+
+    def get_page(self, order_by: str = 'pk', after_key: tuple[Any, int] | None = None,
+                 limit: int = 100, descending: bool = False,
+                 where: dict[str, Any] | None = None) -> list[T]:
+        """
+        Получить страницу записей, следующих в заданном порядке за ключом
+        after_key. Условие по ключу выполняется поиском по индексу,
+        поэтому стоимость не зависит от номера страницы.
+
+        Parameters
+        ----------
+        order_by - поле для сортировки; при равных значениях записи
+        упорядочены по pk.
+        after_key - пара (значение поля order_by, pk) последней записи
+        предыдущей страницы; None для первой страницы.
+        limit - максимальное количество записей на странице.
+        descending - сортировать по убыванию.
+        where - дополнительное условие, как в get_all.
+
+        Returns
+        -------
+        Список объектов не длиннее limit.
+        """
+        self.flush()
+        condition, params = self._where_clause(where)
+        after_null = after_key is not None and after_key[0] is None
+
+        def build() -> str:
+            order = self._order_clause(order_by, descending)
+            key_condition = condition
+            if after_key is not None:
+                key_condition = self._and(condition, self._after_clause(
+                    order_by, descending, after_null))
+            return f'{self._select_query}{key_condition}{order} LIMIT ?'
+        query = self._statement(('get_page', condition, order_by, descending,
+                                 after_key is not None, after_null), build)
+        if after_key is not None:
+            params.extend(after_key[1:] if order_by == 'pk' or after_null
+                          else after_key)
+        with self._read_connection() as con:
+            rows = con.execute(query, params + [limit]).fetchall()
+        return [self._decode(temp) for temp in rows]
+
+    def get_between(self, field: str, start: Any, end: Any,
+                    where: dict[str, Any] | None = None) -> list[T]:
+        """
+        Получить записи, у которых значение поля лежит в заданном диапазоне.
+        Выполняется как BETWEEN, поэтому при наличии индекса по полю
+        считываются только записи из диапазона.
+
+        Parameters
+        ----------
+        field - поле, по которому задан диапазон.
+        start - нижняя граница диапазона (включительно).
+        end - верхняя граница диапазона (включительно).
+        where - дополнительное условие, как в get_all.
+
+        Returns
+        -------
+        Список объектов, упорядоченный по полю field и pk.
+        """
+        self.flush()
+        condition, params = self._where_clause(where)
+
+        def build() -> str:
+            self._check_field(field)
+            return (f'{self._select_query}'
+                    f'{self._and(condition, f"{field} BETWEEN ? AND ?")}'
+                    f'{self._order_clause(field, False)}')
+        query = self._statement(('get_between', condition, field), build)
+        with self._read_connection() as con:
+            rows = con.execute(query, params + [start, end]).fetchall()
+        return [self._decode(temp) for temp in rows]
+
+    @staticmethod
+    def _condition_sql(condition: Condition) -> tuple[tuple[Any, ...], list[Any]]:
+        """
+        Вид условия (для составления и кэширования текста запроса)
+        и его параметры.
+        """
+        field, op, value = condition.field, condition.op, condition.value
+        if op in ('is null', 'is not null'):
+            return (field, op), []
+        if op == 'in':
+            # длина списка округляется вверх до степени двойки повторением
+            # последнего значения, чтобы число разных запросов было небольшим
+            if not value:
+                return (field, op, 0), []
+            size = 1 << (len(value) - 1).bit_length()
+            return (field, op, size), list(value) + [value[-1]] * (size - len(value))
+        if op == 'between':
+            return (field, op), list(value)
+        if op == 'prefix':
+            end = prefix_end(value)
+            return (field, op, end is None), [value] if end is None else [value, end]
+        return (field, op), [value]
+
+    def _condition_clause(self, shape: tuple[Any, ...]) -> str:
+        """ Выражение SQL для условия вида shape """
+        field, op = shape[:2]
+        self._check_field(field)
+        if op in ('is null', 'is not null'):
+            return f'{field} {op.upper()}'
+        if op == 'in':
+            return f'{field} IN ({", ".join("?" * shape[2])})' if shape[2] else '0'
+        if op == 'between':
+            return f'{field} BETWEEN ? AND ?'
+        if op == 'prefix':
+            return f'{field} >= ?' if shape[2] else f'{field} >= ? AND {field} < ?'
+        return f'{field} {op} ?'
+
+    def query(self, query: Query) -> list[Any]:
+        """
+        Выполнить запрос, см. AbstractRepository.query. Запрос
+        преобразуется в параметризованный SQL (поиск по префиксу -
+        в диапазон строк), поэтому условия, сортировка и ограничение
+        количества выполняются СУБД с использованием индексов,
+        а при выборе полей считываются только их столбцы.
+
+        Parameters
+        ----------
+        query - запрос.
+
+        Returns
+        -------
+        Список объектов или кортежей значений полей query.fields.
+        """
+        self.flush()
+        shapes, params = [], []
+        for condition in query.conditions:
+            shape, values = self._condition_sql(condition)
+            shapes.append(shape)
+            params.extend(values)
+        columns = self.columns if query.fields is None else list(query.fields)
+        if query.limit is not None:
+            params.append(query.limit)
+
+        def build() -> str:
+            for name in columns:
+                self._check_field(name)
+            conditions = ' AND '.join(map(self._condition_clause, shapes))
+            return (f'SELECT {", ".join(columns)} FROM {self.table_name}'
+                    f'{" WHERE " + conditions if conditions else ""}'
+                    f'{self._order_clause(query.order_by, query.descending)}'
+                    f'{"" if query.limit is None else " LIMIT ?"}')
+        sql = self._statement(('query', tuple(shapes), tuple(columns), query.order_by,
+                               query.descending, query.limit is None), build)
+        with self._read_connection() as con:
+            rows = con.execute(sql, params).fetchall()
+        if query.fields is None:
+            return [self._decode(row) for row in rows]
+        decoders = [self._decoders[self.columns.index(name)] for name in columns]
+        return [tuple(value if decode is None or value is None else decode(value)
+                      for decode, value in zip(decoders, row)) for row in rows]
+
+    def aggregate(self, func: str, field: str, group_by: Sequence[str] = (),
+                  period: str | None = None, date_field: str | None = None,
+                  date_range: tuple[Any, Any] | None = None,
+                  where: dict[str, Any] | None = None
+                  ) -> dict[tuple[Any, ...], int | float]:
+        """
+        Посчитать сумму или количество значений поля одним запросом GROUP BY,
+        не создавая объектов модели.
+
+        Parameters
+        ----------
+        func - 'sum' или 'count' (количество непустых значений).
+        field - поле, по которому считается результат.
+        group_by - поля, по значениям которых группируются записи.
+        period - календарный период 'day', 'week' или 'month'.
+        date_field - поле с датой для period и date_range.
+        date_range - диапазон значений date_field (включительно).
+        where - условие, как в get_all.
+
+        Returns
+        -------
+        Словарь {(начало периода, *значения group_by): результат};
+        без группировки - {(): результат}.
+        """
+        check_aggregate(func, period, date_field, date_range)
+        self.flush()
+        group_by = tuple(group_by)
+        condition, params = self._where_clause(where)
+
+        def build() -> str:
+            for name in (field,) + group_by:
+                self._check_field(name)
+            keys = list(group_by)
+            if period is not None:
+                self._check_field(str(date_field))
+                keys.insert(0, _PERIOD_EXPRESSIONS[period].format(date_field))
+            range_condition = condition
+            if date_range is not None:
+                self._check_field(str(date_field))
+                range_condition = self._and(condition, f'{date_field} BETWEEN ? AND ?')
+            value = f'coalesce(sum({field}), 0)' if func == 'sum' else f'count({field})'
+            query = (f'SELECT {", ".join(keys + [value])} '
+                     f'FROM {self.table_name}{range_condition}')
+            if keys:
+                query += f' GROUP BY {", ".join(keys)} HAVING count({field}) > 0'
+            return query
+        query = self._statement(('aggregate', func, field, group_by, period, date_field,
+                                 date_range is not None, condition), build)
+        decoders: list[Decoder | None] = [
+            self._decoders[self.columns.index(name)] for name in group_by]
+        if period is not None:
+            decoders.insert(0, date.fromisoformat)
+        if date_range is not None:
+            params.extend(date_range)
+        with self._read_connection() as con:
+            rows = con.execute(query, params).fetchall()
+        return {tuple(key if decode is None or key is None else decode(key)
+                      for decode, key in zip(decoders, row[:-1])): row[-1]
+                for row in rows}
 
     def update(self, obj: T) -> None:
         """
         Перезаписать конкретный объект в БД.
         При изменении объекта, не меняется его идентификатор,
         оставльные поля можно изменять.
+        Все поля записываются одним параметризованным запросом.
 
         Parameters
         ----------
@@ -146,20 +746,36 @@ class SQLiteRepository(AbstractRepository[T]):
         """
         if obj.pk == 0:
             raise ValueError('attempt to update object with unknown primary key')
-        names = list(self.fields.keys())
-        values = [getattr(obj, i) for i in self.fields]
-        pk = obj.pk
-        with sqlite3.connect(self.db_file) as con:
-            cur = con.cursor()
-            for i, elem in enumerate(names):
-                try:
-                    cur.execute(f'UPDATE {self.table_name} SET {elem}'
-                                f' = {repr(values[i])} WHERE pk = {pk}')
-                except sqlite3.OperationalError:
-                    cur.execute(f'UPDATE {self.table_name} SET {elem}'
-                                f' = {repr(str(values[i]))} WHERE pk = {pk}')
-            con.commit()
-        con.close()
+        if self._queue_writes():
+            self._enqueue_update([obj])
+            return
+        values = self._values(obj) + [obj.pk]
+        with self.pool.write() as con:
+            con.execute(self._update_query, values)
+        self._notify('update', [obj.pk])
+
+    def update_many(self, objs: Iterable[T]) -> None:
+        """
+        Перезаписать несколько объектов в БД одной транзакцией.
+
+        Parameters
+        ----------
+        objs - обновленные объекты, которые необходимо заменить в БД.
+
+        Returns
+        -------
+        None
+        """
+        objs = list(objs)
+        if any(obj.pk == 0 for obj in objs):
+            raise ValueError('attempt to update object with unknown primary key')
+        if self._queue_writes():
+            self._enqueue_update(objs)
+            return
+        values = [self._values(obj) + [obj.pk] for obj in objs]
+        with self.pool.write() as con:
+            con.executemany(self._update_query, values)
+        self._notify('update', [obj.pk for obj in objs])
 
     def delete(self, pk: int) -> None:
         """
@@ -173,11 +789,251 @@ class SQLiteRepository(AbstractRepository[T]):
         -------
         None
         """
-        with sqlite3.connect(self.db_file) as con:
-            cur = con.cursor()
-            cur.execute(f'DELETE FROM {self.table_name} WHERE pk = {pk}')
-            row_count = cur.rowcount
-            if row_count == 0:
-                raise KeyError
-            con.commit()
-        con.close()
+        self.flush()
+        with self.pool.write() as con:
+            if con.execute(self._delete_query, (pk,)).rowcount == 0:
+                raise KeyError(pk)
+        self._notify('delete', [pk])
+
+    def delete_many(self, pks: Iterable[int]) -> None:
+        """
+        Удалить несколько объектов из БД одной транзакцией.
+        Если хотя бы один объект не найден, ничего не удаляется.
+
+        Parameters
+        ----------
+        pks - идентификаторы объектов, подлежащих удалению.
+
+        Returns
+        -------
+        None
+        """
+        pks = list(pks)
+        self.flush()
+        with self.pool.write() as con:
+            cur = con.executemany(self._delete_query, [(pk,) for pk in pks])
+            if cur.rowcount != len(pks):
+                raise KeyError(pks)
+        self._notify('delete', pks)
+
+    def _check_autoincrement(self) -> None:
+        """ Резервировать pk можно только в таблице с AUTOINCREMENT """
+        with self.pool.connection() as con:
+            row = con.execute("SELECT sql FROM sqlite_master "
+                              "WHERE type = 'table' AND name = ?",
+                              (self.table_name,)).fetchone()
+        if row is None or 'AUTOINCREMENT' not in row[0].upper():
+            raise ValueError(f'write-behind mode requires table {self.table_name} '
+                             f'with AUTOINCREMENT primary key')
+
+    def _reserve_pks(self, count: int) -> tuple[int, int]:
+        """
+        Зарезервировать count идентификаторов, сдвинув счетчик sqlite_sequence.
+        Другие соединения и процессы получат pk после диапазона.
+
+        Returns
+        -------
+        Диапазон [начало, конец) зарезервированных идентификаторов.
+        """
+        with self.pool.write() as con:
+            row = con.execute('SELECT seq FROM sqlite_sequence WHERE name = ?',
+                              (self.table_name,)).fetchone()
+            last_pk = con.execute(f'SELECT coalesce(max(pk), 0) '
+                                  f'FROM {self.table_name}').fetchone()[0]
+            current = max(last_pk, 0 if row is None else row[0])
+            if row is None:
+                con.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)',
+                            (self.table_name, current + count))
+            else:
+                con.execute('UPDATE sqlite_sequence SET seq = ? WHERE name = ?',
+                            (current + count, self.table_name))
+        return current + 1, current + count + 1
+
+    def _queue_writes(self) -> bool:
+        """
+        Ставить ли изменения в очередь. Внутри транзакции пула очередь
+        записывается, а изменения выполняются сразу.
+        """
+        if self.write_behind is None:
+            return False
+        if self.pool.in_transaction:
+            self.flush()
+            return False
+        return True
+
+    def _enqueue_add(self, objs: list[T]) -> list[int]:
+        """ Выдать объектам pk из резерва и поставить их вставку в очередь """
+        assert self.write_behind is not None
+        pks = []
+        with self._reserve_lock:
+            for obj in objs:
+                if self._next_pk == self._end_pk:
+                    self._next_pk, self._end_pk = self._reserve_pks(
+                        self.write_behind.reserve_size)
+                obj.pk = self._next_pk
+                self._next_pk += 1
+                pks.append(obj.pk)
+            with self._queue_lock:
+                for obj in objs:
+                    self._inserts[obj.pk] = [obj.pk] + self._values(obj)
+                size = len(self._inserts) + len(self._updates)
+        self._notify('add', pks)
+        if size >= self.write_behind.batch_size:
+            self._wake.set()
+        return pks
+
+    def _enqueue_update(self, objs: list[T]) -> None:
+        """ Поставить обновление объектов в очередь """
+        assert self.write_behind is not None
+        with self._queue_lock:
+            for obj in objs:
+                values = self._values(obj)
+                if obj.pk in self._inserts:
+                    self._inserts[obj.pk] = [obj.pk] + values
+                else:
+                    self._updates[obj.pk] = values + [obj.pk]
+            size = len(self._inserts) + len(self._updates)
+        self._notify('update', [obj.pk for obj in objs])
+        if size >= self.write_behind.batch_size:
+            self._wake.set()
+
+    def flush(self, durable: bool = False) -> None:
+        """
+        Записать очередь отложенных изменений одной транзакцией.
+        Без отложенной записи ничего не делает. Если запись не удалась,
+        изменения остаются в очереди.
+
+        Parameters
+        ----------
+        durable - синхронизировать запись с диском независимо от профиля пула.
+
+        Returns
+        -------
+        None
+        """
+        if self.write_behind is None:
+            return
+        with self._queue_lock:
+            if not self._inserts and not self._updates and not self._flushing:
+                return
+        batch: tuple[dict[int, list[Any]], dict[int, list[Any]]] | None = None
+        try:
+            with self.pool.write(durable) as con:
+                if not self.pool.in_transaction:
+                    # блокировка записи берется до _flush_lock (см. __init__);
+                    # если другой поток записывает очередь, здесь ждем его фиксации
+                    con.execute('BEGIN IMMEDIATE')
+                with self._flush_lock:
+                    batch = self._take_queue()
+                    con.executemany(self._insert_pk_query, batch[0].values())
+                    con.executemany(self._update_query, batch[1].values())
+        except BaseException:
+            if batch is not None:
+                self._requeue(*batch)
+            raise
+        finally:
+            if batch is not None:
+                with self._queue_lock:
+                    self._flushing -= 1
+
+    def _take_queue(self) -> tuple[dict[int, list[Any]], dict[int, list[Any]]]:
+        """
+        Забрать очередь для записи. Пока запись не зафиксирована, flush
+        других потоков не считает очередь пустой.
+        """
+        with self._queue_lock:
+            inserts, self._inserts = self._inserts, {}
+            updates, self._updates = self._updates, {}
+            self._flushing += 1
+        return inserts, updates
+
+    def _requeue(self, inserts: dict[int, list[Any]],
+                 updates: dict[int, list[Any]]) -> None:
+        """ Вернуть в очередь изменения, которые не удалось записать """
+        with self._queue_lock:
+            for pk in inserts.keys() & self._updates.keys():
+                inserts[pk] = [pk] + self._updates.pop(pk)[:-1]
+            inserts.update(self._inserts)
+            updates.update(self._updates)
+            self._inserts, self._updates = inserts, updates
+
+    def _run_flusher(self) -> None:
+        """ Фоновый поток: записывает очередь по таймеру или по размеру """
+        assert self.write_behind is not None
+        while not self._stop.is_set():
+            self._wake.wait(self.write_behind.flush_interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            try:
+                self.flush()
+            except (sqlite3.Error, RuntimeError):
+                # изменения остались в очереди, попробуем в следующий раз
+                continue
+
+    def _notify(self, event: str, pks: list[int]) -> None:
+        """
+        Оповестить подписчиков об изменении после его фиксации. Если
+        транзакция пула откатывается, подписчики получают событие
+        'rollback' с теми же pk, чтобы сбросить сохраненные копии объектов.
+        """
+        self.pool.defer(lambda committed: self.changes.notify(
+            event if committed else 'rollback', pks))
+
+    def transaction(self) -> ContextManager[Any]:
+        """
+        Транзакция пула соединений (см. ConnectionPool.transaction):
+        к ней присоединяются все репозитории, использующие тот же пул.
+        """
+        return self.pool.transaction()
+
+    def snapshot(self) -> ContextManager[Any]:
+        """
+        Согласованный снимок для чтения, см. ConnectionPool.snapshot
+        (только в режиме журнала WAL, например, с DESKTOP_PROFILE; в других
+        режимах чтения внутри блока не закрепляются за одним соединением).
+        Отложенные изменения записываются до начала снимка.
+        """
+        self.flush()
+        return (self.reader or self.pool).snapshot()
+
+    def data_version(self) -> int:
+        """
+        Версия данных. Кроме изменений через этот репозиторий, учитываются
+        изменения, зафиксированные другими соединениями и процессами
+        (по PRAGMA data_version, без уточнения таблицы).
+
+        Returns
+        -------
+        Монотонно растущий номер версии.
+        """
+        external = self.pool.data_version()
+        if external != self._external_version:
+            self._external_version = external
+            self.changes.bump()
+        return self.changes.version
+
+    def close(self) -> None:
+        """
+        Закрыть соединения с БД, если репозиторий владеет своим пулом.
+        Общий пул, переданный в конструктор, закрывает его владелец.
+        В режиме отложенной записи остановить фоновый поток, записать
+        очередь с синхронизацией с диском и вернуть неиспользованные pk.
+
+        Returns
+        -------
+        None
+        """
+        if self._flusher is not None:
+            atexit.unregister(self.close)
+            self._stop.set()
+            self._wake.set()
+            self._flusher.join()
+            self._flusher = None
+            self.flush(durable=True)
+            with self.pool.write() as con:
+                con.execute('UPDATE sqlite_sequence SET seq = ? '
+                            'WHERE name = ? AND seq = ?',
+                            (self._next_pk - 1, self.table_name, self._end_pk - 1))
+        if self._owns_pool:
+            self.pool.close()
@@ -6,12 +6,15 @@ from bookkeeper.models.category import Category
 from bookkeeper.models.expense import Expense
 from bookkeeper.models.budget import Budget
 # from bookkeeper.repository.memory_repository import MemoryRepository
-from bookkeeper.repository.sqlite_repository import SQLiteRepository
+from bookkeeper.repository.connection import ConnectionPool
+from bookkeeper.repository.sqlite_repository import SQLiteRepository, WriteBehind
 # from bookkeeper.utils import read_tree
 
-cat_repo = SQLiteRepository[Category]('main_db.db', Category)
-exp_repo = SQLiteRepository[Expense]('main_db.db', Expense)
-bud_repo = SQLiteRepository[Budget]('main_db.db', Budget)
+pool = ConnectionPool('main_db.db')
+cat_repo = SQLiteRepository[Category]('main_db.db', Category, pool)
+exp_repo = SQLiteRepository[Expense]('main_db.db', Expense, pool,
+                                     write_behind=WriteBehind())
+bud_repo = SQLiteRepository[Budget]('main_db.db', Budget, pool)
 
 cats = '''
 продукты
@@ -46,3 +49,6 @@ while True:
         exp = Expense(int(amount), cat.pk)
         exp_repo.add(exp)
         print(exp)
+
+exp_repo.close()
+pool.close()
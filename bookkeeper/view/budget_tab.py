@@ -6,6 +6,7 @@ from PySide6 import QtWidgets, QtCore
 
 from bookkeeper.view.utils import LabeledInput, HistoryTable, LabeledBox
 from bookkeeper.repository.abstract_repository import AbstractRepository
+from bookkeeper.repository.query import Query
 from bookkeeper.models.budget import Budget
 from bookkeeper.models.expense import Expense
 
@@ -22,18 +23,14 @@ def start_date(period: int) -> datetime:
 
     Returns
     -------
-    Дата начала данного периода в формате YYYY-MM-DD.
+    Начало (полночь) первого дня данного периода.
     """
+    today = datetime.combine(date.today(), datetime.min.time())
     if period == 7:
-        return datetime.strptime(str(date.today() -
-                                     timedelta(days=datetime.weekday(
-                                         date.today()))), '%Y-%m-%d')
+        return today - timedelta(days=today.weekday())
     if period in [28, 29, 30, 31]:
-        return datetime.strptime(str(date.today() -
-                                     timedelta(days=int(datetime.strftime(
-                                         datetime.now(), '%d'))-1)),
-                                 '%Y-%m-%d')
-    return datetime.strptime(str(datetime.today().date()), '%Y-%m-%d')
+        return today.replace(day=1)
+    return today
 
 
 class ActiveBudgets(QtWidgets.QWidget):
@@ -44,7 +41,10 @@ class ActiveBudgets(QtWidgets.QWidget):
     В случае превышения ограничения, выдается окно с информацией о том,
     что пользователь обеднеет, если продолжит так тратить деньги.
 
-    Виджет обновляется каждые 0.5 секунды для обработки трат и новых бюджетов.
+    Виджет пересчитывается сразу после изменения трат или бюджетов
+    через репозитории, а раз в секунду проверяет версии данных
+    (изменения другими программами) и смену даты; если ничего
+    не изменилось, данные не перечитываются.
     """
     def __init__(self, exp_repo: AbstractRepository,
                  bud_repo: AbstractRepository[Budget], *args, **kwargs):
@@ -54,6 +54,7 @@ class ActiveBudgets(QtWidgets.QWidget):
         self.rows_columns = (('Day', 'Week', 'Month'), ('Paid', 'Limit'))
 
         self.data: list[list[int]] = []
+        self.versions: tuple[int, int, date] | None = None
         self.table = HistoryTable(self.rows_columns[0], self.rows_columns[1])
         self.set_data()
         if self.data[0][0] > self.data[0][1] or \
@@ -71,13 +72,43 @@ class ActiveBudgets(QtWidgets.QWidget):
                                                'th day of week'))
         self.layout.addWidget(self.table)
         self.setLayout(self.layout)
+        self.exp_repo.subscribe(self.handle_change)
+        self.bud_repo.subscribe(self.handle_change)
         self.timer = QtCore.QBasicTimer()
-        self.timer.start(500, self)
+        self.timer.start(1000, self)
+
+    def data_versions(self) -> tuple[int, int, date]:
+        """
+        Версии данных расходов и бюджетов и текущая дата: если они
+        не изменились, пересчитывать таблицу не нужно.
+
+        Returns
+        -------
+        Кортеж из версий репозиториев и сегодняшней даты.
+        """
+        return (self.exp_repo.data_version(), self.bud_repo.data_version(),
+                date.today())
+
+    def handle_change(self, _event: str, _pks: list[int]) -> None:
+        """
+        Обработчик изменений в репозиториях расходов и бюджетов.
+
+        Parameters
+        ----------
+        _event - тип изменения: 'add', 'update', 'delete' или 'rollback';
+        _pks - идентификаторы измененных записей (таблица пересчитывается
+        целиком, поэтому не используются).
+
+        Returns
+        -------
+        None
+        """
+        self.set_data()
 
     def timerEvent(self, event) -> None:
         """
         Библиотечная функция, нужна для работы таймера.
-        Вызывает функцию по таймеру.
+        По таймеру пересчитывает таблицу, если изменились данные или дата.
 
         Parameters
         ----------
@@ -87,35 +118,48 @@ class ActiveBudgets(QtWidgets.QWidget):
         -------
         None
         """
-        self.set_data()
+        if self.data_versions() != self.versions:
+            self.set_data()
 
     @QtCore.Slot()
     def set_data(self) -> None:
         """
         Подсчет трат за нужные периоды. Отрисовка таблицы бюджетов и трат.
-        Вызывается по таймеру. Актуальными ограничениями, считаются
+        Вызывается при изменении данных. Актуальными ограничениями, считаются
         последние записи в БД с нужной продолжительностью.
+        Суммы трат по дням считаются средствами БД и только начиная
+        с понедельника или первого числа месяца, смотря что раньше.
+        Бюджеты и траты читаются из одного снимка БД.
 
         Returns
         -------
         None
         """
+        self.versions = self.data_versions()
         data_bud = []
-        for i in [1, 7, 30]:
-            data_bud.append(self.bud_repo.get_all({'length': i})[::-1][0].amount)
-        got_exp = self.exp_repo.get_all()[::-1]
+        day_start, week_start, month_start = start_date(1), start_date(7), start_date(30)
+        with self.bud_repo.snapshot(), self.exp_repo.snapshot():
+            for i in [1, 7, 30]:
+                (amount,), = self.bud_repo.query(
+                    Query(descending=True).where('length', '=', i).take(1).only('amount'))
+                data_bud.append(amount)
+            daily_amounts = self.exp_repo.aggregate(
+                'sum', 'amount', period='day', date_field='expense_date',
+                date_range=(min(week_start, month_start), datetime.max))
         day_amount, week_amount, month_amount = 0, 0, 0
-        for exp in got_exp:
-            exp_date = datetime.strptime(exp.expense_date, '%Y-%m-%d %H:%M:%S')
-            if exp_date >= start_date(1):
-                month_amount += exp.amount
-                day_amount += exp.amount
-                week_amount += exp.amount
-            elif exp_date >= start_date(7):
-                month_amount += exp.amount
-                week_amount += exp.amount
-            elif exp_date >= start_date(30):
-                month_amount += exp.amount
+        for (exp_day,), total in daily_amounts.items():
+            # суммы расходов целые, aggregate объявлен для int и float
+            amount = int(total)
+            exp_date = datetime.combine(exp_day, datetime.min.time())
+            if exp_date >= day_start:
+                month_amount += amount
+                day_amount += amount
+                week_amount += amount
+            elif exp_date >= week_start:
+                month_amount += amount
+                week_amount += amount
+            elif exp_date >= month_start:
+                month_amount += amount
         self.data = [[day_amount, data_bud[0]],
                      [week_amount, data_bud[1]],
                      [month_amount, data_bud[2]]]
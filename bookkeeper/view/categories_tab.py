@@ -6,6 +6,7 @@ from PySide6 import QtWidgets, QtCore
 from bookkeeper.view.utils import LabeledInput, HistoryTable, \
     LabeledBox, add_del_buttons_widget
 from bookkeeper.repository.abstract_repository import AbstractRepository, T
+from bookkeeper.repository.query import Query
 from bookkeeper.models.category import Category
 from bookkeeper.models.expense import Expense
 
@@ -24,10 +25,8 @@ def parent_to_pk(repo: AbstractRepository[T], name: str) -> int | None:
     -------
     Индетификатор или None, если ни один объект не найден.
     """
-    try:
-        return repo.get_all({'name': name.lower()})[0].pk
-    except IndexError:
-        return None
+    found = repo.query(Query().where('name', '=', name.lower()).take(1).only('pk'))
+    return found[0][0] if found else None
 
 
 class CategoriesExists(QtWidgets.QWidget):
@@ -47,7 +46,7 @@ class CategoriesExists(QtWidgets.QWidget):
         self.columns = ('Category', 'Parent')
         self.data: list[list[str]] = []
         self.table = HistoryTable(columns=self.columns,
-                                  n_rows=len(self.cat_repo.get_all()))
+                                  n_rows=len(self.cat_repo.query(Query().only('pk'))))
         self.set_data()
         self.layout = QtWidgets.QVBoxLayout()
         self.layout.addWidget(QtWidgets.QLabel('Categories'))
@@ -70,7 +69,7 @@ class CategoriesExists(QtWidgets.QWidget):
         None
         """
         new_value = self.table.item(row, column).text().lower()
-        pk = self.cat_repo.get_all()[::-1][row].pk
+        pk = self.cat_repo.query(Query(descending=True).take(row + 1).only('pk'))[row][0]
         changed_row = self.cat_repo.get(pk)
         if column == 0:
             changed_row.name = new_value
@@ -86,16 +85,16 @@ class CategoriesExists(QtWidgets.QWidget):
 
     def set_data(self) -> None:
         """
-        Отрисовка таблицы существующих категорий.
+        Отрисовка таблицы существующих категорий. Категории читаются
+        из одного снимка БД, поэтому не ждут записи и не видят ее частично.
 
         Returns
         -------
         None
         """
         self.data = []
-        got_all = self.cat_repo.get_all()
-        if got_all:
-            for cat in got_all[::-1]:
+        with self.cat_repo.snapshot():
+            for cat in self.cat_repo.iter_all(descending=True):
                 try:
                     temp = [cat.name,
                             self.cat_repo.get(int(cat.parent)).name]
@@ -119,7 +118,8 @@ class CategoryManager(QtWidgets.QWidget):
         self.cat_ex = cat_ex
         self.cat_repo = cat_repo
         self.exp_repo = exp_repo
-        self.par_list = [cat.name for cat in self.cat_repo.get_all()][::-1]
+        self.par_list = [name for name, in self.cat_repo.query(
+            Query(descending=True).only('name'))]
         self.parent_choice = LabeledBox('Parent (if needed)', self.par_list)
         self.def_cat = 'Другое'
         self.parent_choice.box.setCurrentText(self.def_cat)
@@ -147,8 +147,8 @@ class CategoryManager(QtWidgets.QWidget):
         -------
         None
         """
-        self.par_list = [cat.name.capitalize() for
-                         cat in self.cat_repo.get_all()][::-1]
+        self.par_list = [name.capitalize() for name, in self.cat_repo.query(
+            Query(descending=True).only('name'))]
         self.parent_choice.box.clear()
         self.parent_choice.box.addItems(self.par_list)
         self.parent_choice.box.setCurrentText(self.def_cat)
@@ -185,6 +185,7 @@ class CategoryManager(QtWidgets.QWidget):
         Добавление: добавляет запись в репозиторий.
         Удаление: удаляет объект с заданными названием и родителем; все дочерние
         категории становятсяс дочерними для родительской категории.
+        Удаление и перенос расходов и подкатегорий выполняются одной транзакцией.
 
         Parameters
         ----------
@@ -209,14 +210,15 @@ class CategoryManager(QtWidgets.QWidget):
                                             'parent': parent_pk})[0].pk
             if cat_pk == 255:
                 return
-            self.cat_repo.delete(cat_pk)
-            for exp in self.exp_repo.get_all({'category': cat_pk}):
-                new_exp = Expense(exp.amount, int(parent_pk), exp.expense_date,
-                                  exp.added_date, exp.comment, exp.pk)
-                self.exp_repo.update(new_exp)
-            for cat in self.cat_repo.get_all({'parent': cat_pk}):
-                new_cat = Category(cat.name, parent_pk, cat.pk)
-                self.cat_repo.update(new_cat)
+            with self.exp_repo.transaction(), self.cat_repo.transaction():
+                self.cat_repo.delete(cat_pk)
+                self.exp_repo.update_many(
+                    Expense(exp.amount, int(parent_pk), exp.expense_date,
+                            exp.added_date, exp.comment, exp.pk)
+                    for exp in self.exp_repo.get_all({'category': cat_pk}))
+                self.cat_repo.update_many(
+                    Category(cat.name, parent_pk, cat.pk)
+                    for cat in self.cat_repo.get_all({'parent': cat_pk}))
 
     def add(self) -> None:
         """
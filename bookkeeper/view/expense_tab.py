@@ -7,6 +7,7 @@ from PySide6 import QtWidgets, QtCore
 from bookkeeper.view.utils import LabeledInput, HistoryTable, \
     LabeledBox, add_del_buttons_widget
 from bookkeeper.repository.abstract_repository import AbstractRepository
+from bookkeeper.repository.query import Query
 from bookkeeper.models.expense import Expense
 from bookkeeper.models.category import Category
 
@@ -19,16 +20,23 @@ class ExpenseHistory(QtWidgets.QWidget):
     нажатие клавиши Enter сохраняет изменения. Если ошибиться в формате данных
     (например, ввести 'сто' вместо 100), появится сообщение об ошибке,
     изменения не сохрянятся.
+    Расходы показываются от новых к старым и загружаются страницами
+    по page_size записей: следующая страница подгружается,
+    когда таблица прокручена до конца.
     """
     def __init__(self, exp_repo: AbstractRepository[Expense],
-                 cat_repo: AbstractRepository[Category], *args, **kwargs):
+                 cat_repo: AbstractRepository[Category],
+                 *args, page_size: int = 100, **kwargs):
         super().__init__(*args, **kwargs)
         self.exp_repo = exp_repo
         self.cat_repo = cat_repo
+        self.page_size = page_size
         self.columns = ('Date', 'Paid', 'Category', 'Comment')
-        self.table = HistoryTable(columns=self.columns,
-                                  n_rows=len(self.exp_repo.get_all()))
+        self.table = HistoryTable(columns=self.columns, n_rows=self.page_size)
         self.data: list[list[str]] = []
+        self.pks: list[int] = []
+        self.last_key: tuple[datetime, int] | None = None
+        self.exhausted = False
         self.set_data()
         self.layout = QtWidgets.QVBoxLayout()
         self.layout.addWidget(QtWidgets.QLabel('History'))
@@ -36,6 +44,7 @@ class ExpenseHistory(QtWidgets.QWidget):
         self.setLayout(self.layout)
 
         self.table.cellChanged.connect(self.handle_cell_changed)
+        self.table.verticalScrollBar().valueChanged.connect(self.handle_scroll)
 
     def handle_cell_changed(self, row: int, column: int) -> None:
         """
@@ -51,11 +60,10 @@ class ExpenseHistory(QtWidgets.QWidget):
         None
         """
         new_value = self.table.item(row, column).text()
-        pk = self.exp_repo.get_all()[::-1][row].pk
-        changed_row = self.exp_repo.get(pk)
+        changed_row = self.exp_repo.get(self.pks[row])
         try:
             if column == 0:
-                changed_row.added_date = datetime.strptime(new_value, '%Y-%m-%d %H:%M:%S')
+                changed_row.expense_date = datetime.fromisoformat(new_value)
             elif column == 1:
                 changed_row.amount = int(new_value)
             elif column == 2:
@@ -67,22 +75,64 @@ class ExpenseHistory(QtWidgets.QWidget):
         except (TypeError, ValueError):
             QtWidgets.QMessageBox.critical(self, 'Error', 'Wrong input!')
 
+    def handle_scroll(self, value: int) -> None:
+        """
+        Обработчик прокрутки таблицы. Загружает следующую страницу,
+        если таблица прокручена до конца.
+
+        Parameters
+        ----------
+        value - текущее положение полосы прокрутки.
+
+        Returns
+        -------
+        None
+        """
+        if value == self.table.verticalScrollBar().maximum():
+            self.load_page()
+
     def set_data(self) -> None:
         """
-        Отрисовка таблицы истории расходов.
+        Отрисовка таблицы истории расходов: загружается первая страница.
 
         Returns
         -------
         None
         """
         self.data = []
-        got_all = self.exp_repo.get_all()
-        if got_all:
-            for exp in got_all[::-1]:
-                temp = [exp.expense_date, exp.amount,
-                        self.cat_repo.get(int(exp.category)).name, exp.comment]
-                self.data.append(temp)
-        self.table.set_data(self.data)
+        self.pks = []
+        self.last_key = None
+        self.exhausted = False
+        self.load_page()
+
+    def load_page(self) -> None:
+        """
+        Загрузка следующей страницы расходов, более старых, чем уже показанные,
+        и добавление ее в конец таблицы. Расходы и их категории читаются
+        из одного снимка БД, поэтому не ждут записи и не видят ее частично.
+
+        Returns
+        -------
+        None
+        """
+        if self.exhausted:
+            return
+        with self.exp_repo.snapshot():
+            page = self.exp_repo.get_page('expense_date', self.last_key,
+                                          self.page_size, descending=True)
+            rows = [[exp.expense_date, exp.amount,
+                     self.cat_repo.get(int(exp.category)).name, exp.comment]
+                    for exp in page]
+        self.exhausted = len(page) < self.page_size
+        if page:
+            self.last_key = (page[-1].expense_date, page[-1].pk)
+        first_row = len(self.data)
+        self.data.extend(rows)
+        self.pks.extend(exp.pk for exp in page)
+        self.table.blockSignals(True)
+        self.table.setRowCount(len(self.data))
+        self.table.set_data(rows, first_row)
+        self.table.blockSignals(False)
 
 
 class ExpenseManager(QtWidgets.QWidget):
@@ -140,8 +190,8 @@ class ExpenseManager(QtWidgets.QWidget):
         -------
         None
         """
-        self.cat_list = [cat.name.capitalize() for
-                         cat in self.cat_repo.get_all()]
+        self.cat_list = [name.capitalize() for
+                         name, in self.cat_repo.query(Query().only('name'))]
         self.cat_choice.box.clear()
         self.cat_choice.box.addItems(self.cat_list)
         self.exp_hist.set_data()
@@ -163,8 +213,8 @@ class ExpenseManager(QtWidgets.QWidget):
             self.button_clicked.emit(int(self.paid_input.input.text()),
                                      str(self.cat_choice.box.currentText()),
                                      str(self.comm_input.input.text()),
-                                     str(datetime.strptime(self.date_input.text(),
-                                                           '%d.%m.%Y %H:%M')))
+                                     datetime.strptime(self.date_input.text(),
+                                                       '%d.%m.%Y %H:%M'))
             self.button_clicked.connect(self.edit_expense(
                 mode, int(self.paid_input.input.text()),
                 self.cat_choice.box.currentText(), self.comm_input.input.text(),
@@ -197,9 +247,9 @@ class ExpenseManager(QtWidgets.QWidget):
         if mode == 'add':
             self.exp_repo.add(exp)
         elif mode == 'delete':
-            exp_pk = self.exp_repo.get_all({'amount': amount,
-                                            'category': cat_pk,
-                                            'expense_date': str(date)})[0].pk
+            (exp_pk,), = self.exp_repo.query(
+                Query().where('amount', '=', amount).where('category', '=', cat_pk)
+                .where('expense_date', '=', date).take(1).only('pk'))
             self.exp_repo.delete(exp_pk)
 
     def cat_to_pk(self, cat: str) -> int:
@@ -214,7 +264,8 @@ class ExpenseManager(QtWidgets.QWidget):
         -------
         None
         """
-        return self.cat_repo.get_all({'name': cat.lower()})[0].pk
+        return self.cat_repo.query(
+            Query().where('name', '=', cat.lower()).take(1).only('pk'))[0][0]
 
     def add(self) -> None:
         """
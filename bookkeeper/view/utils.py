@@ -101,18 +101,19 @@ class HistoryTable(QtWidgets.QTableWidget):
             self.setVerticalHeaderLabels(rows)
         self.setHorizontalHeaderLabels(columns)
 
-    def set_data(self, data: list[list[int | str]]) -> None:
+    def set_data(self, data: list[list[int | str]], first_row: int = 0) -> None:
         """
         Заполнение таблицы.
 
         Parameters
         ----------
         data - данные, которыми заполняется таблица.
+        first_row - номер строки таблицы, с которой начинается заполнение.
 
         Returns
         -------
         None
         """
-        for i, row in enumerate(data):
+        for i, row in enumerate(data, first_row):
             for number, x in enumerate(row):
                 self.setItem(i, number, QtWidgets.QTableWidgetItem(str(x).capitalize()))
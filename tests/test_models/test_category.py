@@ -102,6 +102,12 @@ def test_create_from_tree(repo):
     assert c2.parent == c1.pk
 
 
+def test_create_from_tree_keeps_order(repo):
+    tree = [('a', None), ('a1', 'a'), ('a11', 'a1'), ('b', None), ('b1', 'b')]
+    Category.create_from_tree(tree, repo)
+    assert [c.name for c in repo.get_all()] == [name for name, _ in tree]
+
+
 def test_create_from_tree_error(repo):
     tree = [('1', 'parent'), ('parent', None)]
     with pytest.raises(KeyError):
@@ -18,3 +18,48 @@ def test_can_create_subclass():
 
     t = Test()
     assert isinstance(t, AbstractRepository)
+
+
+def test_default_batch_methods():
+    class Test(AbstractRepository):
+        def __init__(self):
+            self.calls = []
+
+        def add(self, obj):
+            self.calls.append(('add', obj))
+            return obj
+
+        def get(self, pk): pass
+        def get_all(self, where=None): pass
+        def update(self, obj): self.calls.append(('update', obj))
+        def delete(self, pk): self.calls.append(('delete', pk))
+
+    t = Test()
+    assert t.add_many([1, 2]) == [1, 2]
+    t.update_many([3])
+    t.delete_many([4, 5])
+    assert t.calls == [('add', 1), ('add', 2), ('update', 3),
+                       ('delete', 4), ('delete', 5)]
+
+
+def test_default_iter_all():
+    class Obj:
+        def __init__(self, pk, value):
+            self.pk = pk
+            self.value = value
+
+    objects = [Obj(1, 2), Obj(2, 1), Obj(3, 2)]
+
+    class Test(AbstractRepository):
+        def add(self, obj): pass
+        def get(self, pk): pass
+        def get_all(self, where=None): return list(objects)
+        def update(self, obj): pass
+        def delete(self, pk): pass
+
+    t = Test()
+    assert list(t.iter_all()) == objects
+    assert list(t.iter_all(descending=True)) == objects[::-1]
+    assert list(t.iter_all(order_by='value')) == [objects[1], objects[0], objects[2]]
+    assert list(t.iter_all(order_by='value', descending=True)) == \
+        [objects[2], objects[0], objects[1]]
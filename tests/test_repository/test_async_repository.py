@@ -0,0 +1,91 @@
+from bookkeeper.repository.async_repository import AsyncRepository, DatabaseWorker
+from bookkeeper.repository.memory_repository import MemoryRepository
+from bookkeeper.repository.sqlite_repository import SQLiteRepository
+from bookkeeper.models.category import Category
+
+import asyncio
+import threading
+import pytest
+
+
+@pytest.fixture
+def sqlite_repo(tmp_path):
+    repo = SQLiteRepository(str(tmp_path / 'async.db'), Category)
+    yield repo
+    repo.close()
+
+
+def test_crud(sqlite_repo):
+    async def main():
+        async with AsyncRepository(sqlite_repo) as repo:
+            pk = await repo.add(Category('a'))
+            assert await repo.get(pk) == Category('a', pk=pk)
+            await repo.update(Category('b', pk=pk))
+            assert await repo.get_all({'name': 'b'}) == [Category('b', pk=pk)]
+            await repo.delete(pk)
+            assert await repo.get(pk) is None
+            with pytest.raises(KeyError):
+                await repo.delete(pk)
+
+    asyncio.run(main())
+
+
+def test_bulk_and_queries(sqlite_repo):
+    async def main():
+        async with AsyncRepository(sqlite_repo) as repo:
+            pks = await repo.add_many(Category(str(i)) for i in range(5))
+            await repo.update_many([Category('x', pk=pks[0])])
+            page = await repo.get_page(limit=2)
+            assert [c.pk for c in page] == pks[:2]
+            assert len(await repo.get_between('name', '1', '3')) == 3
+            assert await repo.aggregate('count', 'pk') == {(): 5}
+            await repo.delete_many(pks[1:])
+            assert await repo.get_all() == [Category('x', pk=pks[0])]
+
+    asyncio.run(main())
+
+
+def test_iter_all_streams_in_chunks(sqlite_repo):
+    sqlite_repo.add_many(Category(str(i)) for i in range(7))
+
+    async def main():
+        async with AsyncRepository(sqlite_repo) as repo:
+            names = [c.name async for c in repo.iter_all(order_by='pk',
+                                                         descending=True,
+                                                         chunk_size=3)]
+            assert names == [str(i) for i in reversed(range(7))]
+            stream = repo.iter_all(chunk_size=2)
+            assert (await anext(stream)).name == '0'
+            await stream.aclose()
+            assert len(await repo.get_all()) == 7
+
+    asyncio.run(main())
+
+
+def test_requests_run_in_worker_thread_in_order():
+    class Recording(MemoryRepository):
+        def add(self, obj):
+            threads.add(threading.current_thread().name)
+            return super().add(obj)
+
+    threads = set()
+
+    async def main():
+        repo = AsyncRepository(Recording(), DatabaseWorker('db'))
+        pks = await asyncio.gather(*(repo.add(Category(str(i))) for i in range(20)))
+        assert pks == list(range(1, 21))
+        assert threads == {'db'}
+        repo.worker.close()
+
+    asyncio.run(main())
+
+
+def test_shared_worker_is_not_closed():
+    worker = DatabaseWorker()
+    repo = AsyncRepository(MemoryRepository(), worker)
+    repo.close()
+    assert not worker.closed
+    worker.close()
+    assert worker.closed
+    with pytest.raises(RuntimeError):
+        worker.submit(print)
@@ -0,0 +1,130 @@
+from bookkeeper.repository.cached_repository import CachedRepository
+from bookkeeper.repository.memory_repository import MemoryRepository
+from bookkeeper.repository.sqlite_repository import SQLiteRepository
+from bookkeeper.models.category import Category
+
+import pytest
+
+
+@pytest.fixture
+def inner():
+    return MemoryRepository()
+
+
+@pytest.fixture
+def repo(inner):
+    return CachedRepository(inner, max_items=2)
+
+
+def test_get_is_cached(repo, inner):
+    pk = inner.add(Category('a'))
+    assert repo.get(pk) == Category('a', pk=pk)
+    assert (repo.hits, repo.misses) == (0, 1)
+    assert repo.get(pk) is inner.get(pk)
+    assert (repo.hits, repo.misses) == (1, 1)
+    assert repo.get(pk + 1) is None
+    assert (repo.hits, repo.misses) == (1, 2)
+
+
+def test_lru_eviction(repo, inner):
+    pks = inner.add_many([Category(str(i)) for i in range(3)])
+    repo.get(pks[0])
+    repo.get(pks[1])
+    repo.get(pks[0])
+    repo.get(pks[2])
+    hits = repo.hits
+    repo.get(pks[0])
+    assert repo.hits == hits + 1
+    repo.get(pks[1])
+    assert repo.hits == hits + 1
+
+
+def test_get_all_is_cached(repo, inner):
+    inner.add_many([Category('a'), Category('b', 1)])
+    assert repo.get_all({'name': 'b'}) == [Category('b', 1, 2)]
+    assert repo.get_all({'name': 'b'}) == [Category('b', 1, 2)]
+    assert repo.get_all() == inner.get_all()
+    assert (repo.hits, repo.misses) == (1, 2)
+    repo.get(2)
+    assert repo.hits == 2
+
+
+def test_writes_invalidate(repo, inner):
+    cat = Category('a')
+    repo.add(cat)
+    assert repo.get_all({'name': 'b'}) == []
+    other = Category('b')
+    repo.add(other)
+    assert repo.get_all({'name': 'b'}) == [other]
+    repo.update(Category('c', pk=other.pk))
+    assert repo.get_all({'name': 'b'}) == []
+    assert repo.get(other.pk) == Category('c', pk=other.pk)
+    repo.delete(other.pk)
+    assert repo.get(other.pk) is None
+    repo.update_many([Category('d', pk=cat.pk)])
+    assert repo.get(cat.pk).name == 'd'
+    repo.delete_many([cat.pk])
+    assert repo.get_all() == []
+
+
+def test_unhashable_condition(repo, inner):
+    inner.add(Category('a'))
+    assert repo.get_all({'name': ['a']}) == []
+    assert repo.misses == 1
+
+
+def test_wraps_sqlite(tmp_path):
+    inner = SQLiteRepository(str(tmp_path / 'cache.db'), Category)
+    repo = CachedRepository(inner)
+    pk = repo.add(Category('a'))
+    assert repo.get(pk) == Category('a', pk=pk)
+    assert repo.hits == 1
+    assert list(repo.iter_all()) == [Category('a', pk=pk)]
+    assert repo.aggregate('count', 'pk') == {(): 1}
+    inner.close()
+
+
+def test_invalid_size(inner):
+    with pytest.raises(ValueError):
+        CachedRepository(inner, max_items=0)
+
+
+def test_writes_to_inner_invalidate(repo, inner):
+    cat = Category('a')
+    inner.add(cat)
+    assert repo.get_all({'name': 'b'}) == []
+    assert repo.get(cat.pk) is cat
+    inner.update(Category('b', pk=cat.pk))
+    assert repo.get_all({'name': 'b'}) == [Category('b', pk=cat.pk)]
+    assert repo.get(cat.pk).name == 'b'
+    version = repo.data_version()
+    inner.delete(cat.pk)
+    assert repo.get(cat.pk) is None
+    assert repo.data_version() == version + 1
+
+
+def test_writes_in_transaction(tmp_path):
+    inner = SQLiteRepository(str(tmp_path / 'cache.db'), Category)
+    repo = CachedRepository(inner)
+    pks = repo.add_many([Category('a'), Category('b'), Category('c')])
+    assert repo.get(pks[0]) is not None
+    assert len(repo.get_all({'parent': None})) == 3
+    with repo.transaction():
+        repo.delete(pks[0])
+        assert repo.get(pks[0]) is None
+        assert repo.get_all({'parent': None}) == [Category('b', pk=pks[1]),
+                                                  Category('c', pk=pks[2])]
+        repo.update(Category('d', 2, pks[1]))
+        assert repo.get_all({'parent': None}) == [Category('c', pk=pks[2])]
+        repo.add(Category('e'))
+        assert len(repo.get_all({'parent': None})) == 2
+        repo.delete_many(pks[1:])
+        assert repo.get(pks[2]) is None
+        assert [c.name for c in repo.get_all()] == ['e']
+    assert [c.name for c in repo.get_all()] == ['e']
+    with pytest.raises(ZeroDivisionError):
+        with repo.transaction():
+            repo.add(Category('f'))
+            1 / 0
+    assert [c.name for c in repo.get_all()] == ['e']
+    inner.close()
@@ -0,0 +1,138 @@
+from datetime import date, datetime
+
+from bookkeeper.models.expense import Expense
+from bookkeeper.repository.columnar_repository import ColumnarExpenseRepository
+from bookkeeper.repository.memory_repository import MemoryRepository
+
+import pytest
+
+
+def expenses():
+    return [Expense(10, 1, datetime(2023, 3, 6, 10), datetime(2023, 3, 6), 'a'),
+            Expense(20, 2, datetime(2023, 3, 6, 18), datetime(2023, 3, 6), 'b'),
+            Expense(30, 1, datetime(2023, 3, 12), datetime(2023, 3, 12), 'a'),
+            Expense(40, 1, datetime(2023, 4, 1), datetime(2023, 4, 1), '')]
+
+
+@pytest.fixture
+def repo():
+    repo = ColumnarExpenseRepository()
+    repo.add_many(expenses())
+    return repo
+
+
+def test_crud():
+    repo = ColumnarExpenseRepository()
+    obj = Expense(100, 1, datetime(2023, 3, 6, 12, 30, 0, 15), comment='bread')
+    pk = repo.add(obj)
+    assert obj.pk == pk
+    assert repo.get(pk) == obj
+    obj.amount = 200
+    obj.comment = 'milk'
+    repo.update(obj)
+    assert repo.get(pk) == obj
+    repo.delete(pk)
+    assert repo.get(pk) is None
+    assert len(repo) == 0
+    with pytest.raises(KeyError):
+        repo.delete(pk)
+    with pytest.raises(KeyError):
+        repo.update(obj)
+    with pytest.raises(ValueError):
+        repo.add(obj)
+    with pytest.raises(ValueError):
+        repo.update(Expense(1, 1))
+
+
+def test_queries_match_memory_repository(repo):
+    memory = MemoryRepository()
+    memory.add_many(expenses())
+    assert repo.get_all() == memory.get_all()
+    for where in [{'category': 1}, {'category': 1, 'comment': 'a'},
+                  {'comment': 'missing'}, {'category': None},
+                  {'expense_date': datetime(2023, 3, 12)}]:
+        assert repo.get_all(where) == memory.get_all(where)
+    assert list(repo.iter_all(order_by='amount', descending=True)) == \
+        list(memory.iter_all(order_by='amount', descending=True))
+    assert repo.get_page('expense_date', (datetime(2023, 3, 6, 18), 2), limit=1) == \
+        memory.get_page('expense_date', (datetime(2023, 3, 6, 18), 2), limit=1)
+    assert repo.get_between('expense_date', datetime(2023, 3, 6, 12),
+                            datetime(2023, 4, 1), {'category': 1}) == \
+        memory.get_between('expense_date', datetime(2023, 3, 6, 12),
+                           datetime(2023, 4, 1), {'category': 1})
+    with pytest.raises(ValueError):
+        repo.get_all({'unknown': 1})
+
+
+def test_comment_order_matches_memory_repository():
+    repo, memory = ColumnarExpenseRepository(), MemoryRepository()
+    for target in (repo, memory):
+        target.add_many([Expense(1, 1, datetime(2023, 3, 6), datetime(2023, 3, 6),
+                                 comment)
+                         for comment in ['zeta', 'alpha', 'mid', 'alpha']])
+    for descending in (False, True):
+        assert list(repo.iter_all(order_by='comment', descending=descending)) == \
+            list(memory.iter_all(order_by='comment', descending=descending))
+    assert [e.comment for e in repo.get_between('comment', 'a', 'n')] == \
+        ['alpha', 'alpha', 'mid']
+    assert repo.get_between('comment', 'a', 'n') == \
+        memory.get_between('comment', 'a', 'n')
+    assert repo.get_between('comment', 1, 2) == []
+    assert repo.get_page('comment', ('alpha', 4), limit=1) == \
+        memory.get_page('comment', ('alpha', 4), limit=1)
+
+
+def test_aggregate(repo):
+    assert repo.aggregate('sum', 'amount') == {(): 100}
+    assert repo.aggregate('count', 'pk', ['category']) == {(1,): 3, (2,): 1}
+    assert repo.aggregate('sum', 'amount', period='week',
+                          date_field='expense_date') == \
+        {(date(2023, 3, 6),): 60, (date(2023, 3, 27),): 40}
+    assert repo.aggregate('sum', 'amount', ['category'], period='month',
+                          date_field='expense_date',
+                          date_range=(datetime(2023, 3, 6, 12), datetime.max)) == \
+        {(date(2023, 3, 1), 2): 20, (date(2023, 3, 1), 1): 30,
+         (date(2023, 4, 1), 1): 40}
+    assert repo.aggregate('sum', 'amount', ['comment']) == \
+        {('',): 40, ('a',): 40, ('b',): 20}
+    assert repo.aggregate('sum', 'amount', where={'category': 3}) == {(): 0}
+    with pytest.raises(ValueError):
+        repo.aggregate('avg', 'amount')
+
+
+def test_sum_and_filter(repo):
+    assert repo.sum() == 100
+    assert repo.sum(where={'category': 1}) == 80
+    assert repo.sum(date_range=(date(2023, 3, 6), date(2023, 3, 12))) == 60
+    assert list(repo.filter({'comment': 'a'})) == [1, 3]
+    assert list(repo.filter(date_range=(datetime(2023, 3, 12), datetime.max),
+                            date_field='added_date')) == [3, 4]
+
+
+def test_compaction(repo):
+    repo.delete_many([1, 2, 3])
+    assert [obj.pk for obj in repo.get_all()] == [4]
+    assert repo.add(Expense(5, 2, datetime(2023, 5, 1))) == 5
+    assert repo.sum() == 45
+    assert repo.get(4).amount == 40
+    with pytest.raises(KeyError):
+        repo.delete_many([4, 4])
+
+
+def test_invalid_values_leave_columns_intact(repo):
+    with pytest.raises(TypeError):
+        repo.add(Expense(2, 1.5, datetime(2023, 5, 1)))
+    with pytest.raises(TypeError):
+        repo.add_many([Expense(5, 1, datetime(2023, 5, 1)), Expense(None, 1)])
+    obj = Expense(3, 2, datetime(2023, 5, 1), datetime(2023, 5, 1))
+    assert repo.add(obj) == 5
+    assert repo.get(5) == obj
+    with pytest.raises(TypeError):
+        repo.update(Expense(7.5, 1, pk=1))
+    assert [e.amount for e in repo.get_all()] == [10, 20, 30, 40, 3]
+    for field in ('comment', 'expense_date', 'added_date'):
+        with pytest.raises(ValueError):
+            repo.aggregate('sum', field)
+        with pytest.raises(ValueError):
+            repo.sum(field)
+    assert repo.aggregate('count', 'comment') == {(): 5}
@@ -0,0 +1,212 @@
+from bookkeeper.repository.connection import ConnectionPool, SQLiteProfile, \
+    DESKTOP_PROFILE, BULK_IMPORT_PROFILE
+from bookkeeper.repository.sqlite_repository import SQLiteRepository
+from dataclasses import dataclass
+import sqlite3
+import pytest
+
+
+@pytest.fixture
+def db_file(tmp_path):
+    return str(tmp_path / 'pool.db')
+
+
+@pytest.fixture
+def pool(db_file):
+    with ConnectionPool(db_file, size=2, timeout=0.1) as p:
+        yield p
+
+
+def test_connection_is_reused(pool):
+    with pool.connection() as con1:
+        pass
+    with pool.connection() as con2:
+        assert con2 is con1
+
+
+def test_foreign_keys_enabled(pool):
+    with pool.connection() as con:
+        assert con.execute('PRAGMA foreign_keys').fetchone() == (1,)
+
+
+def test_pool_size_limit(pool):
+    con1 = pool.acquire()
+    con2 = pool.acquire()
+    assert con1 is not con2
+    with pytest.raises(TimeoutError):
+        pool.acquire()
+    pool.release(con1)
+    assert pool.acquire() is con1
+
+
+def test_uncommitted_changes_rolled_back(pool):
+    with pool.connection() as con:
+        con.execute('CREATE TABLE t (x INTEGER)')
+        con.commit()
+        con.execute('INSERT INTO t VALUES (1)')
+    with pool.connection() as con:
+        assert con.execute('SELECT count(*) FROM t').fetchone() == (0,)
+
+
+def test_close(pool):
+    con = pool.acquire()
+    pool.close()
+    assert pool.closed
+    with pytest.raises(RuntimeError):
+        pool.acquire()
+    pool.release(con)
+    pool.close()
+
+
+def test_invalid_size(db_file):
+    with pytest.raises(ValueError):
+        ConnectionPool(db_file, size=0)
+
+
+def test_shared_between_repositories(pool):
+    @dataclass
+    class Custom:
+        name: str = 'hebe'
+        pk: int = 0
+
+    with pool.connection() as con:
+        con.execute('CREATE TABLE custom (name TEXT, pk INTEGER PRIMARY KEY)')
+        con.commit()
+    repo1 = SQLiteRepository(pool.db_file, Custom, pool)
+    repo2 = SQLiteRepository(pool.db_file, Custom, pool)
+    pk = repo1.add(Custom())
+    assert repo2.get(pk) == Custom(pk=pk)
+    repo1.close()
+    assert not pool.closed
+
+
+def test_profile_pragmas():
+    profile = SQLiteProfile(journal_mode='wal', cache_size=-2000)
+    assert profile.pragmas() == ['PRAGMA journal_mode = WAL',
+                                 'PRAGMA cache_size = -2000']
+    assert SQLiteProfile().pragmas() == []
+
+
+def test_invalid_profile():
+    with pytest.raises(ValueError):
+        SQLiteProfile(journal_mode='wal; DROP TABLE expense')
+    with pytest.raises(ValueError):
+        SQLiteProfile(synchronous='sometimes')
+
+
+@pytest.mark.parametrize('profile', [DESKTOP_PROFILE, BULK_IMPORT_PROFILE])
+def test_profile_applied(db_file, profile):
+    with ConnectionPool(db_file, profile=profile) as p:
+        with p.connection() as con:
+            assert con.execute('PRAGMA journal_mode').fetchone() == ('wal',)
+            assert con.execute('PRAGMA cache_size').fetchone() == (
+                profile.cache_size,)
+            assert con.execute('PRAGMA busy_timeout').fetchone() == (
+                profile.busy_timeout,)
+
+
+def test_transaction(pool):
+    with pool.connection() as con:
+        con.execute('CREATE TABLE t (x INTEGER)')
+        con.commit()
+    called = []
+    with pool.transaction() as con:
+        with pool.write() as con2:
+            con2.execute('INSERT INTO t VALUES (1)')
+        with pool.transaction() as con3:
+            assert con3 is con2 is con
+        pool.defer(called.append)
+        assert called == []
+    assert called == [True]
+    with pytest.raises(ZeroDivisionError):
+        with pool.transaction():
+            with pool.write() as con:
+                con.execute('INSERT INTO t VALUES (2)')
+            pool.defer(called.append)
+            1 / 0
+    assert called == [True, False]
+    assert not pool.in_transaction
+    with pool.connection() as con:
+        assert con.execute('SELECT x FROM t').fetchall() == [(1,)]
+
+
+def test_defer_outside_transaction(pool):
+    called = []
+    pool.defer(called.append)
+    assert called == [True]
+
+
+def test_statement_cache_counters(db_file):
+    with ConnectionPool(db_file, size=1, cached_statements=2) as p:
+        with p.connection() as con:
+            misses = p.statement_cache_misses
+            con.execute('SELECT 1')
+            con.execute('SELECT 1')
+            con.execute('SELECT 2')
+            con.execute('SELECT 3')
+            con.execute('SELECT 1')
+        assert p.statement_cache_hits == 1
+        assert p.statement_cache_misses == misses + 4
+
+
+def test_read_only_pool(db_file):
+    with ConnectionPool(db_file, profile=DESKTOP_PROFILE) as writer:
+        with writer.write() as con:
+            con.execute('CREATE TABLE t (x INTEGER)')
+            con.execute('INSERT INTO t VALUES (1)')
+        with ConnectionPool(db_file, profile=DESKTOP_PROFILE, read_only=True) as reader:
+            with reader.connection() as con:
+                assert con.execute('SELECT x FROM t').fetchall() == [(1,)]
+                with pytest.raises(sqlite3.OperationalError):
+                    con.execute('INSERT INTO t VALUES (2)')
+
+
+def test_snapshot(db_file):
+    with ConnectionPool(db_file, profile=DESKTOP_PROFILE) as writer, \
+            ConnectionPool(db_file, profile=DESKTOP_PROFILE, read_only=True) as reader:
+        with writer.write() as con:
+            con.execute('CREATE TABLE t (x INTEGER)')
+        with writer.transaction() as con:
+            con.execute('INSERT INTO t VALUES (1)')
+            # открытая пишущая транзакция не блокирует чтение и не видна ему
+            with reader.snapshot():
+                with reader.connection() as read_con:
+                    assert read_con.execute('SELECT x FROM t').fetchall() == []
+        with reader.snapshot() as snap:
+            with reader.snapshot() as nested:
+                assert nested is snap
+            with writer.write() as con:
+                con.execute('INSERT INTO t VALUES (2)')
+            with reader.connection() as read_con:
+                assert read_con is snap
+                assert read_con.execute('SELECT x FROM t').fetchall() == [(1,)]
+        with reader.connection() as read_con:
+            assert read_con.execute('SELECT x FROM t').fetchall() == [(1,), (2,)]
+
+
+def test_snapshot_write_single_pool(db_file):
+    with ConnectionPool(db_file, profile=DESKTOP_PROFILE) as pool:
+        with pool.write() as con:
+            con.execute('CREATE TABLE t (x INTEGER)')
+        with pool.snapshot() as snap:
+            with pool.write() as con:
+                assert con is not snap
+                con.execute('INSERT INTO t VALUES (1)')
+            with pool.connection() as read_con:
+                assert read_con.execute('SELECT x FROM t').fetchall() == []
+        with pool.connection() as read_con:
+            assert read_con.execute('SELECT x FROM t').fetchall() == [(1,)]
+
+
+def test_snapshot_without_wal(db_file):
+    with ConnectionPool(db_file, timeout=1) as pool:
+        with pool.write() as con:
+            con.execute('CREATE TABLE t (x INTEGER)')
+        with pool.snapshot() as snap:
+            # без WAL соединение не закрепляется и не блокирует запись
+            with pool.connection() as read_con:
+                assert read_con is not snap
+            with pool.write() as con:
+                con.execute('INSERT INTO t VALUES (1)')
+            with pool.connection() as read_con:
+                assert read_con.execute('SELECT x FROM t').fetchall() == [(1,)]
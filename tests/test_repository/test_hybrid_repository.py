@@ -0,0 +1,109 @@
+from bookkeeper.repository.hybrid_repository import HybridRepository
+from bookkeeper.repository.sqlite_repository import SQLiteRepository, WriteBehind
+from bookkeeper.models.category import Category
+from bookkeeper.repository.query import Query
+
+import pytest
+
+
+@pytest.fixture
+def inner(tmp_path):
+    inner = SQLiteRepository(str(tmp_path / 'hybrid.db'), Category)
+    inner.add_many([Category('food'), Category('meat', 1), Category('fish', 1)])
+    yield inner
+    inner.close()
+
+
+@pytest.fixture
+def repo(inner):
+    return HybridRepository(inner, indexes=['name', 'parent'])
+
+
+def statements(inner):
+    return inner.pool.statement_cache_hits + inner.pool.statement_cache_misses
+
+
+def test_reads_from_memory(repo, inner):
+    executed = statements(inner)
+    assert repo.get(2) == Category('meat', 1, 2)
+    assert repo.get(4) is None
+    assert repo.get_all({'parent': 1}) == [Category('meat', 1, 2), Category('fish', 1, 3)]
+    assert repo.get_page('name', limit=1) == [Category('fish', 1, 3)]
+    assert repo.aggregate('count', 'pk', ['parent']) == {(None,): 1, (1,): 2}
+    assert statements(inner) == executed
+
+
+def test_write_through(repo, inner):
+    cat = Category('milk')
+    pk = repo.add(cat)
+    assert repo.get(pk) is cat
+    assert inner.get(pk) == cat
+    cat.parent = 1
+    repo.update(cat)
+    assert repo.get_all({'parent': 1})[-1] is cat
+    assert inner.get(pk) == cat
+    repo.delete_many([2, pk])
+    assert repo.get_all() == inner.get_all() == [Category('food', pk=1),
+                                                 Category('fish', 1, 3)]
+
+
+def test_changes_bypassing_wrapper(repo, inner):
+    events = []
+    repo.subscribe(lambda event, pks: events.append((event, pks)))
+    pk = inner.add(Category('bread'))
+    assert repo.get(pk) == Category('bread', pk=pk)
+    inner.delete(1)
+    assert repo.get(1) is None
+    with pytest.raises(ZeroDivisionError):
+        with repo.transaction():
+            repo.delete(2)
+            repo.add(Category('milk'))
+            assert repo.get(2) is None
+            1 / 0
+    assert repo.get(2) == Category('meat', 1, 2)
+    assert repo.get_all({'name': 'milk'}) == []
+    assert events[-1][0] == 'rollback'
+    with inner.pool.write() as con:
+        con.execute("UPDATE category SET name = 'beef' WHERE pk = 2")
+    assert repo.get(2).name == 'meat'
+    repo.reload()
+    assert repo.get(2).name == 'beef'
+
+
+def test_batched_write_through(tmp_path):
+    inner = SQLiteRepository(str(tmp_path / 'batched.db'), Category,
+                             write_behind=WriteBehind(flush_interval=60))
+    repo = HybridRepository(inner, indexes=['name'])
+    pks = repo.add_many([Category('food'), Category('meat', 1)])
+    assert repo.get_all({'name': 'meat'}) == [Category('meat', 1, pks[1])]
+    assert inner._inserts
+    inner.close()
+    assert SQLiteRepository(str(tmp_path / 'batched.db'), Category).get_all() == \
+        repo.get_all()
+
+
+def test_rollback_keeps_pk_order(repo, inner):
+    with pytest.raises(ZeroDivisionError):
+        with repo.transaction():
+            repo.delete(1)
+            1 / 0
+    assert [c.pk for c in repo.get_all()] == [1, 2, 3]
+    assert [c.pk for c in repo.iter_all(descending=True)] == [3, 2, 1]
+    assert repo.query(Query().only('pk')) == [(1,), (2,), (3,)]
+
+
+def test_subscribers_read_through_wrapper(repo, inner):
+    seen = []
+    repo.subscribe(lambda event, pks: seen.append(
+        (event, repo.query(Query().where('parent', '=', 1).only('name')))))
+    repo.add(Category('eel', 1))
+    assert seen[-1] == ('add', [('meat',), ('fish',), ('eel',)])
+    repo.delete(2)
+    assert seen[-1] == ('delete', [('fish',), ('eel',)])
+    with repo.transaction():
+        repo.update(Category('beef', pk=1))
+        assert repo.get(1).name == 'beef'
+    assert seen[-1] == ('update', [('fish',), ('eel',)])
+    assert repo.get(1) == Category('beef', pk=1)
+    inner.add(Category('cod', 1))
+    assert seen[-1] == ('add', [('fish',), ('eel',), ('cod',)])
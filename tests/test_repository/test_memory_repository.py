@@ -1,3 +1,5 @@
+from datetime import date, datetime
+
 from bookkeeper.repository.memory_repository import MemoryRepository
 
 import pytest
@@ -69,3 +71,263 @@ def test_get_all_with_condition(repo, custom_class):
         objects.append(o)
     assert repo.get_all({'name': '0'}) == [objects[0]]
     assert repo.get_all({'test': 'test'}) == objects
+
+
+def test_add_many(repo, custom_class):
+    objects = [custom_class() for _ in range(5)]
+    pks = repo.add_many(objects)
+    assert pks == [o.pk for o in objects]
+    assert len(set(pks)) == 5
+    assert repo.get_all() == objects
+
+
+def test_cannot_add_many_with_pk(repo, custom_class):
+    objects = [custom_class() for _ in range(3)]
+    objects[2].pk = 7
+    with pytest.raises(ValueError):
+        repo.add_many(objects)
+    assert repo.get_all() == []
+
+
+def test_update_many(repo, custom_class):
+    objects = [custom_class() for _ in range(3)]
+    repo.add_many(objects)
+    new_objects = []
+    for o in objects:
+        new = custom_class()
+        new.pk = o.pk
+        new_objects.append(new)
+    repo.update_many(new_objects)
+    assert repo.get_all() == new_objects
+    with pytest.raises(ValueError):
+        repo.update_many([custom_class()])
+
+
+def test_delete_many(repo, custom_class):
+    objects = [custom_class() for _ in range(3)]
+    pks = repo.add_many(objects)
+    with pytest.raises(KeyError):
+        repo.delete_many([pks[0], 100])
+    assert repo.get_all() == objects
+    repo.delete_many(pks[:2])
+    assert repo.get_all() == objects[2:]
+
+
+def test_iter_all(repo, custom_class):
+    objects = []
+    for i in [3, 1, 2, 1]:
+        o = custom_class()
+        o.value = i
+        o.test = 'test' if i > 1 else 'other'
+        repo.add(o)
+        objects.append(o)
+    assert list(repo.iter_all()) == objects
+    assert list(repo.iter_all(descending=True)) == objects[::-1]
+    assert list(repo.iter_all({'test': 'test'})) == [objects[0], objects[2]]
+    assert list(repo.iter_all(order_by='value')) == [objects[i] for i in [1, 3, 2, 0]]
+    assert list(repo.iter_all(order_by='value', descending=True)) == \
+        [objects[i] for i in [0, 2, 3, 1]]
+
+
+def test_get_page(repo, custom_class):
+    objects = []
+    for i in [3, 1, 2, 1, 3]:
+        o = custom_class()
+        o.value = i
+        repo.add(o)
+        objects.append(o)
+    page = repo.get_page('value', limit=2)
+    assert page == [objects[1], objects[3]]
+    page = repo.get_page('value', (page[-1].value, page[-1].pk), limit=2)
+    assert page == [objects[2], objects[0]]
+    page = repo.get_page('value', (page[-1].value, page[-1].pk), limit=2)
+    assert page == [objects[4]]
+    page = repo.get_page('value', limit=3, descending=True)
+    assert page == [objects[4], objects[0], objects[2]]
+    assert repo.get_page('value', (3, objects[0].pk), descending=True) == \
+        [objects[2], objects[3], objects[1]]
+    assert repo.get_page(after_key=(2, 2), limit=2) == objects[2:4]
+
+
+def test_order_by_field_with_none(repo, custom_class):
+    objects = []
+    for i in [2, None, 1, None]:
+        o = custom_class()
+        o.value = i
+        repo.add(o)
+        objects.append(o)
+    # как в SQLite, значения None идут первыми
+    assert list(repo.iter_all(order_by='value')) == [objects[i] for i in [1, 3, 2, 0]]
+    assert list(repo.iter_all(order_by='value', descending=True)) == \
+        [objects[i] for i in [0, 2, 3, 1]]
+    page = repo.get_page('value', limit=1)
+    assert page == [objects[1]]
+    assert repo.get_page('value', (None, page[-1].pk), limit=2) == \
+        [objects[3], objects[2]]
+    assert repo.get_page('value', (1, objects[2].pk), descending=True) == \
+        [objects[3], objects[1]]
+
+
+def test_get_between(repo, custom_class):
+    objects = []
+    for i in [5, 1, 3, None, 3, 7]:
+        o = custom_class()
+        o.value = i
+        o.test = 'test'
+        repo.add(o)
+        objects.append(o)
+    assert repo.get_between('value', 2, 5) == [objects[2], objects[4], objects[0]]
+    objects[2].value = 6
+    repo.update(objects[2])
+    repo.delete(objects[0].pk)
+    o = custom_class()
+    o.value = 2
+    o.test = 'other'
+    repo.add(o)
+    assert repo.get_between('value', 2, 5) == [o, objects[4]]
+    assert repo.get_between('value', 2, 5, {'test': 'test'}) == [objects[4]]
+    assert repo.get_between('value', 8, 9) == []
+
+
+def test_aggregate(repo):
+    from bookkeeper.models.expense import Expense
+    repo.add_many([Expense(10, 1, datetime(2023, 3, 6, 10)),
+                   Expense(20, 2, datetime(2023, 3, 6, 18)),
+                   Expense(30, 1, datetime(2023, 3, 12)),
+                   Expense(40, 1, datetime(2023, 4, 1))])
+    assert repo.aggregate('sum', 'amount') == {(): 100}
+    assert repo.aggregate('count', 'pk', ['category']) == {(1,): 3, (2,): 1}
+    assert repo.aggregate('sum', 'amount', period='week',
+                          date_field='expense_date') == \
+        {(date(2023, 3, 6),): 60, (date(2023, 3, 27),): 40}
+    assert repo.aggregate('sum', 'amount', ['category'], period='month',
+                          date_field='expense_date',
+                          date_range=(datetime(2023, 3, 6, 12), datetime.max)) == \
+        {(date(2023, 3, 1), 2): 20, (date(2023, 3, 1), 1): 30,
+         (date(2023, 4, 1), 1): 40}
+    assert repo.aggregate('sum', 'amount', where={'category': 3}) == {(): 0}
+    with pytest.raises(ValueError):
+        repo.aggregate('avg', 'amount')
+    with pytest.raises(ValueError):
+        repo.aggregate('sum', 'amount', period='day')
+
+
+def test_subscribe(repo, custom_class):
+    events = []
+    unsubscribe = repo.subscribe(lambda event, pks: events.append((event, pks)))
+    version = repo.data_version()
+    obj = custom_class()
+    pk = repo.add(obj)
+    repo.update(obj)
+    repo.delete(pk)
+    pks = repo.add_many([custom_class(), custom_class()])
+    repo.update_many([repo.get(pk) for pk in pks])
+    repo.delete_many(pks)
+    assert events == [('add', [pk]), ('update', [pk]), ('delete', [pk]),
+                      ('add', [pks[0]]), ('add', [pks[1]]),
+                      ('update', pks), ('delete', pks)]
+    assert repo.data_version() == version + 7
+    unsubscribe()
+    repo.add(custom_class())
+    assert len(events) == 7
+    assert repo.data_version() == version + 8
+
+
+def test_indexes(custom_class):
+    repo = MemoryRepository(indexes=['test'], sorted_indexes=['value'])
+    objects = []
+    for i in [3, 1, 2, 1, None]:
+        o = custom_class()
+        o.value = i
+        o.test = 'test' if i != 1 else 'other'
+        repo.add(o)
+        objects.append(o)
+    assert repo.get_all({'test': 'other'}) == [objects[1], objects[3]]
+    assert repo.get_all({'value': 1, 'test': 'other'}) == [objects[1], objects[3]]
+    assert repo.get_all({'value': None}) == [objects[4]]
+    assert repo.get_all({'test': 'none'}) == []
+    assert list(repo.iter_all({'test': 'test'}, descending=True)) == \
+        [objects[4], objects[2], objects[0]]
+    assert repo.get_between('value', 2, 3, {'test': 'test'}) == [objects[2], objects[0]]
+    objects[1].test = 'test'
+    objects[1].value = 4
+    repo.update(objects[1])
+    repo.delete(objects[4].pk)
+    assert repo.get_all({'test': 'other'}) == [objects[3]]
+    assert repo.get_all({'value': 4}) == [objects[1]]
+    assert list(repo.iter_all(order_by='value')) == [objects[i] for i in [3, 2, 0, 1]]
+    assert list(repo.iter_all(order_by='value', descending=True)) == \
+        [objects[i] for i in [1, 0, 2, 3]]
+    assert repo.get_page('value', (2, objects[2].pk), limit=2) == [objects[0], objects[1]]
+    assert repo.get_between('value', 2, 4) == [objects[2], objects[0], objects[1]]
+
+
+def test_snapshot(tmp_path):
+    from bookkeeper.models.expense import Expense
+    path = str(tmp_path / 'expenses.snap')
+    repo = MemoryRepository()
+    objects = [Expense(i * 10, i % 2, datetime(2023, 3, i + 1), comment=str(i))
+               for i in range(5)]
+    repo.add_many(objects)
+    repo.delete(objects[1].pk)
+    repo.save(path)
+    loaded = MemoryRepository.load(path)
+    assert loaded._container._objects == {}
+    assert loaded.get(objects[3].pk) == objects[3]
+    assert list(loaded._container._objects) == [objects[3].pk]
+    assert loaded.get(objects[1].pk) is None
+    assert loaded.get_all() == repo.get_all()
+    assert list(loaded.iter_all(descending=True)) == list(repo.iter_all(descending=True))
+    new = Expense(100, 1)
+    assert loaded.add(new) == repo.add(Expense(100, 1))
+    objects[0].amount = 5
+    loaded.update(objects[0])
+    loaded.delete(objects[2].pk)
+    with pytest.raises(KeyError):
+        loaded.delete(objects[2].pk)
+    assert [obj.pk for obj in loaded.get_all()] == [1, 4, 5, 6]
+    assert loaded.aggregate('sum', 'amount') == {(): 5 + 30 + 40 + 100}
+    container = loaded._container
+    loaded.save(path)
+    reloaded = MemoryRepository.load(path, indexes=['category'])
+    assert reloaded.get_all({'category': 1}) == [objects[3], new]
+    assert list(reloaded.iter_all(descending=True)) == \
+        list(loaded.iter_all(descending=True))
+    # save освобождает отображение, даже если снимок записывается в тот же файл
+    assert container._buffer.closed
+    assert loaded.get_all() == reloaded.get_all()
+
+
+def test_close_snapshot(tmp_path):
+    from bookkeeper.models.expense import Expense
+    path = str(tmp_path / 'expenses.snap')
+    repo = MemoryRepository()
+    repo.add_many([Expense(i, 1, datetime(2023, 3, 1), comment=str(i)) for i in range(3)])
+    repo.save(path)
+    repo.close()
+    with MemoryRepository.load(path) as loaded:
+        container = loaded._container
+        assert loaded.get(2) == repo.get(2)
+    assert container._buffer.closed
+    assert isinstance(loaded._container, dict)
+    assert loaded.get_all() == repo.get_all()
+    loaded.delete(1)
+    assert list(loaded.iter_all(descending=True)) == [repo.get(3), repo.get(2)]
+    loaded.close()
+
+
+def test_load_not_snapshot(tmp_path):
+    path = tmp_path / 'other.db'
+    path.write_bytes(b'SQLite format 3\x00' + bytes(100))
+    with pytest.raises(ValueError):
+        MemoryRepository.load(str(path))
+
+
+def test_update_keeps_pk_order(custom_class):
+    repo = MemoryRepository()
+    objects = [custom_class() for _ in range(3)]
+    repo.add_many(objects)
+    repo.delete(objects[0].pk)
+    repo.update(objects[0])
+    assert repo.get_all() == objects
+    assert list(repo.iter_all(descending=True)) == objects[::-1]
@@ -0,0 +1,155 @@
+from bookkeeper.repository.connection import ConnectionPool
+from bookkeeper.repository.migrations import Migration, TableSchema, \
+    migrate_datetimes, schema_version, upgrade, MIGRATIONS
+from bookkeeper.repository.sqlite_repository import SQLiteRepository
+from dataclasses import dataclass
+from datetime import date, datetime
+import sqlite3
+import pytest
+
+
+@dataclass
+class Entry:
+    amount: int
+    moment: datetime
+    day: date | None = None
+    pk: int = 0
+
+
+ENTRY = TableSchema('entry', (('amount', 'INTEGER'), ('moment', 'TIMESTAMP'),
+                              ('day', 'DATE'),
+                              ('pk', 'INTEGER PRIMARY KEY AUTOINCREMENT')))
+
+
+@pytest.fixture
+def legacy_db(tmp_path):
+    db_file = str(tmp_path / 'legacy.db')
+    with sqlite3.connect(db_file) as con:
+        con.execute('CREATE TABLE entry (amount INTEGER, moment TEXT, day TEXT, '
+                    'pk INTEGER PRIMARY KEY AUTOINCREMENT)')
+        con.executemany('INSERT INTO entry VALUES (?, ?, ?, ?)',
+                        [(1, '2023-03-12 17:06:00', '2023-03-06', 1),
+                         (2, '2023-03-12 09:00:00.5', None, 2),
+                         (3, '2023-03-13T08:00:00', '2023-03-13 00:00:00', 5)])
+        con.execute("UPDATE sqlite_sequence SET seq = 7 WHERE name = 'entry'")
+    con.close()
+    return db_file
+
+
+def test_migrate_datetimes(legacy_db):
+    with sqlite3.connect(legacy_db) as con:
+        con.execute('CREATE INDEX entry_moment_idx ON entry (moment)')
+    con.close()
+    repo = SQLiteRepository(legacy_db, Entry, create_schema=False)
+    migrate_datetimes(repo.pool, ENTRY)
+    with sqlite3.connect(legacy_db) as con:
+        types = {row[1]: row[2] for row in con.execute('PRAGMA table_info(entry)')}
+        assert (types['moment'], types['day']) == ('TIMESTAMP', 'DATE')
+        assert con.execute('SELECT moment, day FROM entry ORDER BY moment').fetchall() \
+            == [('2023-03-12 09:00:00.500000', None),
+                ('2023-03-12 17:06:00.000000', '2023-03-06'),
+                ('2023-03-13 08:00:00.000000', '2023-03-13')]
+        assert con.execute("SELECT name FROM sqlite_master WHERE type = 'index'"
+                           ).fetchall() == [('entry_moment_idx',)]
+    con.close()
+    assert repo.get(1) == Entry(1, datetime(2023, 3, 12, 17, 6), date(2023, 3, 6), 1)
+    assert repo.add(Entry(4, datetime(2023, 3, 14))) == 8
+    migrate_datetimes(repo.pool, ENTRY)
+    assert len(repo.get_all()) == 4
+    repo.close()
+
+
+def test_migrate_invalid_date_rolls_back(legacy_db):
+    with sqlite3.connect(legacy_db) as con:
+        con.execute("UPDATE entry SET moment = 'yesterday' WHERE pk = 2")
+    con.close()
+    with ConnectionPool(legacy_db) as pool:
+        with pytest.raises(ValueError):
+            migrate_datetimes(pool, ENTRY)
+    with sqlite3.connect(legacy_db) as con:
+        assert con.execute("SELECT moment FROM entry WHERE pk = 1").fetchone() \
+            == ('2023-03-12 17:06:00',)
+    con.close()
+
+
+@pytest.fixture
+def pool(legacy_db):
+    with ConnectionPool(legacy_db) as p:
+        yield p
+
+
+def add_column(name):
+    def apply(pool):
+        with pool.write() as con:
+            con.execute(f'ALTER TABLE entry ADD COLUMN {name} TEXT')
+    return Migration(f'add {name}', apply)
+
+
+def test_upgrade(pool, tmp_path):
+    backup = str(tmp_path / 'backup.db')
+    assert schema_version(pool) == 0
+    assert upgrade(pool, [add_column('a'), add_column('b')], backup=backup) == 2
+    assert upgrade(pool, [add_column('a'), add_column('b'), add_column('c')]) == 3
+    assert upgrade(pool, [add_column('a'), add_column('b'), add_column('c')]) == 3
+    with pool.connection() as con:
+        columns = [row[1] for row in con.execute('PRAGMA table_info(entry)')]
+    assert columns[-3:] == ['a', 'b', 'c']
+    with sqlite3.connect(backup) as con:
+        assert con.execute('PRAGMA user_version').fetchone() == (0,)
+        assert 'a' not in [row[1] for row in con.execute('PRAGMA table_info(entry)')]
+    con.close()
+
+
+def test_upgrade_rolls_back_on_error(pool):
+    def fail(pool):
+        raise RuntimeError('broken step')
+
+    with pytest.raises(RuntimeError):
+        upgrade(pool, [add_column('a'), Migration('broken', fail)])
+    assert schema_version(pool) == 0
+    with pool.connection() as con:
+        assert 'a' not in [row[1] for row in con.execute('PRAGMA table_info(entry)')]
+
+
+def test_upgrade_newer_database(pool):
+    with pool.connection() as con:
+        con.execute('PRAGMA user_version = 5')
+    with pytest.raises(RuntimeError):
+        upgrade(pool, [add_column('a')])
+
+
+def test_upgrade_empty_database(tmp_path):
+    backup = tmp_path / 'backup.db'
+    with ConnectionPool(str(tmp_path / 'new.db')) as p:
+        assert upgrade(p, backup=str(backup)) == len(MIGRATIONS)
+        with p.connection() as con:
+            assert con.execute('SELECT name FROM sqlite_master').fetchall() == []
+    assert not backup.exists()
+
+
+def test_first_step_ignores_current_models(tmp_path):
+    db_file = str(tmp_path / 'v0.db')
+    with sqlite3.connect(db_file) as con:
+        con.execute('CREATE TABLE category (name TEXT, parent INTEGER, '
+                    'pk INTEGER PRIMARY KEY AUTOINCREMENT)')
+        con.execute('CREATE TABLE budget (amount INTEGER, category INTEGER, '
+                    'length INTEGER, start_date TEXT, end_date TEXT, '
+                    'pk INTEGER PRIMARY KEY AUTOINCREMENT)')
+        con.execute("INSERT INTO budget VALUES (100, 0, 7, '2023-03-06', "
+                    "'2023-03-13 00:00:00', 1)")
+    con.close()
+
+    def add_budget_note(pool):
+        # следующий шаг меняет схему, как если бы в модель добавили поле
+        with pool.write() as con:
+            con.execute('ALTER TABLE budget ADD COLUMN note TEXT')
+
+    with ConnectionPool(db_file) as pool:
+        steps = MIGRATIONS + [Migration('budget note', add_budget_note)]
+        assert upgrade(pool, steps) == len(steps)
+        with pool.connection() as con:
+            types = {row[1]: row[2] for row in con.execute('PRAGMA table_info(budget)')}
+            assert (types['start_date'], types['end_date'], types['note']) == \
+                ('DATE', 'DATE', 'TEXT')
+            assert con.execute('SELECT CAST(end_date AS TEXT) FROM budget').fetchone() \
+                == ('2023-03-13',)
@@ -0,0 +1,125 @@
+from dataclasses import dataclass
+from datetime import datetime
+
+from bookkeeper.models.expense import Expense
+from bookkeeper.repository.columnar_repository import ColumnarExpenseRepository
+from bookkeeper.repository.memory_repository import MemoryRepository
+from bookkeeper.repository.query import Condition, Query, prefix_end
+from bookkeeper.repository.sqlite_repository import SQLiteRepository
+
+import pytest
+
+
+def expenses():
+    return [Expense(100, 1, datetime(2023, 3, 6, 10), comment='bread'),
+            Expense(250, 2, datetime(2023, 3, 7), comment='beer'),
+            Expense(40, 1, datetime(2023, 3, 7, 18), comment=''),
+            Expense(250, 3, datetime(2023, 3, 1), comment='Bread'),
+            Expense(900, 2, datetime(2023, 4, 1), comment='bus')]
+
+
+@pytest.fixture(params=['memory', 'indexed', 'sqlite', 'default'])
+def repo(request, tmp_path):
+    if request.param == 'memory':
+        repo = MemoryRepository()
+    elif request.param == 'indexed':
+        repo = MemoryRepository(indexes=['category'],
+                                sorted_indexes=['amount', 'expense_date', 'comment'])
+    elif request.param == 'sqlite':
+        repo = SQLiteRepository(str(tmp_path / 'query.db'), Expense)
+    else:
+        repo = ColumnarExpenseRepository()
+    repo.add_many(expenses())
+    yield repo
+    if request.param == 'sqlite':
+        repo.close()
+
+
+def pks(result):
+    return [obj.pk for obj in result]
+
+
+def test_conditions(repo):
+    assert pks(repo.query(Query())) == [1, 2, 3, 4, 5]
+    assert pks(repo.query(Query().where('amount', '>=', 250))) == [2, 4, 5]
+    assert pks(repo.query(Query().where('amount', '<', 100))) == [3]
+    assert pks(repo.query(Query().where('category', '!=', 1))) == [2, 4, 5]
+    assert pks(repo.query(Query().where('category', 'in', [3, 1]))) == [1, 3, 4]
+    assert pks(repo.query(Query().where('category', 'in', []))) == []
+    assert pks(repo.query(Query().where('pk', '=', 2))) == [2]
+    march = (datetime(2023, 3, 6), datetime(2023, 3, 7))
+    assert pks(repo.query(Query().where('expense_date', 'between', march))) == [1, 2]
+    assert pks(repo.query(Query().where('comment', 'prefix', 'b'))) == [1, 2, 5]
+    assert pks(repo.query(Query().where('comment', 'prefix', 'bre')
+                          .where('amount', '>', 50))) == [1]
+    assert pks(repo.query(Query().where('comment', 'prefix', ''))) == [1, 2, 3, 4, 5]
+
+
+def test_order_limit_projection(repo):
+    query = Query().where('amount', '>', 50).order('amount', descending=True)
+    assert pks(repo.query(query)) == [5, 4, 2, 1]
+    assert pks(repo.query(query.take(2))) == [5, 4]
+    assert repo.query(Query().order('expense_date').take(2).only('comment', 'pk')) == \
+        [('Bread', 4), ('bread', 1)]
+    assert repo.query(Query(descending=True).take(1).only('expense_date')) == \
+        [(datetime(2023, 4, 1),)]
+    assert repo.query(Query().where('category', '=', 2).only('amount')) == \
+        [(250,), (900,)]
+
+
+def test_null_conditions(tmp_path):
+    @dataclass
+    class Node:
+        name: str
+        parent: int | None = None
+        pk: int = 0
+
+    for repo in [MemoryRepository(indexes=['parent']),
+                 SQLiteRepository(str(tmp_path / 'nodes.db'), Node)]:
+        repo.add_many([Node('a'), Node('b', 1), Node('c', 2)])
+        assert [n.name for n in repo.query(Query().where('parent', 'is null'))] == ['a']
+        assert [n.name for n in repo.query(Query().where('parent', '=', None))] == ['a']
+        assert [n.name for n in repo.query(Query().where('parent', '!=', 1))] == ['c']
+        assert [n.name for n in repo.query(Query().where('parent', 'is not null'))] == \
+            ['b', 'c']
+        assert repo.query(Query().order('parent').only('name')) == \
+            [('a',), ('b',), ('c',)]
+        assert repo.query(Query().order('parent', True).only('name')) == \
+            [('c',), ('b',), ('a',)]
+
+
+def test_invalid_queries():
+    with pytest.raises(ValueError):
+        Condition('amount', 'like', 1)
+    with pytest.raises(ValueError):
+        Condition('amount', '<', None)
+    with pytest.raises(ValueError):
+        Condition('comment', 'prefix', 1)
+    with pytest.raises(ValueError):
+        Query(limit=-1)
+    with pytest.raises(ValueError):
+        Query().only()
+
+
+def test_sqlite_query_checks_fields(tmp_path):
+    repo = SQLiteRepository(str(tmp_path / 'fields.db'), Expense)
+    with pytest.raises(ValueError):
+        repo.query(Query().where('amount; DROP TABLE expense', '=', 1))
+    with pytest.raises(ValueError):
+        repo.query(Query().only('unknown'))
+    repo.add(Expense(1, 1))
+    repo.query(Query().where('amount', 'in', [1, 2]).take(5))
+    misses = repo.pool.statement_cache_misses
+    repo.query(Query().where('amount', 'in', [3, 4]).take(1))
+    assert repo.pool.statement_cache_misses == misses
+    for size in range(3, 100):
+        assert len(repo.query(Query().where('amount', 'in', range(1, size)))) == 1
+    assert len(repo._statements) <= 10
+    repo.close()
+
+
+def test_prefix_end():
+    assert prefix_end('ab') == 'ac'
+    assert prefix_end('a\U0010ffff') == 'b'
+    assert prefix_end('\ud7ff') == '\ue000'
+    assert prefix_end('') is None
@@ -1,6 +1,11 @@
 import datetime
+import sqlite3
+import time
+from inspect import isgenerator
 
-from bookkeeper.repository.sqlite_repository import SQLiteRepository  # CustomClass
+from bookkeeper.repository.connection import ConnectionPool, DESKTOP_PROFILE
+from bookkeeper.repository.sqlite_repository import SQLiteRepository, \
+    WriteBehind  # CustomClass
 from dataclasses import dataclass
 import pytest
 
@@ -86,3 +91,537 @@ def test_get_all_with_condition(repo, custom_class):
         objects.append(o)
     assert repo.get_all({'test_float': 2.4}) == [objects[0]]
     assert repo.get_all({'name': 'baobab'}) == objects
+
+
+@pytest.fixture
+def tree_repo(tmp_path):
+    @dataclass
+    class Node:
+        name: str
+        parent: int | None = None
+        pk: int = 0
+
+    repo = SQLiteRepository(str(tmp_path / 'tree.db'), Node)
+    yield repo, Node
+    repo.close()
+
+
+def test_get_all_with_none_condition(tree_repo):
+    repo, node = tree_repo
+    root = node('root')
+    repo.add(root)
+    child = node('child', root.pk)
+    repo.add(child)
+    assert repo.get_all({'parent': None}) == [root]
+    assert repo.get_all({'parent': root.pk}) == [child]
+    assert repo.get_all({'name': 'child', 'parent': root.pk}) == [child]
+    assert repo.get_all({'name': 'child', 'parent': None}) == []
+    assert repo.get_all({'pk': root.pk}) == [root]
+
+
+def test_get_all_with_unknown_field(repo):
+    with pytest.raises(ValueError):
+        repo.get_all({'name; DROP TABLE custom': 1})
+
+
+def test_add_many(repo, custom_class):
+    objects = [custom_class(name=str(i)) for i in range(5)]
+    pks = repo.add_many(objects)
+    assert pks == [o.pk for o in objects]
+    assert pks == list(range(pks[0], pks[0] + 5))
+    assert [repo.get(pk) for pk in pks] == objects
+    repo.delete_many(pks)
+
+
+def test_add_many_empty(repo):
+    assert repo.add_many([]) == []
+
+
+def test_update_many(repo, custom_class):
+    objects = [custom_class() for _ in range(3)]
+    pks = repo.add_many(objects)
+    for o in objects:
+        o.name = 'updated'
+        o.test_float = 0.5
+    repo.update_many(objects)
+    assert [repo.get(pk) for pk in pks] == objects
+    with pytest.raises(ValueError):
+        repo.update_many([custom_class()])
+    repo.delete_many(pks)
+
+
+def test_delete_many_is_atomic(repo, custom_class):
+    objects = [custom_class() for _ in range(3)]
+    pks = repo.add_many(objects)
+    with pytest.raises(KeyError):
+        repo.delete_many(pks + [pks[-1] + 100])
+    assert [repo.get(pk) for pk in pks] == objects
+    repo.delete_many(pks)
+    assert [repo.get(pk) for pk in pks] == [None] * 3
+
+
+def test_update_quotes_and_datetime(repo, custom_class):
+    obj = custom_class()
+    repo.add(obj)
+    obj.name = 'it\'s "quoted"'
+    obj.date = datetime.datetime(2023, 3, 7, 12, 30)
+    repo.update(obj)
+    updated = repo.get(obj.pk)
+    assert updated.name == 'it\'s "quoted"'
+    assert updated.date == '2023-03-07 12:30:00.000000'
+    repo.delete(obj.pk)
+
+
+def test_decode_annotated_types(tmp_path):
+    @dataclass
+    class Typed:
+        moment: datetime.datetime
+        day: datetime.date
+        amount: int
+        parent: int | None = None
+        pk: int = 0
+
+    db_file = str(tmp_path / 'typed.db')
+    with sqlite3.connect(db_file) as con:
+        con.execute('CREATE TABLE typed (moment TEXT, day TEXT, amount TEXT, '
+                    'parent INTEGER, pk INTEGER PRIMARY KEY)')
+        con.execute("INSERT INTO typed VALUES ('2023-03-12 17:06:00', "
+                    "'2023-03-06 00:00:00', '15', NULL, 1)")
+    con.close()
+    repo = SQLiteRepository(db_file, Typed)
+    assert repo.get(1) == Typed(datetime.datetime(2023, 3, 12, 17, 6),
+                                datetime.date(2023, 3, 6), 15, None, 1)
+    obj = Typed(datetime.datetime(2023, 3, 13, 2, 48, 1, 5),
+                datetime.date(2023, 3, 13), 10, 1)
+    repo.add(obj)
+    assert repo.get_all({'parent': 1}) == [obj]
+    repo.close()
+
+
+def test_create_schema(tmp_path):
+    @dataclass
+    class Item:
+        name: str
+        amount: int
+        moment: datetime.datetime
+        parent: int | None = None
+        pk: int = 0
+
+    db_file = str(tmp_path / 'schema.db')
+    repo = SQLiteRepository(db_file, Item, indexes=['name', ('parent', 'moment')])
+    with repo.pool.connection() as con:
+        columns = [(row[1], row[2], row[5])
+                   for row in con.execute('PRAGMA table_info(item)')]
+        indexes = {row[1]: [col[2] for col in con.execute(
+                       f'PRAGMA index_info({row[1]})')]
+                   for row in con.execute('PRAGMA index_list(item)')}
+    assert columns == [('name', 'TEXT', 0), ('amount', 'INTEGER', 0),
+                       ('moment', 'TIMESTAMP', 0), ('parent', 'INTEGER', 0),
+                       ('pk', 'INTEGER', 1)]
+    assert indexes == {'item_name_idx': ['name'],
+                       'item_parent_moment_idx': ['parent', 'moment']}
+    obj = Item('x', 1, datetime.datetime(2023, 3, 6))
+    repo.add(obj)
+    repo.close()
+    repo = SQLiteRepository(db_file, Item, indexes=['name'])
+    assert repo.get_all() == [obj]
+    repo.close()
+
+
+def test_unknown_index_field(repo, custom_class):
+    with pytest.raises(ValueError):
+        SQLiteRepository('tests/test_repository/new_db.db', custom_class,
+                         indexes=['missing'])
+
+
+def test_iter_all(tree_repo):
+    repo, node = tree_repo
+    objects = [node(name) for name in ['b', 'a', 'c', 'a']]
+    repo.add_many(objects)
+    gen = repo.iter_all(chunk_size=2)
+    assert isgenerator(gen)
+    assert list(gen) == objects
+    assert list(repo.iter_all(descending=True)) == objects[::-1]
+    assert list(repo.iter_all({'name': 'a'}, chunk_size=1)) == [objects[1], objects[3]]
+    assert list(repo.iter_all(order_by='name')) == [objects[i] for i in [1, 3, 0, 2]]
+    assert list(repo.iter_all(order_by='name', descending=True)) == \
+        [objects[i] for i in [2, 0, 3, 1]]
+    with pytest.raises(ValueError):
+        next(repo.iter_all(order_by='missing'))
+
+
+def test_iter_all_releases_connection(tree_repo):
+    repo, node = tree_repo
+    repo.add_many([node('a'), node('b')])
+    gen = repo.iter_all(chunk_size=1)
+    next(gen)
+    gen.close()
+    for _ in range(repo.pool.size + 1):
+        assert next(repo.iter_all()) == node('a', pk=1)
+
+
+def test_get_page(tmp_path):
+    @dataclass
+    class Item:
+        moment: datetime.datetime
+        kind: str = 'a'
+        pk: int = 0
+
+    repo = SQLiteRepository(str(tmp_path / 'page.db'), Item, indexes=['moment'])
+    days = [3, 1, 2, 1, 3]
+    objects = [Item(datetime.datetime(2023, 3, day)) for day in days]
+    objects[0].kind = 'b'
+    repo.add_many(objects)
+    pages = []
+    key = None
+    while page := repo.get_page('moment', key, limit=2, descending=True):
+        pages.append(page)
+        key = (page[-1].moment, page[-1].pk)
+    assert pages == [[objects[4], objects[0]], [objects[2], objects[3]], [objects[1]]]
+    assert repo.get_page('moment', (objects[3].moment, objects[3].pk)) == \
+        [objects[2], objects[0], objects[4]]
+    assert repo.get_page(after_key=(2, 2), limit=2) == objects[2:4]
+    assert repo.get_page('moment', (objects[1].moment, objects[1].pk),
+                         where={'kind': 'b'}) == [objects[0]]
+    repo.close()
+
+
+def test_get_page_with_null_keys(tree_repo):
+    repo, node = tree_repo
+    objects = [node('a', 2), node('b'), node('c', 1), node('d')]
+    repo.add_many(objects)
+    # NULL идет первым, как в MemoryRepository
+    assert list(repo.iter_all(order_by='parent')) == [objects[i] for i in [1, 3, 2, 0]]
+    for descending in (False, True):
+        pages = []
+        key = None
+        while page := repo.get_page('parent', key, limit=1, descending=descending):
+            pages.extend(page)
+            key = (page[-1].parent, page[-1].pk)
+        assert pages == list(repo.iter_all(order_by='parent', descending=descending))
+
+
+def test_get_between(tmp_path):
+    @dataclass
+    class Item:
+        moment: datetime.datetime | None
+        kind: str = 'a'
+        pk: int = 0
+
+    repo = SQLiteRepository(str(tmp_path / 'range.db'), Item, indexes=['moment'])
+    objects = [Item(datetime.datetime(2023, 3, day) if day else None)
+               for day in [5, 1, 3, None, 3, 7]]
+    objects[4].kind = 'b'
+    repo.add_many(objects)
+    assert repo.get_between('moment', datetime.datetime(2023, 3, 2),
+                            datetime.datetime(2023, 3, 5)) == \
+        [objects[2], objects[4], objects[0]]
+    assert repo.get_between('moment', datetime.datetime(2023, 3, 2),
+                            datetime.datetime.max, {'kind': 'b'}) == [objects[4]]
+    with repo.pool.connection() as con:
+        plan = con.execute('EXPLAIN QUERY PLAN SELECT * FROM item '
+                           'WHERE moment BETWEEN ? AND ?', (1, 2)).fetchall()
+    assert 'item_moment_idx' in plan[0][-1]
+    repo.close()
+
+
+def test_aggregate(tmp_path):
+    from bookkeeper.models.expense import Expense
+    repo = SQLiteRepository(str(tmp_path / 'agg.db'), Expense)
+    dt = datetime.datetime
+    repo.add_many([Expense(10, 1, dt(2023, 3, 6, 10)),
+                   Expense(20, 2, dt(2023, 3, 6, 18)),
+                   Expense(30, 1, dt(2023, 3, 12, 23, 59, 59, 10)),
+                   Expense(40, 1, dt(2023, 4, 1))])
+    assert repo.aggregate('sum', 'amount') == {(): 100}
+    assert repo.aggregate('count', 'pk', ['category']) == {(1,): 3, (2,): 1}
+    assert repo.aggregate('sum', 'amount', period='day',
+                          date_field='expense_date') == \
+        {(datetime.date(2023, 3, 6),): 30, (datetime.date(2023, 3, 12),): 30,
+         (datetime.date(2023, 4, 1),): 40}
+    assert repo.aggregate('sum', 'amount', period='week',
+                          date_field='expense_date') == \
+        {(datetime.date(2023, 3, 6),): 60, (datetime.date(2023, 3, 27),): 40}
+    assert repo.aggregate('sum', 'amount', ['category'], period='month',
+                          date_field='expense_date',
+                          date_range=(dt(2023, 3, 6, 12), dt.max)) == \
+        {(datetime.date(2023, 3, 1), 2): 20, (datetime.date(2023, 3, 1), 1): 30,
+         (datetime.date(2023, 4, 1), 1): 40}
+    assert repo.aggregate('sum', 'amount', where={'category': 3}) == {(): 0}
+    with pytest.raises(ValueError):
+        repo.aggregate('sum', 'amount', period='year', date_field='expense_date')
+    repo.close()
+
+
+def test_subscribe(tree_repo):
+    repo, node = tree_repo
+    events = []
+    repo.subscribe(lambda event, pks: events.append((event, pks)))
+    obj = node('a')
+    repo.add(obj)
+    repo.update(obj)
+    pks = repo.add_many([node('b'), node('c')])
+    repo.update_many([obj])
+    repo.delete(obj.pk)
+    repo.delete_many(pks)
+    assert events == [('add', [obj.pk]), ('update', [obj.pk]), ('add', pks),
+                      ('update', [obj.pk]), ('delete', [obj.pk]), ('delete', pks)]
+    with pytest.raises(KeyError):
+        repo.delete(obj.pk)
+    assert len(events) == 6
+
+
+def test_data_version_sees_other_connections(tree_repo):
+    repo, node = tree_repo
+    version = repo.data_version()
+    assert repo.data_version() == version
+    repo.add(node('a'))
+    assert repo.data_version() > version
+    version = repo.data_version()
+    with sqlite3.connect(repo.db_file) as con:
+        con.execute("INSERT INTO node (name) VALUES ('external')")
+    con.close()
+    assert repo.data_version() > version
+
+
+def test_transaction_spans_repositories(tree_repo):
+    repo, node = tree_repo
+    other = SQLiteRepository(repo.db_file, node, repo.pool)
+    events = []
+    repo.subscribe(lambda event, pks: events.append((event, pks)))
+    other.subscribe(lambda event, pks: events.append((event, pks)))
+    obj = node('a')
+    repo.add(obj)
+    with repo.transaction():
+        other.update(node('b', pk=obj.pk))
+        repo.add(node('c'))
+        assert repo.get(obj.pk).name == 'b'
+        assert len(events) == 1
+    assert [event for event, _ in events] == ['add', 'update', 'add']
+    with pytest.raises(RuntimeError):
+        with other.transaction():
+            repo.delete(obj.pk)
+            other.add(node('d'))
+            raise RuntimeError
+    assert [event for event, _ in events[3:]] == ['rollback', 'rollback']
+    assert [n.name for n in repo.get_all()] == ['b', 'c']
+
+
+def test_failed_write_in_transaction(tree_repo):
+    repo, node = tree_repo
+    pks = repo.add_many([node('a'), node('b')])
+    with repo.transaction():
+        with pytest.raises(KeyError):
+            repo.delete_many([pks[0], pks[1] + 1])
+        repo.delete(pks[1])
+    assert repo.get_all() == [node('a', pk=pks[0])]
+
+
+def count_rows(db_file, table):
+    with sqlite3.connect(db_file) as con:
+        result = con.execute(f'SELECT count(*) FROM {table}').fetchone()[0]
+    con.close()
+    return result
+
+
+@pytest.fixture
+def write_behind_repo(tmp_path):
+    @dataclass
+    class Node:
+        name: str
+        parent: int | None = None
+        pk: int = 0
+
+    repo = SQLiteRepository(str(tmp_path / 'wb.db'), Node,
+                            write_behind=WriteBehind(batch_size=1000,
+                                                     flush_interval=60,
+                                                     reserve_size=10))
+    yield repo, Node
+    repo.close()
+
+
+def test_write_behind_queues_writes(write_behind_repo):
+    repo, node = write_behind_repo
+    obj = node('a')
+    pk = repo.add(obj)
+    assert obj.pk == pk == 1
+    repo.update(node('b', pk=pk))
+    pks = repo.add_many([node('c'), node('d')])
+    repo.update_many([node('e', pk=pks[0])])
+    assert count_rows(repo.db_file, 'node') == 0
+    repo.flush()
+    assert count_rows(repo.db_file, 'node') == 3
+    repo.update(node('f', pk=pk))
+    assert [n.name for n in repo.get_all()] == ['f', 'e', 'd']
+
+
+def test_write_behind_reserves_pks(write_behind_repo):
+    repo, node = write_behind_repo
+    pks = repo.add_many([node(str(i)) for i in range(12)])
+    assert pks == list(range(1, 13))
+    with sqlite3.connect(repo.db_file) as con:
+        con.execute("INSERT INTO node (name) VALUES ('external')")
+    con.close()
+    repo.flush()
+    assert repo.get_all({'name': 'external'})[0].pk == 21
+    repo.delete(pks[0])
+    assert repo.get(pks[0]) is None
+
+
+def test_write_behind_close_flushes(write_behind_repo):
+    repo, node = write_behind_repo
+    repo.add_many([node('a'), node('b')])
+    repo.close()
+    assert count_rows(repo.db_file, 'node') == 2
+    with sqlite3.connect(repo.db_file) as con:
+        assert con.execute('SELECT seq FROM sqlite_sequence').fetchone() == (2,)
+    con.close()
+
+
+def test_write_behind_background_flush(tmp_path):
+    @dataclass
+    class Node:
+        name: str
+        pk: int = 0
+
+    repo = SQLiteRepository(str(tmp_path / 'wb.db'), Node,
+                            write_behind=WriteBehind(batch_size=2, flush_interval=60))
+    repo.add(Node('a'))
+    repo.add(Node('b'))
+    for _ in range(100):
+        if count_rows(repo.db_file, 'node') == 2:
+            break
+        time.sleep(0.01)
+    assert count_rows(repo.db_file, 'node') == 2
+    repo.close()
+
+
+def test_write_behind_in_transaction(write_behind_repo):
+    repo, node = write_behind_repo
+    repo.add(node('a'))
+    with repo.transaction():
+        repo.add(node('b'))
+        assert count_rows(repo.db_file, 'node') == 0
+    assert count_rows(repo.db_file, 'node') == 2
+
+
+def test_write_behind_requires_autoincrement(tmp_path):
+    @dataclass
+    class Plain:
+        name: str = ''
+        pk: int = 0
+
+    db_file = str(tmp_path / 'plain.db')
+    with sqlite3.connect(db_file) as con:
+        con.execute('CREATE TABLE plain (name TEXT, pk INTEGER PRIMARY KEY)')
+    con.close()
+    with pytest.raises(ValueError):
+        SQLiteRepository(db_file, Plain, write_behind=WriteBehind())
+    with pytest.raises(ValueError):
+        WriteBehind(batch_size=0)
+
+
+def test_datetimes_stored_canonically(tmp_path):
+    @dataclass
+    class Event:
+        moment: datetime.datetime
+        day: datetime.date
+        pk: int = 0
+
+    repo = SQLiteRepository(str(tmp_path / 'events.db'), Event, indexes=['moment'])
+    first = Event(datetime.datetime(2023, 3, 12, 17, 6), datetime.datetime(2023, 3, 12))
+    second = Event(datetime.datetime(2023, 3, 12, 17, 6, 0, 1),
+                   datetime.date(2023, 3, 12))
+    repo.add_many([second, first])
+    assert repo.get(first.pk).day == datetime.date(2023, 3, 12)
+    assert repo.get_all({'day': datetime.date(2023, 3, 12)}) \
+        == [second, repo.get(first.pk)]
+    assert [e.pk for e in repo.iter_all(order_by='moment')] == [first.pk, second.pk]
+    assert [e.pk for e in repo.get_between('moment', first.moment, first.moment)] \
+        == [first.pk]
+    with repo.pool.connection() as con:
+        assert con.execute('SELECT moment, day FROM event WHERE pk = ?',
+                           (first.pk,)).fetchone() == (first.moment,
+                                                       datetime.date(2023, 3, 12))
+        assert con.execute('SELECT CAST(moment AS TEXT) FROM event WHERE pk = ?',
+                           (first.pk,)).fetchone() == ('2023-03-12 17:06:00.000000',)
+    repo.close()
+
+
+def test_statements_prepared_once(tree_repo):
+    repo, node = tree_repo
+    pks = repo.add_many([node(str(i), parent=i % 2) for i in range(10)])
+    repo.get(pks[0])
+    repo.get_all({'parent': 1})
+    repo.get_page('name', ('0', pks[0]), limit=3)
+    repo.aggregate('count', 'pk', group_by=['parent'])
+    misses = repo.pool.statement_cache_misses
+    hits = repo.pool.statement_cache_hits
+    for pk in pks[1:]:
+        repo.get(pk)
+    repo.get_all({'parent': 0})
+    repo.get_page('name', ('5', pks[5]), limit=3)
+    repo.aggregate('count', 'pk', group_by=['parent'])
+    assert repo.pool.statement_cache_misses == misses
+    assert repo.pool.statement_cache_hits == hits + 12
+    for pk in pks:
+        repo.delete(pk)
+    with pytest.raises(KeyError):
+        repo.delete(pks[0])
+    assert repo.pool.statement_cache_misses == misses + 1
+
+
+def test_reader_pool(tmp_path, custom_class):
+    db_file = str(tmp_path / 'reader.db')
+    with ConnectionPool(db_file, profile=DESKTOP_PROFILE) as writer, \
+            ConnectionPool(db_file, profile=DESKTOP_PROFILE, read_only=True) as reader:
+        repo = SQLiteRepository(db_file, custom_class, writer, reader=reader)
+        obj = custom_class(name='a')
+        repo.add(obj)
+        with repo.transaction():
+            repo.delete(obj.pk)
+            # транзакция видит собственные изменения
+            assert repo.get(obj.pk) is None
+            with reader.connection() as con:
+                assert con.execute('SELECT count(*) FROM custom').fetchone() == (1,)
+        with repo.snapshot():
+            repo.add(custom_class(name='b'))
+            assert repo.get_all() == []
+        assert [o.name for o in repo.get_all()] == ['b']
+
+
+def test_snapshot_single_pool(tmp_path, custom_class):
+    db_file = str(tmp_path / 'single.db')
+    with ConnectionPool(db_file, profile=DESKTOP_PROFILE) as pool:
+        repo = SQLiteRepository(db_file, custom_class, pool)
+        repo.add(custom_class(name='a'))
+        with repo.snapshot():
+            repo.add(custom_class(name='b'))
+            assert [o.name for o in repo.get_all()] == ['a']
+        assert [o.name for o in repo.get_all()] == ['a', 'b']
+
+
+def test_write_behind_flusher_does_not_block_transaction(write_behind_repo):
+    repo, node = write_behind_repo
+    repo.add(node('a'))
+    start = time.monotonic()
+    with repo.transaction():
+        # фоновый поток ждет блокировку БД, не мешая транзакции записать очередь
+        repo._wake.set()
+        time.sleep(0.1)
+        repo.add(node('b'))
+        assert [n.name for n in repo.get_all()] == ['a', 'b']
+    assert time.monotonic() - start < 2
+    repo.flush()
+    assert count_rows(repo.db_file, 'node') == 2
+
+
+def test_snapshot_default_profile(tmp_path, custom_class):
+    repo = SQLiteRepository(str(tmp_path / 'journal.db'), custom_class)
+    repo.add(custom_class(name='a'))
+    start = time.monotonic()
+    with repo.snapshot():
+        repo.add(custom_class(name='b'))
+        assert [o.name for o in repo.get_all()] == ['a', 'b']
+    assert time.monotonic() - start < 1
+    repo.close()